@@ -0,0 +1,114 @@
+"""
+bands.py - Per-band energy and speed for MX11 print jobs
+
+A job normally prints every row at one energy and speed. Here the packed bitmap
+is cut into bands of BAND_ROWS rows, each band's black-dot density picks a level
+from BAND_LEVELS, and energy/speed commands are slipped into the command stream
+where the level changes. Sparse bands (text, line art) print faster and with
+less energy; dense bands keep full energy and a slightly slower speed so they
+stay dark.
+
+Switching to a denser level happens at once. Switching to a lighter one waits
+until the last MIN_BAND_HOLD bands have all been lighter, which also caps how
+often the (2-3 frame) switch commands are sent.
+"""
+
+from dataclasses import dataclass
+
+from mx11 import JOB_SPEED
+from protocol import apply_energy_frame, energy_frame, speed_command
+
+BAND_ROWS = 16
+MIN_BAND_HOLD = 4
+
+# (highest black-dot fraction, energy as a fraction of the job's, speed; lower = faster)
+BAND_LEVELS = (
+    (0.04, 0.70, 6),
+    (0.20, 0.85, JOB_SPEED),
+    (1.00, 1.00, 10),
+)
+
+
+@dataclass
+class BandSetting:
+    """
+    Energy and speed from row `start` on; `density` is the band's black-dot
+    fraction and `scale` its energy as a fraction of the job's.
+    """
+    start: int
+    energy: int
+    speed: int
+    density: float
+    scale: float = 1.0
+
+
+def band_densities(rows, band_rows=BAND_ROWS):
+    """Black-dot fraction of each band of packed rows."""
+    densities = []
+    for start in range(0, len(rows), band_rows):
+        band = b''.join(rows[start:start + band_rows])
+        densities.append(int.from_bytes(band, 'little').bit_count() / (len(band) * 8))
+    return densities
+
+
+def plan_bands(rows, energy, band_rows=BAND_ROWS, hold=MIN_BAND_HOLD, levels=BAND_LEVELS):
+    """
+    Returns the BandSettings for a job printed at `energy`, one per level change;
+    the first applies from row 0.
+    """
+    densities = band_densities(rows, band_rows)
+    raw = [next(i for i, level in enumerate(levels) if d <= level[0] or i == len(levels) - 1)
+           for d in densities]
+    plan = []
+    current = None
+    for b in range(len(raw)):
+        level = max(raw[max(0, b - hold + 1):b + 1])
+        if level != current:
+            _, scale, speed = levels[level]
+            plan.append(BandSetting(b * band_rows, max(1, int(energy * scale)), speed, densities[b], scale))
+            current = level
+    return plan
+
+
+def apply_bands(commands, plan, energy, speed=JOB_SPEED, restore=False, thermal=None):
+    """
+    Inserts the plan's energy/speed commands into a stream of (rows_done, command)
+    pairs, such as RowEncoder.encode_rows() yields. `energy` and `speed` are what
+    the job preamble already set; unchanged values are not resent. With `restore`,
+    they are set back after the last row, for content that follows in the same job.
+    With `thermal` (a ThermalScheduler), energies come from its band_energy() as
+    each switch is reached, and it decides what needs resending.
+    """
+    job_energy, job_speed = energy, speed
+    settings = iter(plan)
+    upcoming = next(settings, None)
+    rows_before = 0
+    for rows_done, command in commands:
+        setting = None
+        # The command covers rows rows_before..rows_done - 1
+        while upcoming is not None and upcoming.start < rows_done:
+            setting, upcoming = upcoming, next(settings, None)
+        if setting is not None:
+            if thermal:
+                target = thermal.band_energy(setting.scale)
+            else:
+                target = setting.energy if setting.energy != energy else None
+            if target is not None:
+                energy = target
+                yield rows_before, energy_frame(energy)
+                yield rows_before, apply_energy_frame()
+            if setting.speed != speed:
+                speed = setting.speed
+                yield rows_before, speed_command(speed)
+        yield rows_done, command
+        rows_before = rows_done
+    if restore:
+        if thermal:
+            target = thermal.band_energy(1.0)
+        else:
+            target = job_energy if energy != job_energy else None
+        if target is not None:
+            yield rows_before, energy_frame(target)
+            yield rows_before, apply_energy_frame()
+        if speed != job_speed:
+            yield rows_before, speed_command(job_speed)
@@ -0,0 +1,493 @@
+"""
+barcodes.py - Code128 and QR codes rendered straight to printer rows
+
+Codes are built as module grids and drawn at the printer's own resolution: every
+module is a whole number of dots, so edges stay sharp with no resampling or
+dithering, and the result is packed rows ready for RowEncoder. Identical rows
+(a barcode is one row repeated) are the same bytes object, which the encoder
+reuses outright.
+
+Code128 uses code set B, switching to code set C for runs of digits. QR codes
+are byte mode (UTF-8), versions 1-40, error correction L/M/Q/H, with the mask
+picked by the standard penalty rules. Only the standard library is used.
+
+Printer.print_many takes Barcode and QRCode items; label templates can place
+either in a field (see labels.Field).
+"""
+
+from dataclasses import dataclass
+
+from encoder import BLANK_ROW, ROW_BYTES
+from mx11 import PRINT_WIDTH
+
+# --- Code128 ---
+
+# Bar/space widths of symbol values 0-106 (103-105: start A/B/C, 106: stop)
+CODE128_PATTERNS = (
+    '212222', '222122', '222221', '121223', '121322', '131222', '122213', '122312', '132212', '221213',
+    '221312', '231212', '112232', '122132', '122231', '113222', '123122', '123221', '223211', '221132',
+    '221231', '213212', '223112', '312131', '311222', '321122', '321221', '312212', '322112', '322211',
+    '212123', '212321', '232121', '111323', '131123', '131321', '112313', '132113', '132311', '211313',
+    '231113', '231311', '112133', '112331', '132131', '113123', '113321', '133121', '313121', '211331',
+    '231131', '213113', '213311', '213131', '311123', '311321', '331121', '312113', '312311', '332111',
+    '314111', '221411', '431111', '111224', '111422', '121124', '121421', '141122', '141221', '112214',
+    '112412', '122114', '122411', '142112', '142211', '241211', '221114', '413111', '241112', '134111',
+    '111242', '121142', '121241', '114212', '124112', '124211', '411212', '421112', '421211', '212141',
+    '214121', '412121', '111143', '111341', '131141', '114113', '114311', '411113', '411311', '113141',
+    '114131', '311141', '411131', '211412', '211214', '211232', '2331112',
+)
+CODE128_START_B = 104
+CODE128_START_C = 105
+CODE128_TO_B = 100
+CODE128_TO_C = 99
+CODE128_STOP = 106
+# Light modules required on each side of a Code128 symbol
+CODE128_QUIET = 10
+
+
+def _digit_run(data, i):
+    n = i
+    while n < len(data) and data[n].isdigit() and data[n].isascii():
+        n += 1
+    return n - i
+
+
+def code128_values(data):
+    """Symbol values for `data` (printable ASCII), start code and check symbol included."""
+    for ch in data:
+        if not ' ' <= ch <= '~':
+            raise ValueError(f"Code128 here encodes printable ASCII only, got {ch!r}.")
+    if not data:
+        raise ValueError("Nothing to encode.")
+    values = []
+    i = 0
+    # Code set C packs two digits per symbol; worth it from 4 digits at the ends, 6 inside
+    run = _digit_run(data, 0)
+    code_c = run >= 4 or (run == len(data) and run % 2 == 0)
+    values.append(CODE128_START_C if code_c else CODE128_START_B)
+    while i < len(data):
+        run = _digit_run(data, i)
+        if code_c:
+            if run >= 2:
+                values.append(int(data[i:i + 2]))
+                i += 2
+                continue
+            values.append(CODE128_TO_B)
+            code_c = False
+        if run >= 6 or (run >= 4 and i + run == len(data)):
+            if run % 2:
+                # The odd digit goes out in code set B first
+                values.append(ord(data[i]) - 32)
+                i += 1
+            values.append(CODE128_TO_C)
+            code_c = True
+            continue
+        values.append(ord(data[i]) - 32)
+        i += 1
+    check = (values[0] + sum(pos * value for pos, value in enumerate(values[1:], 1))) % 103
+    return values + [check, CODE128_STOP]
+
+
+def code128_modules(data):
+    """The symbol as a list of modules, True for a bar; quiet zones not included."""
+    modules = []
+    for value in code128_values(data):
+        bar = True
+        for width in CODE128_PATTERNS[value]:
+            modules.extend([bar] * int(width))
+            bar = not bar
+    return modules
+
+
+# --- QR codes ---
+
+QR_LEVELS = ('L', 'M', 'Q', 'H')
+_QR_FORMAT_BITS = {'L': 1, 'M': 0, 'Q': 3, 'H': 2}
+# Per level, indexed by version (index 0 unused)
+_QR_ECC_PER_BLOCK = {
+    'L': (-1, 7, 10, 15, 20, 26, 18, 20, 24, 30, 18, 20, 24, 26, 30, 22, 24, 28, 30, 28, 28, 28, 28, 30, 30, 26, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    'M': (-1, 10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28, 26, 26, 26, 26, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28),
+    'Q': (-1, 13, 22, 18, 26, 18, 24, 18, 22, 20, 24, 28, 26, 24, 20, 30, 24, 28, 28, 26, 30, 28, 30, 30, 30, 30, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    'H': (-1, 17, 28, 22, 16, 22, 28, 26, 26, 24, 28, 24, 28, 22, 24, 24, 30, 28, 28, 26, 28, 30, 24, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+}
+_QR_BLOCKS = {
+    'L': (-1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 4, 4, 4, 4, 4, 6, 6, 6, 6, 7, 8, 8, 9, 9, 10, 12, 12, 12, 13, 14, 15, 16, 17, 18, 19, 19, 20, 21, 22, 24, 25),
+    'M': (-1, 1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16, 17, 17, 18, 20, 21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49),
+    'Q': (-1, 1, 1, 2, 2, 4, 4, 6, 6, 8, 8, 8, 10, 12, 16, 12, 17, 16, 18, 21, 20, 23, 23, 25, 27, 29, 34, 34, 35, 38, 40, 43, 45, 48, 51, 53, 56, 59, 62, 65, 68),
+    'H': (-1, 1, 1, 2, 4, 4, 4, 5, 6, 8, 8, 11, 11, 16, 16, 18, 16, 19, 21, 25, 25, 25, 34, 30, 32, 35, 37, 40, 42, 45, 48, 51, 54, 57, 60, 63, 66, 70, 74, 77, 81),
+}
+# Light modules required around a QR code
+QR_QUIET = 4
+
+_QR_MASKS = (
+    lambda x, y: (x + y) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (x + y) % 3 == 0,
+    lambda x, y: (x // 3 + y // 2) % 2 == 0,
+    lambda x, y: x * y % 2 + x * y % 3 == 0,
+    lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+    lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0,
+)
+
+# GF(256) with the QR polynomial 0x11D, as exp/log tables
+_GF_EXP = [0] * 512
+_GF_LOG = [0] * 256
+_value = 1
+for _i in range(255):
+    _GF_EXP[_i] = _value
+    _GF_LOG[_value] = _i
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11D
+for _i in range(255, 512):
+    _GF_EXP[_i] = _GF_EXP[_i - 255]
+del _value, _i
+
+
+def _gf_mul(a, b):
+    if not a or not b:
+        return 0
+    return _GF_EXP[_GF_LOG[a] + _GF_LOG[b]]
+
+
+def _rs_divisor(degree):
+    result = [0] * (degree - 1) + [1]
+    root = 1
+    for _ in range(degree):
+        for j in range(degree):
+            result[j] = _gf_mul(result[j], root)
+            if j + 1 < degree:
+                result[j] ^= result[j + 1]
+        root = _gf_mul(root, 2)
+    return result
+
+
+def _rs_remainder(data, divisor):
+    result = [0] * len(divisor)
+    for byte in data:
+        factor = byte ^ result.pop(0)
+        result.append(0)
+        if factor:
+            for i, coef in enumerate(divisor):
+                result[i] ^= _gf_mul(coef, factor)
+    return result
+
+
+def _raw_modules(version):
+    """Modules left for data and error correction once the function patterns are drawn."""
+    result = (16 * version + 128) * version + 64
+    if version >= 2:
+        align = version // 7 + 2
+        result -= (25 * align - 10) * align - 55
+        if version >= 7:
+            result -= 36
+    return result
+
+
+def _data_capacity(version, level):
+    return _raw_modules(version) // 8 - _QR_ECC_PER_BLOCK[level][version] * _QR_BLOCKS[level][version]
+
+
+def _alignment_positions(version):
+    if version == 1:
+        return []
+    count = version // 7 + 2
+    step = (version * 8 + count * 3 + 5) // (count * 4 - 4) * 2
+    size = version * 4 + 17
+    return [6] + [size - 7 - step * i for i in range(count - 2, -1, -1)]
+
+
+class _QRGrid:
+    def __init__(self, version):
+        self.version = version
+        self.size = version * 4 + 17
+        self.modules = [[False] * self.size for _ in range(self.size)]
+        self.function = [[False] * self.size for _ in range(self.size)]
+
+    def set_function(self, x, y, dark):
+        self.modules[y][x] = dark
+        self.function[y][x] = True
+
+    def draw_function_patterns(self):
+        size = self.size
+        for i in range(size):
+            self.set_function(6, i, i % 2 == 0)
+            self.set_function(i, 6, i % 2 == 0)
+        for cx, cy in ((3, 3), (size - 4, 3), (3, size - 4)):
+            # Finder with its light separator
+            for dy in range(-4, 5):
+                for dx in range(-4, 5):
+                    x, y = cx + dx, cy + dy
+                    if 0 <= x < size and 0 <= y < size:
+                        dist = max(abs(dx), abs(dy))
+                        self.set_function(x, y, dist not in (2, 4))
+        positions = _alignment_positions(self.version)
+        last = len(positions) - 1
+        for i, cx in enumerate(positions):
+            for j, cy in enumerate(positions):
+                # Not over the finders
+                if (i, j) in ((0, 0), (0, last), (last, 0)):
+                    continue
+                for dy in range(-2, 3):
+                    for dx in range(-2, 3):
+                        self.set_function(cx + dx, cy + dy, max(abs(dx), abs(dy)) != 1)
+        self.draw_format_bits('M', 0)  # Reserves the area; redrawn once the mask is known
+        if self.version >= 7:
+            rem = self.version
+            for _ in range(12):
+                rem = (rem << 1) ^ ((rem >> 11) * 0x1F25)
+            bits = self.version << 12 | rem
+            for i in range(18):
+                dark = bool(bits >> i & 1)
+                a, b = size - 11 + i % 3, i // 3
+                self.set_function(a, b, dark)
+                self.set_function(b, a, dark)
+
+    def draw_format_bits(self, level, mask):
+        data = _QR_FORMAT_BITS[level] << 3 | mask
+        rem = data
+        for _ in range(10):
+            rem = (rem << 1) ^ ((rem >> 9) * 0x537)
+        bits = (data << 10 | rem) ^ 0x5412
+        size = self.size
+
+        def bit(i):
+            return bool(bits >> i & 1)
+
+        for i in range(6):
+            self.set_function(8, i, bit(i))
+        self.set_function(8, 7, bit(6))
+        self.set_function(8, 8, bit(7))
+        self.set_function(7, 8, bit(8))
+        for i in range(9, 15):
+            self.set_function(14 - i, 8, bit(i))
+        for i in range(8):
+            self.set_function(size - 1 - i, 8, bit(i))
+        for i in range(8, 15):
+            self.set_function(8, size - 15 + i, bit(i))
+        self.set_function(8, size - 8, True)
+
+    def draw_codewords(self, codewords):
+        size = self.size
+        i = 0
+        total = len(codewords) * 8
+        right = size - 1
+        while right >= 1:
+            if right == 6:
+                right = 5
+            upward = (right + 1) & 2 == 0
+            for vert in range(size):
+                y = size - 1 - vert if upward else vert
+                for x in (right, right - 1):
+                    if not self.function[y][x] and i < total:
+                        self.modules[y][x] = bool(codewords[i >> 3] >> (7 - (i & 7)) & 1)
+                        i += 1
+            right -= 2
+
+    def apply_mask(self, mask):
+        test = _QR_MASKS[mask]
+        for y in range(self.size):
+            row, function = self.modules[y], self.function[y]
+            for x in range(self.size):
+                if not function[x] and test(x, y):
+                    row[x] = not row[x]
+
+
+def _qr_codewords(data, version, level):
+    """Data codewords with padding, split into blocks, error-corrected and interleaved."""
+    bits = []
+
+    def append(value, length):
+        bits.extend((value >> i) & 1 for i in range(length - 1, -1, -1))
+
+    append(0b0100, 4)
+    append(len(data), 8 if version < 10 else 16)
+    for byte in data:
+        append(byte, 8)
+    capacity = _data_capacity(version, level) * 8
+    append(0, min(4, capacity - len(bits)))
+    append(0, -len(bits) % 8)
+    codewords = [int(''.join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8)]
+    pad = 0xEC
+    while len(codewords) < capacity // 8:
+        codewords.append(pad)
+        pad ^= 0xEC ^ 0x11
+
+    blocks_count = _QR_BLOCKS[level][version]
+    ecc_len = _QR_ECC_PER_BLOCK[level][version]
+    raw = _raw_modules(version) // 8
+    short_blocks = blocks_count - raw % blocks_count
+    short_len = raw // blocks_count
+    divisor = _rs_divisor(ecc_len)
+    blocks = []
+    k = 0
+    for i in range(blocks_count):
+        length = short_len - ecc_len + (0 if i < short_blocks else 1)
+        block = codewords[k:k + length]
+        k += length
+        ecc = _rs_remainder(block, divisor)
+        if i < short_blocks:
+            block = block + [0]
+        blocks.append(block + ecc)
+    result = []
+    for i in range(len(blocks[0])):
+        for j, block in enumerate(blocks):
+            # Skip the placeholder that lines short blocks up with long ones
+            if i != short_len - ecc_len or j >= short_blocks:
+                result.append(block[i])
+    return result
+
+
+def _penalty(modules):
+    size = len(modules)
+    score = 0
+    columns = [list(col) for col in zip(*modules)]
+    for line in modules + columns:
+        # Runs of five or more, and 1:1:3:1:1 finder look-alikes with four light modules beside
+        run, color = 0, None
+        for value in line:
+            if value == color:
+                run += 1
+            else:
+                if run >= 5:
+                    score += run - 2
+                color, run = value, 1
+        if run >= 5:
+            score += run - 2
+        text = ''.join('1' if value else '0' for value in line)
+        score += 40 * (text.count('00001011101') + text.count('10111010000'))
+    for y in range(size - 1):
+        row, below = modules[y], modules[y + 1]
+        for x in range(size - 1):
+            if row[x] == row[x + 1] == below[x] == below[x + 1]:
+                score += 3
+    dark = sum(map(sum, modules))
+    total = size * size
+    score += ((abs(dark * 20 - total * 10) + total - 1) // total - 1) * 10
+    return score
+
+
+def qr_matrix(data, level='M', version=None, mask=None):
+    """
+    QR code modules for `data` (str, UTF-8 encoded, or bytes) as rows of booleans,
+    True for dark, without the quiet zone. The smallest version that fits is used
+    unless `version` is given; `mask` 0-7 overrides the penalty-based choice.
+    """
+    if level not in QR_LEVELS:
+        raise ValueError(f"Unknown QR error correction level '{level}', expected one of {QR_LEVELS}.")
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    versions = [version] if version else range(1, 41)
+    for version in versions:
+        header_bits = 4 + (8 if version < 10 else 16)
+        if header_bits + len(data) * 8 <= _data_capacity(version, level) * 8:
+            break
+    else:
+        raise ValueError(f"{len(data)} bytes do not fit a QR code at level {level}"
+                         f"{f' version {versions[0]}' if len(versions) == 1 else ''}.")
+
+    grid = _QRGrid(version)
+    grid.draw_function_patterns()
+    grid.draw_codewords(_qr_codewords(data, version, level))
+    if mask is None:
+        best = None
+        for candidate in range(8):
+            grid.apply_mask(candidate)
+            grid.draw_format_bits(level, candidate)
+            score = _penalty(grid.modules)
+            if best is None or score < best[0]:
+                best = (score, candidate)
+            grid.apply_mask(candidate)  # Masks are XOR: applying again undoes it
+        mask = best[1]
+    grid.apply_mask(mask)
+    grid.draw_format_bits(level, mask)
+    return grid.modules
+
+
+# --- Rendering ---
+
+def module_rows(matrix, scale, width=PRINT_WIDTH, x=0, quiet=0):
+    """
+    Draws a module grid at `scale` dots per module, centred in the `width` dots from
+    dot `x`, with `quiet` light modules above and below. Returns one int of row bits
+    (LSB = dot 0, 1 = black) per dot row.
+    """
+    cols = len(matrix[0])
+    offset = x + (width - cols * scale) // 2
+    block = (1 << scale) - 1
+    blank = [0] * (quiet * scale)
+    rows = list(blank)
+    for line in matrix:
+        bits = 0
+        for i, dark in enumerate(line):
+            if dark:
+                bits |= block << (offset + i * scale)
+        rows.extend([bits] * scale)
+    rows.extend(blank)
+    return rows
+
+
+def fit_scale(modules, width, requested=None):
+    """Largest whole dots per module (at most `requested`) fitting `modules` in `width` dots."""
+    scale = width // modules
+    if requested:
+        scale = min(scale, requested)
+    if scale < 1:
+        raise ValueError(f"{modules} modules do not fit in {width} dots.")
+    return scale
+
+
+def pack_bits(rows):
+    """Packed printer rows from row-bit ints; equal ints share one bytes object."""
+    packed = []
+    last_bits = last_row = None
+    for bits in rows:
+        if bits != last_bits:
+            last_bits, last_row = bits, (bits.to_bytes(ROW_BYTES, 'little') if bits else BLANK_ROW)
+        packed.append(last_row)
+    return packed
+
+
+def code128_bits(data, height, width=PRINT_WIDTH, x=0, module=None):
+    """Row bits of a Code128 symbol `height` dots tall, as wide as fits `width` (quiet zones kept)."""
+    modules = code128_modules(data)
+    scale = fit_scale(len(modules) + 2 * CODE128_QUIET, width, module)
+    return module_rows([modules], scale, width, x)[:1] * height
+
+
+def qr_bits(data, height=None, width=PRINT_WIDTH, x=0, level='M', module=None):
+    """
+    Row bits of a QR code as large as fits `width` (and `height`, if given, the code
+    then centred in that many rows), quiet zone kept.
+    """
+    matrix = qr_matrix(data, level)
+    size = len(matrix) + 2 * QR_QUIET
+    scale = fit_scale(size, min(width, height or width), module)
+    rows = module_rows(matrix, scale, width, x, QR_QUIET)
+    if height:
+        top = (height - len(rows)) // 2
+        rows = [0] * top + rows + [0] * (height - len(rows) - top)
+    return rows
+
+
+@dataclass
+class Barcode:
+    """A Code128 barcode in a print_many batch, `height` dots tall; `module` caps the dots per module."""
+    data: str
+    height: int = 80
+    module: int = None
+
+    def rows(self):
+        return pack_bits(code128_bits(self.data, self.height, module=self.module))
+
+
+@dataclass
+class QRCode:
+    """A QR code in a print_many batch; `module` caps the dots per module."""
+    data: str
+    level: str = 'M'
+    module: int = None
+
+    def rows(self):
+        return pack_bits(qr_bits(self.data, level=self.level, module=self.module))
@@ -0,0 +1,182 @@
+"""
+discovery.py - Finding V5G-family (MX11) printers over BLE
+
+Scans for printers by advertised service UUID (names alone are not trusted:
+'MX' also starts Logitech mice and keyboards) and keeps two caches:
+
+- in memory, the BLEDevice objects from the last scan, so a connect in the same
+  process hands BleakClient a device instead of an address (no second scan);
+- on disk (DEVICE_CACHE_FILE), per address: name, when it was last seen, and the
+  GATT service holding the printer's TX/RX characteristics, so later connects
+  only discover that one service. The file is rewritten on a connect only when
+  the service changed or the entry is due a refresh (SEEN_REFRESH).
+
+Entries older than CACHE_TTL are ignored. bleak is imported only when scanning.
+"""
+
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, fields
+
+# Service the TX/RX characteristics (0xAE01/0xAE02) live under on V5G-family printers
+PRINTER_SERVICE_UUIDS = (
+    "0000ae30-0000-1000-8000-00805f9b34fb",
+    "0000af30-0000-1000-8000-00805f9b34fb",
+)
+
+DEVICE_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.mx11_devices.json')
+CACHE_TTL = 7 * 24 * 3600.0
+# A connect refreshes an entry's `seen` (keeping it within CACHE_TTL) at most this often
+SEEN_REFRESH = 24 * 3600.0
+SCAN_TIMEOUT = 5.0
+
+logger = logging.getLogger('Discovery')
+
+# address -> BLEDevice from the most recent scan in this process
+_devices = {}
+
+
+@dataclass
+class DiscoveredPrinter:
+    address: str
+    name: str = ''
+    rssi: int = None
+    seen: float = 0.0
+    # Service holding the TX/RX characteristics
+    service_uuid: str = None
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def is_printer(service_uuids):
+    """True if an advertisement lists a V5G-family printer service."""
+    return any(uuid.lower() in PRINTER_SERVICE_UUIDS for uuid in service_uuids or ())
+
+
+def load_cache(path=DEVICE_CACHE_FILE, ttl=CACHE_TTL):
+    """Returns {address: DiscoveredPrinter} for entries seen within `ttl` seconds."""
+    try:
+        with open(path, 'r') as f:
+            raw = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    now = time.time()
+    known = {f.name for f in fields(DiscoveredPrinter)}
+    cache = {}
+    for address, entry in raw.items():
+        try:
+            # Keys from older versions (e.g. characteristic handles) are dropped
+            printer = DiscoveredPrinter(**{key: value for key, value in entry.items() if key in known})
+        except TypeError:
+            continue
+        if now - printer.seen <= ttl:
+            cache[address.upper()] = printer
+    return cache
+
+
+def save_cache(cache, path=DEVICE_CACHE_FILE):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({address: printer.as_dict() for address, printer in cache.items()}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def cached_printer(address, path=DEVICE_CACHE_FILE):
+    """The unexpired disk cache entry for `address`, or None."""
+    return load_cache(path).get(address.upper())
+
+
+def cached_device(address):
+    """The BLEDevice for `address` from a scan in this process, or None."""
+    return _devices.get(address.upper())
+
+
+async def discover(timeout=SCAN_TIMEOUT, path=DEVICE_CACHE_FILE):
+    """
+    Scans for `timeout` seconds and returns the printers found, strongest signal
+    first. Results are merged into the disk cache; known services are kept.
+    """
+    from bleak import BleakScanner
+
+    found = await BleakScanner.discover(timeout=timeout, return_adv=True)
+    cache = load_cache(path)
+    now = time.time()
+    printers = []
+    for device, adv in found.values():
+        name = adv.local_name or device.name or ''
+        if not is_printer(adv.service_uuids):
+            continue
+        address = device.address.upper()
+        _devices[address] = device
+        printer = cache.get(address) or DiscoveredPrinter(address)
+        printer.name = name or printer.name
+        printer.rssi = adv.rssi
+        printer.seen = now
+        cache[address] = printer
+        printers.append(printer)
+    if printers:
+        save_cache(cache, path)
+    printers.sort(key=lambda p: p.rssi if p.rssi is not None else -999, reverse=True)
+    logger.info(f"Found {len(printers)} printer(s)")
+    return printers
+
+
+def remember_connection(address, client, tx_uuid, rx_uuid, path=DEVICE_CACHE_FILE):
+    """
+    Records the service holding a connected client's TX/RX characteristics, so
+    the next connect can limit service discovery to it. Writes the cache only if
+    that service changed or the entry is older than SEEN_REFRESH.
+    """
+    tx = client.services.get_characteristic(tx_uuid)
+    rx = client.services.get_characteristic(rx_uuid)
+    if tx is None or rx is None:
+        return
+    cache = load_cache(path)
+    address = address.upper()
+    printer = cache.get(address) or DiscoveredPrinter(address)
+    now = time.time()
+    if printer.service_uuid == tx.service_uuid and now - printer.seen < SEEN_REFRESH:
+        return
+    printer.seen = now
+    printer.service_uuid = tx.service_uuid
+    cache[address] = printer
+    try:
+        save_cache(cache, path)
+    except OSError as e:
+        logger.debug(f"Could not write device cache: {e}")
+
+
+def forget(address, path=DEVICE_CACHE_FILE):
+    """Drops `address` from both caches, e.g. after a connect from cached data failed."""
+    address = address.upper()
+    _devices.pop(address, None)
+    cache = load_cache(path)
+    if cache.pop(address, None):
+        save_cache(cache, path)
+
+
+def update_config(config, printers):
+    """
+    Records `printers` in config['printers'] and, if no printer is configured yet,
+    sets mac_address to the first one. Only pass printers a connection has
+    verified (TX/RX characteristics found). Returns True if the config changed.
+    """
+    pool = {entry.get('mac_address', '').upper(): entry for entry in config.get('printers', [])}
+    changed = False
+    for printer in printers:
+        entry = pool.get(printer.address)
+        if entry is None:
+            pool[printer.address] = {'mac_address': printer.address, 'name': printer.name}
+            changed = True
+        elif printer.name and entry.get('name') != printer.name:
+            entry['name'] = printer.name
+            changed = True
+    if changed:
+        config['printers'] = list(pool.values())
+    if printers and config.get('mac_address') in (None, '', 'XX:XX:XX:XX:XX:XX'):
+        config['mac_address'] = printers[0].address
+        changed = True
+    return changed
@@ -0,0 +1,387 @@
+"""
+encoder.py - Row encoder for MX11 print jobs
+
+Works on packed rows: 48 bytes per 384-dot line, LSB-first, 1 = black. That is
+exactly the payload of the printer's 0xA2 raw row command, so a raw row needs no
+conversion at all and an RLE (0xBF) row can be built straight from the bits.
+"""
+
+import mmap
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from functools import partial
+
+from mx11 import PRINT_WIDTH, cmd_print_row
+from protocol import OP_PRINT_ROW_RAW, OP_PRINT_ROW_RLE, FrameBuilder, crc8_many, feed_frame
+
+ROW_BYTES = PRINT_WIDTH // 8
+BLANK_ROW = bytes(ROW_BYTES)
+# Shortest run of blank rows replaced by a paper feed when blank feeding is on
+BLANK_FEED_MIN = 2
+# The feed command carries a single byte line count
+MAX_FEED_LINES = 0xff
+
+ENCODER_MODES = ('adaptive', 'rle')
+
+# Rows kept in the shared encoded-row cache (a few KB of command bytes per hundred rows)
+ROW_CACHE_SIZE = 4096
+# Raw-row CRCs are computed in bulk for this many rows at a time, when a row among them needs one
+CRC_CHUNK_ROWS = 256
+
+# PIL mode '1' packs MSB-first with 1 = white; the printer wants LSB-first with 1 = black
+_PIL_TO_PRINTER = bytes(int(f'{~b & 0xff:08b}'[::-1], 2) for b in range(256))
+# Binary PBM (P4) packs MSB-first with 1 = black, so only the bit order differs
+_PBM_TO_PRINTER = bytes(int(f'{b:08b}'[::-1], 2) for b in range(256))
+# Headerless files of printer rows as they go on the wire (see load_packed)
+PACKED_EXTENSIONS = ('.bin', '.raw')
+_PBM_WHITESPACE = b' \t\r\n\x0b\x0c'
+# Bit i of (row ^ row >> 1) is set when dot i and dot i + 1 differ
+_TRANSITION_MASK = (1 << (PRINT_WIDTH - 1)) - 1
+
+
+def pack_image(img):
+    """Packs a PRINT_WIDTH wide PIL image into printer rows (bytes, ROW_BYTES per row)."""
+    if img.mode != '1':
+        img = img.convert('1')
+    if img.width != PRINT_WIDTH:
+        raise ValueError(f"Image width must be {PRINT_WIDTH} pixels, got {img.width}.")
+    return img.tobytes().translate(_PIL_TO_PRINTER)
+
+
+def pack_rows(rows):
+    """Packs rows in the legacy list-of-0/1 format (1 = black) into printer rows."""
+    out = bytearray()
+    for row in rows:
+        bits = 0
+        for x, val in enumerate(row):
+            if val:
+                bits |= 1 << x
+        out += bits.to_bytes(ROW_BYTES, 'little')
+    return bytes(out)
+
+
+def split_rows(packed):
+    """Returns zero-copy memoryview slices of ROW_BYTES for each row in a packed bitmap."""
+    if len(packed) % ROW_BYTES:
+        raise ValueError(f"Packed bitmap length {len(packed)} is not a multiple of {ROW_BYTES}.")
+    view = memoryview(packed)
+    return [view[i:i + ROW_BYTES] for i in range(0, len(view), ROW_BYTES)]
+
+
+def _pbm_header(data):
+    """Returns (width, height, raster offset) of the binary PBM (P4) in `data`."""
+    values = []
+    i, n = 2, len(data)
+    while len(values) < 2:
+        while i < n and data[i] in _PBM_WHITESPACE:
+            i += 1
+        if i < n and data[i] == ord('#'):
+            while i < n and data[i] not in b'\r\n':
+                i += 1
+            continue
+        start = i
+        while i < n and 0x30 <= data[i] <= 0x39:
+            i += 1
+        if start == i:
+            raise ValueError("Malformed PBM header.")
+        values.append(int(data[start:i]))
+    # A single whitespace byte separates the header from the raster
+    return values[0], values[1], i + 1
+
+
+def is_packed(path):
+    """True if `path` is a binary PBM or a raw packed-row file that load_packed() reads."""
+    if os.path.splitext(str(path))[1].lower() in PACKED_EXTENSIONS:
+        return True
+    with open(path, 'rb') as f:
+        return f.read(2) == b'P4'
+
+
+def load_packed(path):
+    """
+    Memory-maps a pre-binarized bitmap and returns its rows as split_rows() does:
+    either a binary PBM (P4) exactly PRINT_WIDTH dots wide, or a headerless file of
+    printer rows (ROW_BYTES each, LSB-first, 1 = black). The extension decides:
+    PACKED_EXTENSIONS files are always raw rows, anything else must be a PBM. Raw
+    rows are views straight into the mapping; PBM rows cost one bit-reversing
+    translate of the raster.
+    """
+    raw = os.path.splitext(str(path))[1].lower() in PACKED_EXTENSIONS
+    with open(path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ValueError(f"{path} is empty.")
+    if raw:
+        # The row views keep the mapping alive; it is unmapped once they are gone
+        return split_rows(mapped)
+    try:
+        if mapped[:2] != b'P4':
+            raise ValueError(f"{path} is neither a binary PBM nor a raw row file ({', '.join(PACKED_EXTENSIONS)}).")
+        width, height, offset = _pbm_header(mapped)
+        if width != PRINT_WIDTH:
+            raise ValueError(f"Image width must be {PRINT_WIDTH} pixels, got {width}.")
+        end = offset + height * ROW_BYTES
+        if end > len(mapped):
+            raise ValueError(f"{path} is truncated: {height} rows need {end} bytes, file has {len(mapped)}.")
+        return split_rows(mapped[offset:end].translate(_PBM_TO_PRINTER))
+    finally:
+        mapped.close()
+
+
+class _ChunkCrcs:
+    """
+    Raw-row CRCs of a row sequence, worked out with crc8_many CRC_CHUNK_ROWS rows at
+    a time and only for chunks where some row is sent raw. Rows are encoded in
+    order, so only the current chunk is kept.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self._chunk = None
+        self._crcs = b''
+
+    def get(self, i):
+        chunk, offset = divmod(i, CRC_CHUNK_ROWS)
+        if chunk != self._chunk:
+            start = chunk * CRC_CHUNK_ROWS
+            self._crcs = crc8_many(b''.join(self.rows[start:start + CRC_CHUNK_ROWS]), ROW_BYTES)
+            self._chunk = chunk
+        return self._crcs[offset]
+
+
+def _append_run(payload, n, val):
+    # Same layout as mx11.encode_run_length_repetition
+    while n > 0x7f:
+        payload.append(0x7f | (val << 7))
+        n -= 0x7f
+    if n > 0:
+        payload.append((val << 7) | n)
+
+
+class RowCache:
+    """LRU of packed row -> (command, is_rle), shared by encoders across jobs."""
+
+    def __init__(self, maxsize=ROW_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+
+ROW_CACHE = RowCache()
+
+
+@dataclass
+class EncodeStats:
+    """Byte accounting for one print job."""
+    rows: int = 0
+    rle_rows: int = 0
+    raw_rows: int = 0
+    fed_rows: int = 0
+    trimmed_rows: int = 0
+    cached_rows: int = 0
+    bitmap_bytes: int = 0
+    wire_bytes: int = 0
+
+    @property
+    def raw_wire_bytes(self):
+        """What the rows would have cost on the wire sent as 0xA2 raw rows."""
+        return self.rows * (ROW_BYTES + 8)
+
+    @property
+    def compression_ratio(self):
+        return self.bitmap_bytes / self.wire_bytes if self.wire_bytes else 1.0
+
+    @property
+    def saved_bytes(self):
+        return self.raw_wire_bytes - self.wire_bytes
+
+    def merge(self, other):
+        """Adds another job's counts to these, e.g. for the items of a batch."""
+        for f in fields(self):
+            setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'rle_rows': self.rle_rows,
+            'raw_rows': self.raw_rows,
+            'fed_rows': self.fed_rows,
+            'trimmed_rows': self.trimmed_rows,
+            'cached_rows': self.cached_rows,
+            'bitmap_bytes': self.bitmap_bytes,
+            'wire_bytes': self.wire_bytes,
+            'compression_ratio': self.compression_ratio,
+            'saved_bytes': self.saved_bytes,
+        }
+
+    def summary(self):
+        return (f"{self.rows} rows ({self.rle_rows} RLE, {self.raw_rows} raw, {self.fed_rows} fed, "
+                f"{self.trimmed_rows} trimmed, {self.cached_rows} reused): "
+                f"{self.bitmap_bytes} bitmap bytes -> {self.wire_bytes} bytes on the wire "
+                f"(ratio {self.compression_ratio:.2f}, {self.saved_bytes} bytes saved vs raw)")
+
+
+class RowEncoder:
+    """
+    Builds row commands from packed rows and keeps per-job byte statistics.
+
+    'adaptive' counts colour transitions across the whole row in one integer
+    operation and goes straight to a raw row when RLE cannot fit in ROW_BYTES;
+    otherwise it builds the RLE from the transition positions. 'rle' runs the
+    original cmd_print_row path. Both produce identical bytes.
+
+    With `blank_feed_min` set, encode_rows() replaces runs of at least that many
+    all-white rows with paper feed (0xA1) commands. With `trim`, trim() drops
+    blank rows at the top and bottom of the job.
+
+    A row identical to the previous one reuses its command outright; other rows
+    are looked up in `cache` (the shared ROW_CACHE by default, None to disable).
+    """
+
+    def __init__(self, mode='adaptive', blank_feed_min=None, trim=False, cache=ROW_CACHE):
+        if mode not in ENCODER_MODES:
+            raise ValueError(f"Unknown encoder mode '{mode}', expected one of {ENCODER_MODES}.")
+        self.mode = mode
+        self.blank_feed_min = blank_feed_min
+        self.trim_blank = trim
+        self.cache = cache
+        self.stats = EncodeStats()
+        self._last_row = None
+        self._last_entry = None
+        # Frames are built in this encoder's own buffer, so encoders can run in parallel threads
+        self._frames = FrameBuilder()
+
+    def trim(self, rows):
+        """Returns `rows` without leading/trailing blank rows (if trimming is on)."""
+        if not self.trim_blank:
+            return rows
+        first, last = 0, len(rows)
+        while first < last and rows[first] == BLANK_ROW:
+            first += 1
+        while last > first and rows[last - 1] == BLANK_ROW:
+            last -= 1
+        self.stats.trimmed_rows += len(rows) - (last - first)
+        return rows[first:last]
+
+    def encode_rows(self, rows):
+        """Yields (rows_done, command) for a sequence of packed rows."""
+        i, n = 0, len(rows)
+        raw_crcs = _ChunkCrcs(rows) if self.mode == 'adaptive' else None
+        while i < n:
+            row = rows[i]
+            if self.blank_feed_min and row == BLANK_ROW:
+                end = i + 1
+                while end < n and rows[end] == BLANK_ROW:
+                    end += 1
+                if end - i >= self.blank_feed_min:
+                    while i < end:
+                        lines = min(end - i, MAX_FEED_LINES)
+                        i += lines
+                        yield i, self.feed(lines)
+                    continue
+            i += 1
+            yield i, self.encode(row, partial(raw_crcs.get, i - 1) if raw_crcs else None)
+
+    def feed_lines(self, lines):
+        """Yields (lines_done, command) feeding `lines` of paper, split to fit the feed command."""
+        done = 0
+        while done < lines:
+            n = min(lines - done, MAX_FEED_LINES)
+            done += n
+            yield done, self.feed(n)
+
+    def feed(self, lines):
+        """Returns a paper feed command standing in for `lines` blank rows."""
+        command = feed_frame(lines)
+        stats = self.stats
+        stats.rows += lines
+        stats.fed_rows += lines
+        stats.bitmap_bytes += lines * ROW_BYTES
+        stats.wire_bytes += len(command)
+        return command
+
+    def encode(self, row, raw_crc=None):
+        """
+        Returns the print command for one packed row. `raw_crc` is its CRC if known,
+        or a callable returning it, called only if the row goes out raw.
+        """
+        stats = self.stats
+        if row == self._last_row:
+            command, is_rle = self._last_entry
+            stats.cached_rows += 1
+        else:
+            key = bytes(row)
+            entry = self.cache.get(key) if self.cache is not None else None
+            if entry is None:
+                entry = self._encode_uncached(key, raw_crc)
+                if self.cache is not None:
+                    self.cache.put(key, entry)
+            else:
+                stats.cached_rows += 1
+            command, is_rle = entry
+            self._last_row = key
+            self._last_entry = entry
+        stats.rows += 1
+        stats.bitmap_bytes += ROW_BYTES
+        stats.wire_bytes += len(command)
+        if is_rle:
+            stats.rle_rows += 1
+        else:
+            stats.raw_rows += 1
+        return command
+
+    def _encode_uncached(self, row, raw_crc=None):
+        if self.mode == 'rle':
+            bits = int.from_bytes(row, 'little')
+            command = cmd_print_row([(bits >> x) & 1 for x in range(PRINT_WIDTH)])
+            return command, command[2] == OP_PRINT_ROW_RLE
+        return self._encode_adaptive(row, raw_crc)
+
+    def _encode_adaptive(self, row, raw_crc=None):
+        bits = int.from_bytes(row, 'little')
+        flips = (bits ^ (bits >> 1)) & _TRANSITION_MASK
+        # Every run costs at least one byte, so too many runs means raw wins outright
+        if flips.bit_count() >= ROW_BYTES:
+            return self._raw_frame(row, raw_crc), False
+
+        payload = bytearray()
+        val = bits & 1
+        start = 0
+        while flips:
+            low = flips & -flips
+            end = low.bit_length()
+            _append_run(payload, end - start, val)
+            start = end
+            val ^= 1
+            flips ^= low
+        _append_run(payload, PRINT_WIDTH - start, val)
+        if len(payload) > ROW_BYTES:
+            return self._raw_frame(row, raw_crc), False
+        return self._frames.build(OP_PRINT_ROW_RLE, payload), True
+
+    def _raw_frame(self, row, raw_crc=None):
+        return self._frames.build(OP_PRINT_ROW_RAW, row, raw_crc() if callable(raw_crc) else raw_crc)
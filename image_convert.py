@@ -9,21 +9,27 @@ All functions are designed to output a PIL Image ready for mx11.py.
 """
 
 from PIL import Image, ImageDraw, ImageFont
-import os
 import logging
-import numpy as np
+import math
+import os
+import struct
+from functools import lru_cache
 
-def text_to_image(text_content, width=384, font_name='arial.ttf', font_size=20):
-    """
-    Converts a string of text into a black and white PIL Image, with word wrapping.
-    """
-    # Find font path (Windows)
+@lru_cache(maxsize=32)
+def load_font(font_name='arial.ttf', font_size=20):
+    """Loads a font from the Windows font folder, falling back to PIL's default font."""
     font_path = os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts', font_name)
     try:
-        font = ImageFont.truetype(font_path, font_size)
+        return ImageFont.truetype(font_path, font_size)
     except Exception as e:
         logging.warning(f"Could not load font '{font_name}' at '{font_path}': {e}. Using default font.")
-        font = ImageFont.load_default()
+        return ImageFont.load_default()
+
+def text_to_image(text_content, width=384, font_name='arial.ttf', font_size=20):
+    """
+    Converts a string of text into a black and white PIL Image, with word wrapping.
+    """
+    font = load_font(font_name, font_size)
 
     # Word wrap using font.getbbox for width measurement
     lines = []
@@ -57,10 +63,9 @@ def text_to_image(text_content, width=384, font_name='arial.ttf', font_size=20):
 # Placeholder for future image conversion functions (binarization, dithering, etc.)
 
 
-from PIL import ImageEnhance
-
 def _bayer_dither(img, matrix_size=8):
     """Ordered/Bayer dithering using a threshold matrix."""
+    import numpy as np
     bayer_matrix = np.array([
         [0, 48, 12, 60, 3, 51, 15, 63],
         [32, 16, 44, 28, 35, 19, 47, 31],
@@ -80,38 +85,32 @@ def _bayer_dither(img, matrix_size=8):
             out[y, x] = 255 if img_np[y, x] > (threshold * 4) else 0
     return Image.fromarray(out, mode='L').convert('1')
 
-def _atkinson_dither(img):
-    img_np = np.array(img, dtype=np.float32)
-    h, w = img_np.shape
-    for y in range(h):
-        for x in range(w):
-            old = img_np[y, x]
-            new = 255 if old > 127 else 0
-            err = old - new
-            img_np[y, x] = new
-            for dx, dy in [(1,0),(2,0),(-1,1),(0,1),(1,1),(0,2)]:
-                if 0 <= x+dx < w and 0 <= y+dy < h:
-                    img_np[y+dy, x+dx] += err * 1/8
-    return Image.fromarray(img_np.clip(0,255).astype(np.uint8), mode='L').convert('1')
+# Error diffusion kernels: (dx, dy, share of the error pushed to that neighbour)
+ATKINSON_KERNEL = [(1,0,1/8),(2,0,1/8),(-1,1,1/8),(0,1,1/8),(1,1,1/8),(0,2,1/8)]
+BURKES_KERNEL = [
+    (1,0,8/32),(2,0,4/32),(-2,1,2/32),(-1,1,4/32),(0,1,8/32),(1,1,4/32),(2,1,2/32)
+]
+STUCKI_KERNEL = [
+    (1,0,8/42),(2,0,4/42),(-2,1,2/42),(-1,1,4/42),(0,1,8/42),(1,1,4/42),(2,1,2/42),
+    (-2,2,1/42),(-1,2,2/42),(0,2,4/42),(1,2,2/42),(2,2,1/42)
+]
+JARVIS_KERNEL = [
+    (1,0,7/48),(2,0,5/48),(-2,1,3/48),(-1,1,5/48),(0,1,7/48),(1,1,5/48),(2,1,3/48),
+    (-2,2,1/48),(-1,2,3/48),(0,2,5/48),(1,2,3/48),(2,2,1/48)
+]
+SIERRA_KERNEL = [
+    (1,0,5/32),(2,0,3/32),(-2,1,2/32),(-1,1,4/32),(0,1,5/32),(1,1,4/32),(2,1,2/32),
+    (-1,2,2/32),(0,2,3/32),(1,2,2/32)
+]
 
-def _burkes_dither(img):
-    img_np = np.array(img, dtype=np.float32)
-    h, w = img_np.shape
-    for y in range(h):
-        for x in range(w):
-            old = img_np[y, x]
-            new = 255 if old > 127 else 0
-            err = old - new
-            img_np[y, x] = new
-            for dx, dy, factor in [
-                (1,0,8/32),(2,0,4/32),(-2,1,2/32),(-1,1,4/32),(0,1,8/32),(1,1,4/32),(2,1,2/32)
-            ]:
-                if 0 <= x+dx < w and 0 <= y+dy < h:
-                    img_np[y+dy, x+dx] += err * factor
-    return Image.fromarray(img_np.clip(0,255).astype(np.uint8), mode='L').convert('1')
+# Strip-parallel diffusion: each strip first re-dithers this many rows of the strip
+# above (output discarded) so it starts with realistic error instead of none
+DIFFUSION_OVERLAP = 16
+# Images shorter than two strips of this many rows are always done serially
+MIN_STRIP_ROWS = 256
 
-def _stucki_dither(img):
-    img_np = np.array(img, dtype=np.float32)
+def _diffuse(img_np, kernel):
+    """Serial error diffusion of a float32 array, in place (threshold 127)."""
     h, w = img_np.shape
     for y in range(h):
         for x in range(w):
@@ -119,54 +118,124 @@ def _stucki_dither(img):
             new = 255 if old > 127 else 0
             err = old - new
             img_np[y, x] = new
-            for dx, dy, factor in [
-                (1,0,8/42),(2,0,4/42),(-2,1,2/42),(-1,1,4/42),(0,1,8/42),(1,1,4/42),(2,1,2/42),
-                (-2,2,1/42),(-1,2,2/42),(0,2,4/42),(1,2,2/42),(2,2,1/42)
-            ]:
+            for dx, dy, factor in kernel:
                 if 0 <= x+dx < w and 0 <= y+dy < h:
                     img_np[y+dy, x+dx] += err * factor
-    return Image.fromarray(img_np.clip(0,255).astype(np.uint8), mode='L').convert('1')
+    return img_np
 
-def _jarvis_judice_ninke_dither(img):
-    img_np = np.array(img, dtype=np.float32)
-    h, w = img_np.shape
-    for y in range(h):
-        for x in range(w):
-            old = img_np[y, x]
-            new = 255 if old > 127 else 0
-            err = old - new
-            img_np[y, x] = new
-            for dx, dy, factor in [
-                (1,0,7/48),(2,0,5/48),(-2,1,3/48),(-1,1,5/48),(0,1,7/48),(1,1,5/48),(2,1,3/48),
-                (-2,2,1/48),(-1,2,3/48),(0,2,5/48),(1,2,3/48),(2,2,1/48)
-            ]:
-                if 0 <= x+dx < w and 0 <= y+dy < h:
-                    img_np[y+dy, x+dx] += err * factor
-    return Image.fromarray(img_np.clip(0,255).astype(np.uint8), mode='L').convert('1')
+def _diffuse_strip(strip, kernel, lead):
+    return _diffuse(strip, kernel)[lead:]
 
-def _sierra_dither(img):
+def _error_diffuse(img, kernel, workers=1):
+    """
+    Error-diffuses a grayscale image with `kernel`. With workers > 1 (None: one per
+    CPU), tall images are cut into horizontal strips dithered in parallel processes,
+    each strip warmed up on DIFFUSION_OVERLAP rows above it so no seam shows.
+    workers=1 is the exact serial algorithm.
+    """
+    import numpy as np
     img_np = np.array(img, dtype=np.float32)
-    h, w = img_np.shape
-    for y in range(h):
-        for x in range(w):
-            old = img_np[y, x]
-            new = 255 if old > 127 else 0
-            err = old - new
-            img_np[y, x] = new
-            for dx, dy, factor in [
-                (1,0,5/32),(2,0,3/32),(-2,1,2/32),(-1,1,4/32),(0,1,5/32),(1,1,4/32),(2,1,2/32),
-                (-1,2,2/32),(0,2,3/32),(1,2,2/32)
-            ]:
-                if 0 <= x+dx < w and 0 <= y+dy < h:
-                    img_np[y+dy, x+dx] += err * factor
-    return Image.fromarray(img_np.clip(0,255).astype(np.uint8), mode='L').convert('1')
+    h = img_np.shape[0]
+    workers = workers or os.cpu_count() or 1
+    strips = min(workers, h // MIN_STRIP_ROWS)
+    if strips <= 1:
+        out = _diffuse(img_np, kernel)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        bounds = [h * i // strips for i in range(strips + 1)]
+        with ProcessPoolExecutor(max_workers=strips) as pool:
+            futures = []
+            for start, end in zip(bounds, bounds[1:]):
+                lead = min(start, DIFFUSION_OVERLAP)
+                futures.append(pool.submit(_diffuse_strip, img_np[start - lead:end].copy(), kernel, lead))
+            out = np.concatenate([future.result() for future in futures])
+    return Image.fromarray(out.clip(0,255).astype(np.uint8), mode='L').convert('1')
+
+def _atkinson_dither(img, workers=1):
+    return _error_diffuse(img, ATKINSON_KERNEL, workers)
+
+def _burkes_dither(img, workers=1):
+    return _error_diffuse(img, BURKES_KERNEL, workers)
+
+def _stucki_dither(img, workers=1):
+    return _error_diffuse(img, STUCKI_KERNEL, workers)
+
+def _jarvis_judice_ninke_dither(img, workers=1):
+    return _error_diffuse(img, JARVIS_KERNEL, workers)
+
+def _sierra_dither(img, workers=1):
+    return _error_diffuse(img, SIERRA_KERNEL, workers)
 
 def _random_dither(img):
+    import numpy as np
     img_np = np.array(img, dtype=np.uint8)
     noise = np.random.randint(-64, 64, img_np.shape)
     img_np = np.clip(img_np + noise, 0, 255)
     return Image.fromarray(np.where(img_np > 127, 255, 0).astype(np.uint8), mode='L').convert('1')
 
+def _load_scaled(image_path, width, rotate=0):
+    """
+    Opens an image (a path or a PIL Image) as grayscale `width` pixels wide (after rotating by `rotate`
+    degrees). JPEGs opened here are decoded straight to a reduced size with
+    draft() (an Image passed in is left as it is), large reductions go through
+    reduce() before the LANCZOS pass (reducing_gap), and the rotation is done on
+    the small image.
+    """
+    opened = not isinstance(image_path, Image.Image)
+    img = Image.open(image_path) if opened else image_path
+    rotate %= 360
+    src_w, src_h = img.size
+    if rotate % 90 == 0:
+        quarter = rotate in (90, 270)
+        rot_w, rot_h = (src_h, src_w) if quarter else (src_w, src_h)
+        new_height = int(rot_h * width / rot_w)
+        size = (new_height, width) if quarter else (width, new_height)
+    else:
+        angle = math.radians(rotate)
+        rot_w = abs(src_w * math.cos(angle)) + abs(src_h * math.sin(angle))
+        scale = width / rot_w
+        size = (max(1, round(src_w * scale)), max(1, round(src_h * scale)))
+    if opened:
+        img.draft('L', size)
+    img = img.convert('L')
+    if img.size != size:
+        img = img.resize(size, Image.LANCZOS, reducing_gap=3.0)
+    if rotate in _TRANSPOSE:
+        img = img.transpose(_TRANSPOSE[rotate])
+    elif rotate:
+        img = img.rotate(rotate, expand=True)
+        if img.width != width:
+            img = img.resize((width, int(img.height * width / img.width)), Image.LANCZOS)
+    return img
+
+_TRANSPOSE = {90: Image.ROTATE_90, 180: Image.ROTATE_180, 270: Image.ROTATE_270}
+
+def _mean(img):
+    """Mean gray level, rounded as ImageEnhance.Contrast rounds it."""
+    hist = img.histogram()
+    return int(sum(i * n for i, n in enumerate(hist)) / (sum(hist) or 1) + 0.5)
+
+def _f32(x):
+    return struct.unpack('f', struct.pack('f', x))[0]
+
+def _tone_table(mean, contrast=1.0, brightness=1.0, threshold=None):
+    """
+    256-entry table doing ImageEnhance.Contrast, then ImageEnhance.Brightness, then
+    an optional threshold (> threshold is white) in a single point() pass.
+    """
+    # Both enhancers are Image.blend() calls, which compute in single precision
+    contrast, brightness = _f32(contrast), _f32(brightness)
+    table = []
+    for v in range(256):
+        if contrast != 1.0:
+            v = min(255, max(0, int(_f32(mean + _f32(contrast * (v - mean))))))
+        if brightness != 1.0:
+            v = min(255, max(0, int(_f32(brightness * v))))
+        if threshold is not None:
+            v = 255 if v > threshold else 0
+        table.append(v)
+    return table
+
 def preprocess_image(
     image_path,
     width=384,
@@ -174,50 +243,112 @@ def preprocess_image(
     threshold=128,
     contrast=1.0,
     brightness=1.0,
-    rotate=0
+    rotate=0,
+    workers=1
 ):
     """
     Loads and preprocesses an image for the printer (resize, grayscale, enhance, binarize, dither).
     Returns a PIL Image.
     Params:
-        dither: 'none', 'floyd-steinberg', or 'default' (alias for 'floyd-steinberg')
+        image_path: file path, or an already opened PIL Image
+        dither: 'none', 'floyd-steinberg', 'default' (alias for 'floyd-steinberg'), 'auto'
+            (threshold text and line art, Floyd-Steinberg for photos; see classify_bands)
+            or any of the other dithers below
         threshold: 0-255, for manual thresholding
         contrast: float, 1.0 = no change
         brightness: float, 1.0 = no change
         rotate: degrees to rotate (e.g., 90, 180)
+        workers: processes for the error-diffusion dithers on tall images (None: one
+            per CPU); 1 keeps the serial, deterministic result
     """
-    img = Image.open(image_path).convert('L')
-    if rotate:
-        img = img.rotate(rotate, expand=True)
-    new_height = int(img.height * width / img.width)
-    img = img.resize((width, new_height), Image.LANCZOS)
-    # Enhance contrast/brightness
-    if contrast != 1.0:
-        img = ImageEnhance.Contrast(img).enhance(contrast)
-    if brightness != 1.0:
-        img = ImageEnhance.Brightness(img).enhance(brightness)
-    # Dithering and binarization
     dither = dither.lower() if isinstance(dither, str) else dither
+    img = _load_scaled(image_path, width, rotate)
+    # Contrast, brightness and (for 'manual') the threshold in one lookup table
+    manual = dither == 'manual'
+    if contrast != 1.0 or brightness != 1.0 or manual:
+        table = _tone_table(_mean(img) if contrast != 1.0 else 0, contrast, brightness,
+                            threshold if manual else None)
+        img = img.point(table, '1') if manual else img.point(table)
+    if manual:
+        return img  # Already thresholded by the tone table
+    if dither == 'auto':
+        return _auto_dither(img)
+    return _binarize(img, dither, workers)
+
+def _binarize(img, dither, workers=1):
+    """Dithers a grayscale image to mode '1' with the named method (Floyd-Steinberg if unknown)."""
     if dither in ('floyd-steinberg', 'default'):
-        img = img.convert('1', dither=Image.FLOYDSTEINBERG)
-    elif dither == 'none':
-        img = img.convert('1', dither=Image.NONE)
-    elif dither == 'manual':
-        img = img.point(lambda x: 255 if x > threshold else 0, '1')
-    elif dither == 'bayer' or dither == 'ordered':
-        img = _bayer_dither(img)
-    elif dither == 'atkinson':
-        img = _atkinson_dither(img)
-    elif dither == 'burkes':
-        img = _burkes_dither(img)
-    elif dither == 'stucki':
-        img = _stucki_dither(img)
-    elif dither == 'jarvis' or dither == 'jarvis-judice-ninke':
-        img = _jarvis_judice_ninke_dither(img)
-    elif dither == 'sierra':
-        img = _sierra_dither(img)
-    elif dither == 'random':
-        img = _random_dither(img)
-    else:
-        img = img.convert('1', dither=Image.FLOYDSTEINBERG)
-    return img
+        return img.convert('1', dither=Image.FLOYDSTEINBERG)
+    if dither == 'none':
+        return img.convert('1', dither=Image.NONE)
+    if dither == 'bayer' or dither == 'ordered':
+        return _bayer_dither(img)
+    if dither == 'atkinson':
+        return _atkinson_dither(img, workers)
+    if dither == 'burkes':
+        return _burkes_dither(img, workers)
+    if dither == 'stucki':
+        return _stucki_dither(img, workers)
+    if dither == 'jarvis' or dither == 'jarvis-judice-ninke':
+        return _jarvis_judice_ninke_dither(img, workers)
+    if dither == 'sierra':
+        return _sierra_dither(img, workers)
+    if dither == 'random':
+        return _random_dither(img)
+    return img.convert('1', dither=Image.FLOYDSTEINBERG)
+
+# 'auto' dithering: images are classified in horizontal bands of this many rows
+AUTO_BAND_ROWS = 16
+# Gray levels counted as mid-tone, and the gradient (on the half-size sample)
+# above which a mid-tone pixel is an anti-aliased edge rather than a smooth tone
+AUTO_MID_TONES = (48, 208)
+AUTO_EDGE = 40
+# A band is continuous-tone when more than this share of its pixels are smooth mid-tones
+AUTO_PHOTO_SHARE = 0.03
+
+def classify_bands(img, band_rows=AUTO_BAND_ROWS):
+    """
+    Splits a grayscale image into [(start, end, is_photo)] row ranges, neighbouring
+    bands of the same kind merged. Text and line art only have mid-tones right at
+    sharp edges (anti-aliasing); photos and gray fills have them in smooth areas.
+    Measured on every other pixel of every other row: decimated, not averaged,
+    since averaging would blur small text into smooth mid-tones.
+    """
+    import numpy as np
+    a = np.asarray(img, dtype=np.int16)[::2, ::2]
+    edge = np.maximum(np.abs(np.diff(a, axis=1, append=a[:, -1:])),
+                      np.abs(np.diff(a, axis=0, append=a[-1:])))
+    lo, hi = AUTO_MID_TONES
+    smooth_mid = (a >= lo) & (a < hi) & (edge < AUTO_EDGE)
+    per_row = smooth_mid.mean(axis=1) if a.size else np.zeros(0)
+    scale = a.shape[0] / img.height if img.height else 1
+    bands = []
+    for start in range(0, img.height, band_rows):
+        end = min(start + band_rows, img.height)
+        rows = per_row[int(start * scale):max(int(start * scale) + 1, int(end * scale))]
+        photo = bool(rows.size) and float(rows.mean()) > AUTO_PHOTO_SHARE
+        if bands and bands[-1][2] == photo:
+            bands[-1] = (bands[-1][0], end, photo)
+        else:
+            bands.append((start, end, photo))
+    return bands
+
+def _auto_dither(img):
+    """
+    Thresholds near-bilevel bands (text, line art, barcodes) and takes the
+    continuous-tone ones from one Floyd-Steinberg pass over the whole image, so
+    runs of photo bands are diffused together with no seams at band edges.
+    """
+    bands = classify_bands(img)
+    photo_rows = sum(end - start for start, end, photo in bands if photo)
+    logging.debug(f"auto dither: {photo_rows} of {img.height} rows continuous-tone, {len(bands)} bands")
+    if not photo_rows:
+        return img.convert('1', dither=Image.NONE)
+    diffused = img.convert('1', dither=Image.FLOYDSTEINBERG)
+    if photo_rows == img.height:
+        return diffused
+    out = img.convert('1', dither=Image.NONE)
+    for start, end, photo in bands:
+        if photo:
+            out.paste(diffused.crop((0, start, img.width, end)), (0, start))
+    return out
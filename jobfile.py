@@ -0,0 +1,137 @@
+"""
+jobfile.py - Prepared print jobs for MX11 printers
+
+A prepared job is the exact command stream of a print, already encoded and
+grouped into BLE write units, so it can be produced on one machine and replayed
+on another with nothing but bleak installed. Layout (little-endian):
+
+    header   7s magic 'MX11JOB' | u8 version | u16 write size | u16 reserved
+             | u32 record count | u32 settings length
+    settings UTF-8 JSON (source, energy, encoder settings, row count, stats...)
+    records  u16 length | u16 rows advanced | command bytes, one per write
+
+Only the standard library and protocol.py are used here.
+"""
+
+import json
+import mmap
+import struct
+
+from protocol import split_frames
+
+MAGIC = b'MX11JOB'
+VERSION = 1
+
+_HEADER = struct.Struct('<7sBHHII')
+_RECORD = struct.Struct('<HH')
+
+
+def write_job(path, commands, settings=None, write_size=None):
+    """
+    Writes a prepared job. `commands` yields (rows, command) pairs, where `rows`
+    is how many image rows the command advances (0 for setup commands). With
+    `write_size`, consecutive commands are packed into records of at most that
+    many bytes of write payload; a command is never split. Returns the number of
+    records written.
+    """
+    records = []
+    pending, pending_rows = bytearray(), 0
+    for rows, command in commands:
+        if write_size and pending and len(pending) + len(command) > write_size:
+            records.append((pending_rows, bytes(pending)))
+            pending, pending_rows = bytearray(), 0
+        pending += command
+        pending_rows += rows
+        if not write_size:
+            records.append((pending_rows, bytes(pending)))
+            pending, pending_rows = bytearray(), 0
+    if pending:
+        records.append((pending_rows, bytes(pending)))
+
+    settings_data = json.dumps(settings or {}).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, write_size or 0, 0, len(records), len(settings_data)))
+        f.write(settings_data)
+        for rows, data in records:
+            f.write(_RECORD.pack(len(data), rows))
+            f.write(data)
+    return len(records)
+
+
+class JobFile:
+    """
+    Memory-maps a prepared job for replay. records() yields zero-copy memoryview
+    slices of the file, each released once the caller moves on to the next one.
+    """
+
+    def __init__(self, path):
+        self._iterators = []
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is not a prepared job file (empty).")
+        self._view = memoryview(self._map)
+        if len(self._view) < _HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is not a prepared job file (truncated header).")
+        magic, version, self.write_size, _, self.record_count, settings_len = _HEADER.unpack_from(self._view)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a prepared job file.")
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"Unsupported prepared job version {version} in {path}.")
+        start = _HEADER.size
+        self.settings = json.loads(bytes(self._view[start:start + settings_len]).decode('utf-8'))
+        self._records_start = start + settings_len
+
+    def records(self):
+        """Yields (rows_done, record) for each write unit, rows_done counting from 0."""
+        iterator = self._iter_records()
+        self._iterators.append(iterator)
+        return iterator
+
+    def commands(self):
+        """
+        Yields (rows_done, command) for each single command, split back out of the
+        records (for re-packing into smaller writes). A record's rows count at its
+        last command.
+        """
+        done = 0
+        for rows_done, record in self.records():
+            commands = list(split_frames(record))
+            for command in commands[:-1]:
+                yield done, command
+            yield rows_done, commands[-1]
+            done = rows_done
+
+    def _iter_records(self):
+        view = self._view
+        offset = self._records_start
+        rows_done = 0
+        for _ in range(self.record_count):
+            length, rows = _RECORD.unpack_from(view, offset)
+            offset += _RECORD.size
+            record = view[offset:offset + length]
+            offset += length
+            rows_done += rows
+            try:
+                yield rows_done, record
+            finally:
+                record.release()
+
+    def close(self):
+        for iterator in self._iterators:
+            # Releases the record an abandoned loop was still holding
+            iterator.close()
+        self._view.release()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
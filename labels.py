@@ -0,0 +1,249 @@
+"""
+labels.py - Label templates for MX11 printers
+
+A LabelTemplate is a static background plus named fields: text, or a Code128
+or QR code drawn at printer resolution (barcodes.py). The background
+is loaded, dithered, packed and encoded once. For each label only the rows that
+the fields cover are composited and re-encoded:
+
+- each field value is rendered into its box alone and kept as packed row bits
+  (cached, so repeated values such as prices cost nothing after the first);
+- field bits replace the background's bits inside the box, an integer mask and
+  OR per row;
+- a row that comes out identical to the background reuses its encoded command,
+  others go through RowEncoder (and its shared row cache).
+
+So a label costs roughly the rows its fields touch, not a full render, dither
+and encode. Labels go into Printer.print_many as items (LabelTemplate.label()),
+so a run of them is one job. Templates can be described in JSON:
+
+    {"background": "shelf.png", "binarization": "auto",
+     "fields": [{"name": "price", "box": [200, 40, 180, 48], "font_size": 40, "align": "right"},
+                {"name": "sku", "box": [10, 100, 364, 60], "kind": "code128"}]}
+
+"background" is relative to the JSON file; without one, "height" gives a blank label.
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+from encoder import ROW_BYTES, RowEncoder, pack_image, split_rows
+from mx11 import PRINT_WIDTH
+from protocol import OP_PRINT_ROW_RLE
+
+FIELD_ALIGNMENTS = ('left', 'center', 'right')
+FIELD_KINDS = ('text', 'code128', 'qr')
+# Rendered (field, value) pairs kept per process
+FIELD_CACHE_SIZE = 1024
+
+
+@dataclass(frozen=True)
+class Field:
+    """
+    A region filled per label: `box` is (x, y, width, height) in dots from the label's
+    top left. `kind` 'code128' or 'qr' draws the value as a code centred in the box.
+    """
+    name: str
+    box: tuple
+    font_name: str = 'arial.ttf'
+    font_size: int = 20
+    align: str = 'left'
+    kind: str = 'text'
+
+    def __post_init__(self):
+        x, y, width, height = self.box
+        if x < 0 or y < 0 or width <= 0 or height <= 0 or x + width > PRINT_WIDTH:
+            raise ValueError(f"Field '{self.name}' box {self.box} does not fit a {PRINT_WIDTH}-dot label.")
+        if self.align not in FIELD_ALIGNMENTS:
+            raise ValueError(f"Unknown alignment '{self.align}' for field '{self.name}', expected one of {FIELD_ALIGNMENTS}.")
+        if self.kind not in FIELD_KINDS:
+            raise ValueError(f"Unknown kind '{self.kind}' for field '{self.name}', expected one of {FIELD_KINDS}.")
+        object.__setattr__(self, 'box', tuple(self.box))
+
+    @property
+    def mask(self):
+        """Bits of a packed row (as an int) inside the box."""
+        x, _, width, _ = self.box
+        return ((1 << width) - 1) << x
+
+
+@lru_cache(maxsize=FIELD_CACHE_SIZE)
+def render_field(field, value):
+    """Packed row bits (ints, one per box row, outside bits clear) for `value` in `field`."""
+    from PIL import Image, ImageDraw
+    from barcodes import code128_bits, qr_bits
+    from image_convert import load_font
+
+    x, _, width, height = field.box
+    if field.kind != 'text':
+        if not value:
+            return (0,) * height
+        if field.kind == 'code128':
+            return tuple(code128_bits(value, height, width, x))
+        return tuple(qr_bits(value, height, width, x))
+    font = load_font(field.font_name, field.font_size)
+    strip = Image.new('L', (PRINT_WIDTH, height), 255)
+    if value:
+        left, _, right, _ = font.getbbox(value)
+        if field.align == 'right':
+            x += width - right
+        elif field.align == 'center':
+            x += (width - (right - left)) // 2 - left
+        ImageDraw.Draw(strip).text((x, 0), value, font=font, fill=0)
+    mask = field.mask
+    return tuple(int.from_bytes(row, 'little') & mask
+                 for row in split_rows(pack_image(strip.convert('1', dither=Image.NONE))))
+
+
+class LabelEncoder(RowEncoder):
+    """
+    RowEncoder that takes the template's encoded commands for rows equal to the
+    background. Blank runs are not fed and nothing is trimmed: a label keeps its height.
+    """
+
+    def __init__(self, template, mode='adaptive'):
+        super().__init__(mode=mode)
+        self.template = template
+
+    def encode_rows(self, rows):
+        static = self.template._static
+        background = self.template._rows
+        stats = self.stats
+        for i, row in enumerate(rows):
+            if row is background[i]:
+                command = static[i]
+                stats.rows += 1
+                stats.cached_rows += 1
+                stats.bitmap_bytes += ROW_BYTES
+                stats.wire_bytes += len(command)
+                if command[2] == OP_PRINT_ROW_RLE:
+                    stats.rle_rows += 1
+                else:
+                    stats.raw_rows += 1
+            else:
+                command = self.encode(row)
+            yield i + 1, command
+
+
+@dataclass
+class Label:
+    """One label of a template in a print_many batch."""
+    template: 'LabelTemplate'
+    values: dict
+
+    def encode(self, encoding='adaptive'):
+        """(encoder, rows) like Printer._encode_image, for print_many."""
+        return LabelEncoder(self.template, encoding), self.template.rows(self.values)
+
+
+class LabelTemplate:
+    def __init__(self, background=None, fields=(), binarization='auto', height=None, workers=1):
+        """
+        `background` is an image path or PIL Image (scaled to the print width and
+        dithered with `binarization`), or None for a blank label `height` rows tall.
+        """
+        if background is not None:
+            from image_convert import preprocess_image
+            packed = pack_image(preprocess_image(background, width=PRINT_WIDTH, dither=binarization, workers=workers))
+        elif height:
+            packed = bytes(ROW_BYTES * height)
+        else:
+            raise ValueError("A label template needs a background image or a height.")
+        self._rows = [bytes(row) for row in split_rows(packed)]
+        self.fields = {}
+        for field in fields:
+            if field.box[1] + field.box[3] > len(self._rows):
+                raise ValueError(f"Field '{field.name}' box {field.box} runs past the label's {len(self._rows)} rows.")
+            self.fields[field.name] = field
+        # Encoded once; LabelEncoder sends these for rows no field changed
+        encoder = RowEncoder(cache=None)
+        self._static = [encoder.encode(row) for row in self._rows]
+        # Files the template was read from (see load_template)
+        self.sources = ()
+
+    @property
+    def height(self):
+        return len(self._rows)
+
+    @classmethod
+    def load(cls, path, workers=1):
+        """Reads a template from JSON (see the module docstring)."""
+        with open(path, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+        background = spec.get('background')
+        if background:
+            background = os.path.join(os.path.dirname(os.path.abspath(path)), background)
+        fields = [Field(**entry) for entry in spec.get('fields', [])]
+        template = cls(background, fields, spec.get('binarization', 'auto'), spec.get('height'), workers)
+        template.sources = (os.path.abspath(path),) + ((background,) if background else ())
+        return template
+
+    def label(self, values=None, **kwargs):
+        """A print_many item printing this template with `values` (field name -> text)."""
+        values = {**(values or {}), **kwargs}
+        unknown = set(values) - set(self.fields)
+        if unknown:
+            raise ValueError(f"Unknown label field(s): {', '.join(sorted(unknown))}.")
+        return Label(self, values)
+
+    def rows(self, values):
+        """Packed rows of the label; rows the fields leave unchanged are the background's own objects."""
+        rows = list(self._rows)
+        changed = {}
+        for name, field in self.fields.items():
+            _, y, _, _ = field.box
+            mask = ~field.mask
+            for i, bits in enumerate(render_field(field, str(values.get(name, '')))):
+                current = changed.get(y + i)
+                if current is None:
+                    current = int.from_bytes(rows[y + i], 'little')
+                changed[y + i] = (current & mask) | bits
+        for i, bits in changed.items():
+            row = bits.to_bytes(ROW_BYTES, 'little')
+            if row != rows[i]:
+                rows[i] = row
+        return rows
+
+    def image(self, values=None):
+        """The label as a PIL Image, e.g. for a preview."""
+        from PIL import Image
+        from encoder import _PIL_TO_PRINTER
+
+        # The printer/PIL byte mapping is its own inverse (bit reversal and inversion)
+        packed = b''.join(self.rows(values or {})).translate(_PIL_TO_PRINTER)
+        return Image.frombytes('1', (PRINT_WIDTH, self.height), packed)
+
+
+# Absolute path -> (source modification times, LabelTemplate) for load_template()
+_templates = {}
+
+
+def _mtimes(paths):
+    try:
+        return tuple(os.path.getmtime(path) for path in paths)
+    except OSError:
+        return None
+
+
+def load_template(path, workers=1):
+    """
+    LabelTemplate.load(), kept until the JSON file or its background image changes,
+    so a long-running process (the printer daemon) prepares each template once.
+    """
+    path = os.path.abspath(path)
+    cached = _templates.get(path)
+    if cached and cached[0] is not None and _mtimes(cached[1].sources) == cached[0]:
+        return cached[1]
+    template = LabelTemplate.load(path, workers)
+    _templates[path] = (_mtimes(template.sources), template)
+    return template
+
+
+def read_records(path):
+    """Field values for each label from a CSV file whose header row names the fields."""
+    import csv
+
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
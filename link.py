@@ -0,0 +1,254 @@
+"""
+link.py - Measured BLE transport settings for MX11 printers
+
+How fast a printer takes data depends on the unit: its firmware, the negotiated
+MTU and the host's BLE stack. calibrate() prints a short standard strip several
+times and measures, per unit:
+
+- throughput: bytes per second from the first write until a status query sent
+  behind the data is answered (minus that query's idle round trip);
+- write size: how many bytes of whole commands to coalesce into one GATT write,
+  trying sizes up to the MTU and keeping the fastest that the printer kept up
+  with (a trial whose status query goes unanswered is treated as an overrun);
+- pacing: the gap to leave between writes so they arrive no faster than the
+  printer drained them, rather than piling up in its buffer mid-job.
+
+Each trial is printed, separated by a short feed, so the strip can also be
+checked by eye for streaks. The result is saved per MAC address in
+LINK_PROFILE_FILE, and Printer.connect() loads it, so every print path sends at
+that unit's measured settings. Without a profile, one command goes per write
+with no pacing, as before.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+
+LINK_PROFILE_FILE = os.path.join(os.path.expanduser('~'), '.mx11_link.json')
+# Rows printed per calibration trial
+CALIBRATION_ROWS = 64
+# Coalesced write sizes tried, capped at the MTU payload; 0 is one command per write
+CALIBRATION_SIZES = (0, 64, 128, 182, 244, 509)
+# ATT header bytes taken out of every write
+ATT_OVERHEAD = 3
+# Paper fed between trials so each one can be told apart on the strip
+TRIAL_GAP = 8
+# A trial this close to the fastest counts as a tie; the smaller write size wins
+SPEED_TOLERANCE = 0.05
+VERIFY_ATTEMPTS = 3
+
+logger = logging.getLogger('LinkCalibration')
+
+
+@dataclass
+class LinkTrial:
+    write_size: int
+    interval: float
+    writes: int
+    bytes: int
+    # Seconds spent handing the writes to the BLE stack, and until the printer caught up
+    burst: float
+    elapsed: float
+    answered: bool
+    # Idle round trip of the status query, not counted as transfer time
+    round_trip: float = 0.0
+
+    @property
+    def bytes_per_sec(self):
+        seconds = max(self.elapsed - self.round_trip, self.burst)
+        return self.bytes / seconds if seconds > 0 else 0.0
+
+    def as_dict(self):
+        return {**asdict(self), 'bytes_per_sec': self.bytes_per_sec}
+
+
+@dataclass
+class LinkProfile:
+    address: str
+    # Bytes of whole commands per write (0: one command per write) and seconds between writes
+    write_size: int = 0
+    interval: float = 0.0
+    bytes_per_sec: float = 0.0
+    mtu: int = None
+    calibrated: float = 0.0
+    trials: list = field(default_factory=list)
+
+    def as_dict(self):
+        return asdict(self)
+
+    def summary(self):
+        size = f"{self.write_size}-byte writes" if self.write_size else "one command per write"
+        return f"{size}, {self.interval * 1000:.1f} ms apart, {self.bytes_per_sec:.0f} B/s"
+
+
+def load_link_profile(address, path=LINK_PROFILE_FILE):
+    """The saved LinkProfile for `address`, or None."""
+    try:
+        with open(path, 'r') as f:
+            entry = json.load(f).get(address.upper())
+    except (OSError, ValueError):
+        return None
+    if not entry:
+        return None
+    try:
+        return LinkProfile(**entry)
+    except TypeError:
+        return None
+
+
+def save_link_profile(profile, path=LINK_PROFILE_FILE):
+    try:
+        with open(path, 'r') as f:
+            profiles = json.load(f)
+    except (OSError, ValueError):
+        profiles = {}
+    profile.address = profile.address.upper()
+    profiles[profile.address] = profile.as_dict()
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(profiles, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def coalesce(commands, write_size):
+    """
+    Packs consecutive (rows_done, command) pairs into writes of at most
+    `write_size` bytes, never splitting a command. Yields (rows_done, data) with
+    the rows_done of the last command in each write. 0 passes commands through.
+    """
+    if not write_size:
+        yield from commands
+        return
+    pending = bytearray()
+    rows_done = 0
+    for done, command in commands:
+        if pending and len(pending) + len(command) > write_size:
+            yield rows_done, bytes(pending)
+            pending.clear()
+        pending += command
+        rows_done = done
+    if pending:
+        yield rows_done, bytes(pending)
+
+
+class Pacer:
+    """Spaces writes at least `interval` seconds apart; a late write resets the schedule instead of bursting."""
+
+    def __init__(self, interval=0.0):
+        self.interval = interval
+        self._next = None
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self._next is not None and now < self._next:
+            await asyncio.sleep(self._next - now)
+            now = self._next
+        self._next = now + self.interval
+
+
+def calibration_rows(count=CALIBRATION_ROWS):
+    """
+    The standard strip: 8-row bands alternating a diagonal hatch (sent as raw
+    rows) with a thin frame (sent as short RLE rows), like mixed label content.
+    """
+    from encoder import ROW_BYTES
+
+    frame_row = b'\xff' + bytes(ROW_BYTES - 2) + b'\xff'
+    rows = []
+    for y in range(count):
+        if (y // 8) % 2:
+            rows.append(frame_row)
+        else:
+            rows.append(bytes([0x11 << (y % 4)]) * ROW_BYTES)
+    return rows
+
+
+def _write_sizes(mtu, sizes=CALIBRATION_SIZES):
+    limit = mtu - ATT_OVERHEAD
+    candidates = sorted({size for size in sizes if size <= limit} | {limit})
+    # Anything under a row command (56 bytes) would still send one command per write
+    return [size for size in candidates if size == 0 or size >= 64]
+
+
+async def _trial(printer, commands, write_size, interval, timeout, round_trip=0.0):
+    from encoder import RowEncoder
+
+    pacer = Pacer(interval)
+    writes = sent = 0
+    start = time.monotonic()
+    for _, data in coalesce(commands, write_size):
+        await pacer.wait()
+        await printer._write(data)
+        writes += 1
+        sent += len(data)
+    burst = time.monotonic() - start
+    status = await printer.query_status(timeout=timeout)
+    elapsed = time.monotonic() - start
+    if status is not None and status.no_paper:
+        raise RuntimeError('Printer is out of paper.')
+    trial = LinkTrial(write_size, interval, writes, sent, burst, elapsed, status is not None, round_trip)
+    logger.info(f"{write_size or 'per-command'} writes, {interval * 1000:.1f} ms pacing: "
+                f"{writes} writes, {sent} bytes in {elapsed:.3f}s "
+                f"({trial.bytes_per_sec:.0f} B/s){'' if trial.answered else ', no answer'}")
+    for _, command in RowEncoder(cache=None).feed_lines(TRIAL_GAP):
+        await printer._write(command)
+    return trial
+
+
+async def calibrate(printer, energy=0xffff, rows=CALIBRATION_ROWS, sizes=CALIBRATION_SIZES, timeout=5.0):
+    """
+    Measures the connected printer's link as described above and returns a
+    LinkProfile (not saved; see Printer.calibrate_link). Raises RuntimeError if
+    even one command per write goes unanswered.
+    """
+    from encoder import RowEncoder
+    from mx11 import CMD_LATTICE_END, job_preamble
+
+    mtu = getattr(printer.client, 'mtu_size', None) or 23
+    commands = list(RowEncoder(cache=None).encode_rows(calibration_rows(rows)))
+    for command in job_preamble(energy):
+        await printer._write(command)
+    try:
+        # Idle round trip of a status query, taken out of every trial
+        start = time.monotonic()
+        if await printer.query_status(timeout=timeout) is None:
+            raise RuntimeError('Printer does not answer status queries; cannot calibrate.')
+        round_trip = time.monotonic() - start
+
+        trials = []
+        for write_size in _write_sizes(mtu, sizes):
+            trial = await _trial(printer, commands, write_size, 0.0, timeout, round_trip)
+            trials.append(trial)
+            if not trial.answered:
+                # Larger writes won't do better once the printer has fallen over
+                break
+        answered = [trial for trial in trials if trial.answered]
+        if not answered:
+            raise RuntimeError('Printer stopped answering with one command per write; cannot calibrate.')
+        fastest = max(trial.bytes_per_sec for trial in answered)
+        best = min((trial for trial in answered if trial.bytes_per_sec >= fastest * (1 - SPEED_TOLERANCE)),
+                   key=lambda trial: trial.write_size)
+
+        # Space writes by how long the printer took per write beyond the time spent sending it
+        drain = max(best.elapsed - round_trip, best.burst) / best.writes
+        interval = max(0.0, drain - best.burst / best.writes)
+        for _ in range(VERIFY_ATTEMPTS):
+            verified = await _trial(printer, commands, best.write_size, interval, timeout, round_trip)
+            trials.append(verified)
+            if verified.answered:
+                break
+            interval = max(interval * 2, 0.005)
+        else:
+            raise RuntimeError(f"Printer stopped answering at {best.write_size}-byte writes even with pacing.")
+    finally:
+        await printer._write(CMD_LATTICE_END)
+
+    profile = LinkProfile(printer.address, best.write_size, interval, verified.bytes_per_sec, mtu,
+                          time.time(), [trial.as_dict() for trial in trials])
+    logger.info(f"Link profile for {printer.address}: {profile.summary()}")
+    return profile
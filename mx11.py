@@ -8,21 +8,25 @@ Features reverse-engineered from the Fun Print Android application.
 
 import asyncio
 import io
+import itertools
 import logging
+import time
 from dataclasses import dataclass
-from PIL import Image
-from bleak import BleakClient
-import numpy as np
+from functools import lru_cache
+from protocol import (
+    OP_PRINT_ROW_RAW, OP_PRINT_ROW_RLE, apply_energy_frame, crc8, energy_frame, feed_frame, frame, speed_command,
+)
 
 # Constants
 PRINT_WIDTH = 384
+# Speed sent at the start of every job (lower = faster)
+JOB_SPEED = 8
 TX_CHARACTERISTIC_UUID = "0000ae01-0000-1000-8000-00805f9b34fb" # Write
 RX_CHARACTERISTIC_UUID = "0000ae02-0000-1000-8000-00805f9b34fb" # Notify
 
 # --- Commands from APK Analysis (V5G Family) ---
 CMD_GET_STATUS = b'\x51\x78\xa3\x00\x01\x00\x00\x00\xff'
 CMD_GET_SERIAL = b'\x51\x78\xa8\x00\x01\x00\x00\x00\xff'
-CMD_SET_SPEED_PREFIX = b'\x51\x78\xf1\x00\x01\x00'
 CMD_SET_CONCENTRATION_PREFIX = b'\x51\x78\xf2\x00\x02\x00'
 CMD_LABEL_CALIBRATE_PREFIX = b'\x51\x78\xf0\x00\x03\x00'
 CMD_FEED_PAPER_PREFIX = b'\x51\x78\xf0\x00\x02\x00'
@@ -45,6 +49,9 @@ CMD_BATTERY_LEVEL = b'\x51\x78\xab\x00\x01\x00\x00\xff'
 CMD_GET_PRINT_TYPE = b'\x51\x78\xb0\x00\x01\x00\x00\xff'
 CMD_GET_VERSION = b'\x51\x78\xb1\x00\x01\x00\x00\xff'
 
+# How long get_device_info() serves a cached answer before asking the printer again
+DEVICE_INFO_TTL = 10.0
+
 @dataclass
 class PrinterProfile:
     """Holds settings for a specific printer model group."""
@@ -59,45 +66,173 @@ V5G_PROFILE = PrinterProfile(
     supports_labels=True
 )
 
+@dataclass
+class PrintProgress:
+    """Snapshot of a running print job, handed to print_image's on_progress hook."""
+    rows_encoded: int
+    rows_total: int
+    bytes_sent: int
+    elapsed: float
+
+    @property
+    def rows_per_sec(self):
+        return self.rows_encoded / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def bytes_per_sec(self):
+        return self.bytes_sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """Estimated seconds until the last row is sent, or None before the first row."""
+        rate = self.rows_per_sec
+        if not rate:
+            return None
+        return (self.rows_total - self.rows_encoded) / rate
+
+    def as_dict(self):
+        return {
+            'rows_encoded': self.rows_encoded,
+            'rows_total': self.rows_total,
+            'bytes_sent': self.bytes_sent,
+            'elapsed': self.elapsed,
+            'rows_per_sec': self.rows_per_sec,
+            'bytes_per_sec': self.bytes_per_sec,
+            'eta': self.eta,
+        }
+
+@dataclass
+class Feed:
+    """Blank paper in a print_many batch."""
+    lines: int
+
+@dataclass
+class Text:
+    """A text block in a print_many batch, rendered with image_convert.text_to_image."""
+    text: str
+    font_name: str = 'arial.ttf'
+    font_size: int = 20
+
+@dataclass
+class PrinterStatus:
+    """Decoded status byte of a CMD_GET_STATUS response."""
+    flags: int
+
+    @property
+    def ok(self):
+        return self.flags == 0
+
+    @property
+    def no_paper(self):
+        return bool(self.flags & 0b00000001)
+
+    @property
+    def overheating(self):
+        return bool(self.flags & 0b00000100)
+
+    @property
+    def low_battery(self):
+        return bool(self.flags & 0b00001000)
+
+    def as_dict(self):
+        return {
+            'flags': self.flags,
+            'ok': self.ok,
+            'no_paper': self.no_paper,
+            'overheating': self.overheating,
+            'low_battery': self.low_battery,
+        }
+
+@dataclass
+class DeviceInfo:
+    """Everything get_device_info() learned in one round; fields the printer didn't answer are None."""
+    address: str
+    status: PrinterStatus = None
+    serial: str = None
+    battery: int = None
+    firmware: str = None
+    print_type: int = None
+    fetched: float = 0.0
+    elapsed: float = 0.0
+
+    def as_dict(self):
+        return {
+            'address': self.address,
+            'status': self.status.as_dict() if self.status else None,
+            'serial': self.serial,
+            'battery': self.battery,
+            'firmware': self.firmware,
+            'print_type': self.print_type,
+            'fetched': self.fetched,
+            'elapsed': self.elapsed,
+        }
+
+def response_payload(response):
+    """The payload of a response frame, using the length in bytes 4-5."""
+    length = response[4] | (response[5] << 8)
+    return bytes(response[6:6 + length])
+
+def parse_status(response):
+    # Shorter answers come from printers that aren't V5G-family
+    return PrinterStatus(response[6]) if len(response) >= 10 else None
+
+def parse_serial(response):
+    return response[6:-2].decode('ascii')
+
+def parse_battery(response):
+    """Battery charge in percent."""
+    payload = response_payload(response)
+    return payload[0] if payload else None
+
+def parse_version(response):
+    """Firmware version: the payload as text if printable, else its bytes joined by dots."""
+    payload = response_payload(response)
+    if payload and all(0x20 <= b < 0x7f for b in payload):
+        return payload.decode('ascii')
+    return '.'.join(str(b) for b in payload) or None
+
+def parse_print_type(response):
+    payload = response_payload(response)
+    return payload[0] if payload else None
+
+# DeviceInfo field -> (query, parser) for get_device_info()
+DEVICE_INFO_QUERIES = {
+    'status': (CMD_GET_STATUS, parse_status),
+    'serial': (CMD_GET_SERIAL, parse_serial),
+    'battery': (CMD_BATTERY_LEVEL, parse_battery),
+    'firmware': (CMD_GET_VERSION, parse_version),
+    'print_type': (CMD_GET_PRINT_TYPE, parse_print_type),
+}
+
 def to_unsigned_byte(val):
     return val if val >= 0 else val & 0xff
 
 def bs(lst):
     return bytearray(map(to_unsigned_byte, lst))
 
-CHECKSUM_TABLE = bs([
-    0, 7, 14, 9, 28, 27, 18, 21, 56, 63, 54, 49, 36, 35, 42, 45, 112, 119, 126, 121,
-    108, 107, 98, 101, 72, 79, 70, 65, 84, 83, 90, 93, -32, -25, -18, -23, -4, -5,
-    -14, -11, -40, -33, -42, -47, -60, -61, -54, -51, -112, -105, -98, -103, -116,
-    -117, -126, -123, -88, -81, -90, -95, -76, -77, -70, -67, -57, -64, -55, -50,
-    -37, -36, -43, -46, -1, -8, -15, -10, -29, -28, -19, -22, -73, -80, -71, -66,
-    -85, -84, -91, -94, -113, -120, -127, -122, -109, -108, -99, -102, 39, 32, 41,
-    46, 59, 60, 53, 50, 31, 24, 17, 22, 3, 4, 13, 10, 87, 80, 89, 94, 75, 76, 69, 66,
-    111, 104, 97, 102, 115, 116, 125, 122, -119, -114, -121, -128, -107, -110, -101,
-    -100, -79, -74, -65, -72, -83, -86, -93, -92, -7, -2, -9, -16, -27, -30, -21, -20,
-    -63, -58, -49, -56, -35, -38, -45, -44, 105, 110, 103, 96, 117, 114, 123, 124, 81,
-    86, 95, 88, 77, 74, 67, 68, 25, 30, 23, 16, 5, 2, 11, 12, 33, 38, 47, 40, 61, 58,
-    51, 52, 78, 73, 64, 71, 82, 85, 92, 91, 118, 113, 120, 127, 106, 109, 100, 99, 62,
-    57, 48, 55, 34, 37, 44, 43, 6, 1, 8, 15, 26, 29, 20, 19, -82, -87, -96, -89, -78,
-    -75, -68, -69, -106, -111, -104, -97, -118, -115, -124, -125, -34, -39, -48, -41,
-    -62, -59, -52, -53, -26, -31, -24, -17, -6, -3, -12, -13,
-])
-
 def chk_sum(b_arr, i, i2):
-    b2 = 0
-    for i3 in range(i, i + i2):
-        b2 = CHECKSUM_TABLE[(b2 ^ b_arr[i3]) & 0xff]
-    return b2
+    return crc8(memoryview(b_arr)[i:i + i2])
 
 def cmd_set_energy(val):
-    b_arr = bs([81, 120, -81, 0, 2, 0, (val >> 8) & 0xff, val & 0xff, 0, 0xff])
-    b_arr[8] = chk_sum(b_arr, 6, 2)
-    return bs(b_arr)
+    return energy_frame(val)
 
 def cmd_apply_energy():
-    b_arr = bs([81, 120, -66, 0, 1, 0, 1, 0, 0xff])
-    b_arr[7] = chk_sum(b_arr, 6, 1)
-    return bs(b_arr)
+    return apply_energy_frame()
+
+def cmd_feed_paper(lines):
+    return feed_frame(lines)
+
+@lru_cache(maxsize=16)
+def job_preamble(energy):
+    """Commands sent before the first row of a job, built once per energy value."""
+    return (
+        CMD_SET_QUALITY_200_DPI,
+        speed_command(JOB_SPEED),  # Cat-Printer uses 8 for feeding (lower = faster)
+        energy_frame(0xffff),  # Max concentration for darker print
+        energy_frame(energy),
+        apply_energy_frame(),
+        CMD_LATTICE_START,
+    )
 
 def encode_run_length_repetition(n, val):
     res = []
@@ -137,14 +272,9 @@ def cmd_print_row(img_row):
     encoded_img = run_length_encode(img_row)
     
     if len(encoded_img) > PRINT_WIDTH // 8:
-        encoded_img = byte_encode(img_row)
-        b_arr = bs([81, 120, -94, 0, len(encoded_img), 0] + encoded_img + [0, 0xff])
-        b_arr[-2] = chk_sum(b_arr, 6, len(encoded_img))
-        return b_arr
+        return frame(OP_PRINT_ROW_RAW, bytes(byte_encode(img_row)))
     
-    b_arr = bs([81, 120, -65, 0, len(encoded_img), 0] + encoded_img + [0, 0xff])
-    b_arr[-2] = chk_sum(b_arr, 6, len(encoded_img))
-    return b_arr
+    return frame(OP_PRINT_ROW_RLE, bytes(encoded_img))
 
 
 class Printer:
@@ -158,9 +288,24 @@ class Printer:
         except Exception as e:
             self.logger.error(f"Calibration failed: {e}")
             return None
-    def __init__(self, address, log_level=logging.WARNING):
+    def __init__(self, address, log_level=logging.WARNING, tracer=None):
         self.address = address
         self.client = None
+        # Optional tracer.TrafficTracer recording every TX/RX frame
+        self.tracer = tracer
+        # GATT characteristics resolved once per connection (see _resolve_characteristics)
+        self._tx = None
+        self._rx = None
+        self._tx_needs_response = False
+        # (opcode, future) per request waiting on the notification channel
+        self._waiters = []
+        # Last get_device_info() result and when it was fetched (monotonic)
+        self._device_info = None
+        self._device_info_at = 0.0
+        # link.LinkProfile with this unit's measured write size and pacing, loaded on connect
+        self.link = None
+        # resume.TrackedJob cut short by a failed write, for resume_job()
+        self.interrupted = None
         self.profile = V5G_PROFILE # Assume V5G profile for MX11
         self.logger = logging.getLogger(f"Printer[{self.address}]")
         self.logger.setLevel(log_level)
@@ -171,34 +316,165 @@ class Printer:
             self.logger.addHandler(handler)
 
     async def connect(self):
-        self.client = BleakClient(self.address)
-        await self.client.connect()
+        """
+        Connects using what discovery.py knows about the printer: the BLEDevice from a
+        scan in this process (no second scan) and the cached GATT service (discovery
+        limited to it). Falls back to a plain connect if that data turns out stale.
+        """
+        from discovery import cached_device, cached_printer, forget, remember_connection
+        cached = cached_printer(self.address)
+        services = [cached.service_uuid] if cached and cached.service_uuid else None
+        device = cached_device(self.address)
+        try:
+            await self._open_client(device or self.address, services)
+        except Exception as e:
+            if not (device or services):
+                raise
+            self.logger.info(f"Connecting from cached device data failed ({e}), retrying with a full scan")
+            forget(self.address)
+            await self._open_client(self.address, None)
+        remember_connection(self.address, self.client, TX_CHARACTERISTIC_UUID, RX_CHARACTERISTIC_UUID)
         self.logger.info(f"Connected to {self.address}")
+        if self.link is None:
+            from link import load_link_profile
+            self.link = load_link_profile(self.address)
+            if self.link:
+                self.logger.info(f"Using calibrated link profile: {self.link.summary()}")
+
+    async def _open_client(self, device, services):
+        from bleak import BleakClient
+        self.client = BleakClient(device, services=services)
+        await self.client.connect()
+        try:
+            self._resolve_characteristics()
+        except RuntimeError:
+            await self.client.disconnect()
+            raise
+        # One notification subscription for the whole connection; see _on_notification
+        self._waiters = []
+        await self.client.start_notify(self._rx, self._on_notification)
+
+    def _resolve_characteristics(self):
+        """Looks up TX/RX once so writes don't go through the services collection per row."""
+        services = self.client.services
+        self._tx = services.get_characteristic(TX_CHARACTERISTIC_UUID)
+        self._rx = services.get_characteristic(RX_CHARACTERISTIC_UUID)
+        if self._tx is None or self._rx is None:
+            raise RuntimeError(f"{self.address} has no V5G TX/RX characteristics")
+        if 'notify' not in self._rx.properties:
+            raise RuntimeError(f"RX characteristic of {self.address} does not support notifications")
+        self._tx_needs_response = 'write-without-response' not in self._tx.properties
+        if self._tx_needs_response:
+            self.logger.warning("TX characteristic lacks write-without-response; every write will wait for an acknowledgement")
 
     async def disconnect(self):
         if self.client and self.client.is_connected:
             await self.client.disconnect()
             self.logger.info(f"Disconnected from {self.address}")
+        self._tx = self._rx = None
 
     async def _write(self, data: bytes, response: bool = False):
         """Logs and writes data to the printer."""
-        self.logger.debug(f"TX: {data.hex()}")
-        await self.client.write_gatt_char(TX_CHARACTERISTIC_UUID, data, response=response)
-
-    async def _write_with_response(self, data: bytes):
-        """Writes data, logs it, and waits for a single notification, which is also logged."""
-        future = asyncio.get_event_loop().create_future()
-        def notification_handler(sender, response_data):
-            self.logger.debug(f"RX: {response_data.hex()}")
-            if not future.done():
-                future.set_result(response_data)
-        await self.client.start_notify(RX_CHARACTERISTIC_UUID, notification_handler)
-        await self._write(data)
+        if self.tracer is not None:
+            self.tracer.tx(data)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"TX: {data.hex()}")
+        await self.client.write_gatt_char(self._tx, data, response=response or self._tx_needs_response)
+
+    def _on_notification(self, sender, data):
+        """
+        Hands a notification to the request waiting for its opcode (byte 2), or to the
+        only waiting request if none matches. With several queries in flight an answer
+        under an unexpected opcode can't be attributed, so it is only logged, like
+        anything unsolicited.
+        """
+        if self.tracer is not None:
+            self.tracer.rx(data)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"RX: {data.hex()}")
+        waiting = [waiter for waiter in self._waiters if not waiter[1].done()]
+        if not waiting:
+            self.logger.debug(f"Unsolicited notification: {data.hex()}")
+            return
+        opcode = data[2] if len(data) > 2 else None
+        future = next((f for op, f in waiting if op == opcode), None)
+        if future is None:
+            if len(waiting) > 1:
+                self.logger.debug(f"Unmatched notification with {len(waiting)} requests pending: {data.hex()}")
+                return
+            future = waiting[0][1]
+        future.set_result(bytes(data))
+
+    async def _write_with_response(self, data: bytes, timeout: float = 5.0):
+        """Writes data, logs it, and waits for the notification answering it, which is also logged."""
+        waiter = (data[2], asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
         try:
-            response = await asyncio.wait_for(future, timeout=5.0)
+            await self._write(data)
+            return await asyncio.wait_for(waiter[1], timeout=timeout)
         finally:
-            await self.client.stop_notify(RX_CHARACTERISTIC_UUID)
-        return response
+            self._waiters.remove(waiter)
+
+    async def _query_many(self, commands, timeout: float = 2.0):
+        """
+        Writes all commands back to back, then waits for their answers together.
+        Returns the responses in command order, None for any not answered within timeout.
+        """
+        loop = asyncio.get_running_loop()
+        waiters = [(command[2], loop.create_future()) for command in commands]
+        self._waiters.extend(waiters)
+        try:
+            for command in commands:
+                await self._write(command)
+            await asyncio.wait([future for _, future in waiters], timeout=timeout)
+        finally:
+            for waiter in waiters:
+                self._waiters.remove(waiter)
+                if not waiter[1].done():
+                    waiter[1].cancel()
+        return [None if future.cancelled() else future.result() for _, future in waiters]
+
+    def cached_device_info(self, max_age: float = DEVICE_INFO_TTL):
+        """The last get_device_info() result if younger than max_age seconds, else None."""
+        if self._device_info and time.monotonic() - self._device_info_at < max_age:
+            return self._device_info
+        return None
+
+    async def get_device_info(self, max_age: float = DEVICE_INFO_TTL, timeout: float = 2.0):
+        """
+        Status, serial, battery, firmware version and print type in one round trip:
+        all queries go out back to back and the answers are matched by opcode as they
+        arrive. Results younger than max_age seconds are served from cache.
+        """
+        cached = self.cached_device_info(max_age)
+        if cached:
+            return cached
+        started = time.monotonic()
+        responses = await self._query_many([query for query, _ in DEVICE_INFO_QUERIES.values()], timeout=timeout)
+        info = DeviceInfo(self.address, fetched=time.time())
+        for (field, (_, parse)), response in zip(DEVICE_INFO_QUERIES.items(), responses):
+            if response is None:
+                self.logger.debug(f"No answer for {field}")
+                continue
+            try:
+                setattr(info, field, parse(response))
+            except Exception as e:
+                self.logger.warning(f"Could not decode {field} from {response.hex()}: {e}")
+        info.elapsed = time.monotonic() - started
+        self._device_info = info
+        self._device_info_at = time.monotonic()
+        return info
+
+    async def query_status(self, timeout: float = 5.0):
+        """Returns the printer's PrinterStatus, or None if the response was missing or short."""
+        try:
+            response = await self._write_with_response(CMD_GET_STATUS, timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        self.logger.debug(f"Status response: {response.hex()}")
+        if len(response) < 10:
+            return None
+        return PrinterStatus(response[6])
 
     async def get_status(self):
         """Queries the printer status. This is a good way to test if it's a V5G printer."""
@@ -209,15 +485,15 @@ class Printer:
             if len(response) < 10:
                 self.logger.warning("Received a short status response. May not be a V5G printer.")
                 return False
-            status_byte = response[6]
-            if status_byte == 0x00:
+            status = PrinterStatus(response[6])
+            if status.ok:
                 self.logger.info("Status: OK")
                 return True
-            if status_byte & 0b00000001:
+            if status.no_paper:
                 self.logger.error("Error: No paper")
-            if status_byte & 0b00000100:
+            if status.overheating:
                 self.logger.error("Error: Overheating")
-            if status_byte & 0b00001000:
+            if status.low_battery:
                 self.logger.error("Error: Low battery")
             return False
         except asyncio.TimeoutError:
@@ -241,14 +517,11 @@ class Printer:
 
     async def set_speed(self, speed: int):
         """Sets the print speed."""
-        command = CMD_SET_SPEED_PREFIX + speed.to_bytes(1, 'big') + CMD_SUFFIX
-        await self._write(command)
+        await self._write(speed_command(speed))
 
     async def set_concentration(self, concentration: int = 0xffff):
         """Sets the print concentration/density."""
-        b_arr = bs([81, 120, -81, 0, 2, 0, (concentration >> 8) & 0xff, concentration & 0xff, 0, 0xff])
-        b_arr[8] = chk_sum(b_arr, 6, 2)
-        await self._write(bs(b_arr))
+        await self._write(energy_frame(concentration))
 
     async def feed_paper(self, lines: int = 1):
         """Sends a command to feed the paper by a specified number of lines/units."""
@@ -258,11 +531,10 @@ class Printer:
 
     def _cmd_feed_paper(self, lines: int = 1):
         """Returns the command to feed the paper by a specified number of lines/units."""
-        b_arr = bs([81, 120, -95, 0, 2, 0, lines & 0xff, 0, 0, 0xff])
-        b_arr[8] = chk_sum(b_arr, 6, 2)
-        return b_arr
+        return cmd_feed_paper(lines)
 
     def load_and_prepare_image(self, path, binarization='floyd-steinberg'):
+        import numpy as np
         from image_convert import preprocess_image
         
         # Use the preprocess_image function that has all the algorithms
@@ -301,48 +573,336 @@ class Printer:
                 adjust_pixel(y + 1, x + 1, int(err * 1/16))
         return img
 
-    async def print_image(self, image_path, binarization='floyd-steinberg', energy: int = 0xffff, extra_feed: int = 0, process: bool = True):
-        if not self.client or not self.client.is_connected:
-            self.logger.error("Not connected to printer.")
-            return
-        self.logger.info("--- Starting Print Job ---")
+    def _encode_image(self, image_path, binarization='floyd-steinberg', process: bool = True,
+                      encoding: str = 'adaptive', skip_blank: bool = False, trim: bool = False, workers: int = 1):
+        """
+        Loads, dithers and packs an image (a path or a PIL Image). Returns (encoder,
+        rows) ready for encoder.encode_rows(). Without `process`, binary PBM and raw
+        packed-row files are memory-mapped and skip PIL entirely (see load_packed).
+        """
+        from encoder import BLANK_FEED_MIN, RowEncoder, is_packed, load_packed, pack_image, split_rows
+
+        encoder = RowEncoder(mode=encoding, blank_feed_min=BLANK_FEED_MIN if skip_blank else None, trim=trim)
         if process:
-            img = self.load_and_prepare_image(image_path, binarization=binarization)
+            from image_convert import preprocess_image
+            img = preprocess_image(image_path, width=PRINT_WIDTH, dither=binarization, workers=workers)
         else:
             from PIL import Image
-            import numpy as np
-            img = Image.open(image_path)
-            if img.mode != '1':
-                img = img.convert('1')
-            if img.width != PRINT_WIDTH:
-                raise ValueError(f"Image width must be {PRINT_WIDTH} pixels, got {img.width}.")
-            img_array = np.array(img, dtype=np.uint8)
-            # Convert to 0/1 as expected by cmd_print_row
-            binary = (img_array == 0)
-            out = []
-            for y in range(binary.shape[0]):
-                row = [1 if binary[y, x] else 0 for x in range(binary.shape[1])]
-                # Validate row values
-                if not all(v in (0, 1) for v in row):
-                    raise ValueError(f"Row contains non-binary values: {row}")
-                out.append(row)
-            img = out
-        self.logger.info("Initializing printer...")
-        await self._write(CMD_SET_QUALITY_200_DPI)
-        await self.set_speed(8)  # Cat-Printer uses 8 for feeding (lower = faster)
-        await self.set_concentration(0xffff)  # Max concentration for darker print
-        await self._write(cmd_set_energy(energy))
-        await self._write(cmd_apply_energy())
-        await self._write(CMD_LATTICE_START)
+            if not isinstance(image_path, Image.Image) and is_packed(image_path):
+                return encoder, encoder.trim(load_packed(image_path))
+            img = image_path if isinstance(image_path, Image.Image) else Image.open(image_path)
+        rows = encoder.trim(split_rows(pack_image(img)))
+        return encoder, rows
+
+    async def print_image(self, image_path, binarization='floyd-steinberg', energy: int = 0xffff, extra_feed: int = 0, process: bool = True,
+                          on_progress=None, encoding: str = 'adaptive', skip_blank: bool = False, trim: bool = False,
+                          thermal=None, bands: bool = False, workers: int = 1):
+        """
+        Prints an image file, then feeds `extra_feed` lines. `on_progress`, if given,
+        is called with a PrintProgress after every command is written. `encoding`
+        picks the RowEncoder mode,
+        `skip_blank` feeds paper over runs of white rows instead of printing them and
+        `trim` drops white rows at the top and bottom. `thermal` (a ThermalScheduler,
+        or True for the default one) polls status during the job and throttles on
+        overheating. `bands` varies energy and speed with each band's black-dot
+        density (see bands.py); with `thermal` too, band energies are scaled from the
+        scheduler's current limit.
+        `workers` > 1 dithers tall images in parallel strips (see preprocess_image).
+        Returns the job's EncodeStats. If the link drops mid-job the job can be
+        continued with resume_job() after reconnecting.
+        """
+        from resume import TrackedJob
 
-        # Use Cat-Printer style: send one line at a time (48 bytes per line)
+        if not self.client or not self.client.is_connected:
+            self.logger.error("Not connected to printer.")
+            return
+        self.logger.info("--- Starting Print Job ---")
+        # A new job replaces whatever an earlier one left to resume
+        self.interrupted = None
+        encoder, rows = self._encode_image(image_path, binarization, process, encoding, skip_blank, trim, workers)
+        # Cat-Printer style one row command per write, unless the link profile coalesces them
         bytes_per_line = PRINT_WIDTH // 8  # 384 // 8 = 48 bytes
-        self.logger.info(f"Sending {len(img)} rows, {bytes_per_line} bytes per line...")
+        self.logger.info(f"Sending {len(rows)} rows, {bytes_per_line} bytes per line...")
+        thermal = self._thermal_scheduler(thermal, energy)
+        commands = self._job_commands(encoder, rows, energy, bands, thermal=thermal)
+        if extra_feed:
+            feed = ((len(rows) + lines_done, command) for lines_done, command in encoder.feed_lines(extra_feed))
+            commands = itertools.chain(commands, feed)
+        job = TrackedJob(commands, len(rows) + extra_feed, energy, encoder.stats, thermal=thermal)
+        await self._send_job(job, on_progress)
+        self.logger.info(f"Encoding: {encoder.stats.summary()}")
+        return encoder.stats
+
+    def export_job(self, path, image_path, binarization='floyd-steinberg', energy: int = 0xffff, process: bool = True,
+                   encoding: str = 'adaptive', skip_blank: bool = False, trim: bool = False, write_size: int = None,
+                   bands: bool = False, workers: int = 1):
+        """
+        Encodes an image exactly as print_image would send it and saves the command
+        stream as a prepared job (see jobfile.py) for play_job. No connection needed.
+        `write_size` packs commands into writes of at most that many bytes. Returns
+        the job's EncodeStats.
+        """
+        from jobfile import write_job
+
+        encoder, rows = self._encode_image(image_path, binarization, process, encoding, skip_blank, trim, workers)
+        commands = [(0, command) for command in job_preamble(energy)]
+        done = 0
+        for rows_done, command in self._job_commands(encoder, rows, energy, bands):
+            commands.append((rows_done - done, command))
+            done = rows_done
+        settings = {
+            'source': str(image_path),
+            'binarization': binarization if process else None,
+            'energy': energy,
+            'encoding': encoding,
+            'skip_blank': skip_blank,
+            'trim': trim,
+            'bands': bands,
+            'rows': len(rows),
+            'created': time.time(),
+            'stats': encoder.stats.as_dict(),
+        }
+        records = write_job(path, commands, settings=settings, write_size=write_size)
+        self.logger.info(f"Exported {len(rows)} rows in {records} writes to {path}: {encoder.stats.summary()}")
+        return encoder.stats
+
+    def _job_commands(self, encoder, rows, energy, bands=False, restore=False, thermal=None):
+        """
+        (rows_done, command) for every row command, with band switches if `bands`
+        (and the job's energy/speed set back afterwards if `restore`), their energy
+        set by `thermal` if the job has a ThermalScheduler.
+        """
+        commands = encoder.encode_rows(rows)
+        if not bands:
+            return commands
+        from bands import apply_bands, plan_bands
+        plan = plan_bands(rows, energy)
+        self.logger.info(f"Band plan: {len(plan)} energy/speed settings over {len(rows)} rows")
+        return apply_bands(commands, plan, energy, restore=restore, thermal=thermal)
+
+    async def print_many(self, items, binarization='floyd-steinberg', energy: int = 0xffff, separator=None,
+                         extra_feed: int = 0, process: bool = True, on_progress=None, encoding: str = 'adaptive',
+                         skip_blank: bool = False, trim: bool = False, thermal=None, bands: bool = False,
+                         workers: int = 1):
+        """
+        Prints a batch as one job: one preamble, one lattice start/end, one session.
+        `items` are image paths or PIL Images, Text blocks, Feed gaps, labels.Label
+        items (LabelTemplate.label(), encoded from the template's prepared rows) and
+        barcodes.Barcode / barcodes.QRCode items (drawn at printer resolution). `separator`
+        goes between items: a number of lines to feed, or an item such as a Text rule.
+        `extra_feed` lines are fed after the last item. The other options work as in
+        print_image. `encoding` and `bands` apply to every item; `binarization`,
+        `process`, `workers`, `skip_blank` and `trim` only to image and text items.
+        Labels and barcodes keep their prepared rows as they are: their exact height
+        matters on label stock and quiet zones must stay. Returns the combined
+        EncodeStats.
+        """
+        from barcodes import Barcode, QRCode
+        from encoder import EncodeStats, RowEncoder
+        from labels import Label
+        from resume import TrackedJob
+
+        if not self.client or not self.client.is_connected:
+            self.logger.error("Not connected to printer.")
+            return
+        self.interrupted = None
+        items = list(items)
+        if separator is not None and len(items) > 1:
+            gap = Feed(separator) if isinstance(separator, int) else separator
+            items = [part for item in items for part in (gap, item)][1:]
+        if extra_feed:
+            items.append(Feed(extra_feed))
+        self.logger.info(f"--- Starting Batch Job ({len(items)} items) ---")
+
+        # Encode everything first so progress has a total and nothing stalls mid-job
+        jobs = []
+        for item in items:
+            if isinstance(item, Feed):
+                jobs.append((RowEncoder(), None, item.lines))
+                continue
+            if isinstance(item, Label):
+                encoder, rows = item.encode(encoding)
+                jobs.append((encoder, rows, len(rows)))
+                continue
+            if isinstance(item, (Barcode, QRCode)):
+                rows = item.rows()
+                jobs.append((RowEncoder(mode=encoding), rows, len(rows)))
+                continue
+            if isinstance(item, Text):
+                from image_convert import text_to_image
+                item = text_to_image(item.text, font_name=item.font_name, font_size=item.font_size)
+            encoder, rows = self._encode_image(item, binarization, process, encoding, skip_blank, trim, workers)
+            jobs.append((encoder, rows, len(rows)))
+        rows_total = sum(count for _, _, count in jobs)
+        stats = EncodeStats()
+        thermal = self._thermal_scheduler(thermal, energy)
+        job = TrackedJob(self._batch_commands(jobs, energy, bands, stats, thermal), rows_total, energy, stats,
+                         trailer=[CMD_LATTICE_END], thermal=thermal)
+        await self._send_job(job, on_progress)
+        self.logger.info(f"Encoding: {stats.summary()}")
+        return stats
+
+    def _batch_commands(self, jobs, energy, bands, stats, thermal=None):
+        """print_many's items as one (rows_done, command) stream, each item's stats merged as it ends."""
+        done = 0
+        for encoder, rows, count in jobs:
+            if rows is None:
+                commands = encoder.feed_lines(count)
+            else:
+                commands = self._job_commands(encoder, rows, energy, bands, restore=True, thermal=thermal)
+            for rows_done, command in commands:
+                yield done + rows_done, command
+            stats.merge(encoder.stats)
+            done += count
+
+    async def _send_job(self, job, on_progress=None):
+        """
+        Writes a resume.TrackedJob: the preamble, its commands as the link profile
+        packs and paces them, then its trailer. The job's ThermalScheduler may stop
+        the rows early.
+        If a write fails on a transport error (resume.transport_errors()) the job is
+        kept as self.interrupted for resume_job(); any error is raised.
+        """
+        from resume import transport_errors
+
+        thermal = job.thermal
+        pacer = self._pacer()
+        bytes_sent = 0
+        start = time.monotonic()
+        try:
+            self.logger.info("Initializing printer...")
+            for command in job_preamble(job.energy):
+                await self._write(command)
+            for rows_done, data in self._link_writes(job.commands()):
+                await pacer.wait()
+                await self._write(data)
+                job.rows_sent = rows_done
+                if thermal and thermal.due(rows_done) and not await thermal.check(self, rows_done):
+                    self.logger.error(f"Print stopped after {rows_done} of {job.rows_total} rows.")
+                    break
+                if on_progress:
+                    bytes_sent += len(data)
+                    on_progress(PrintProgress(rows_done, job.rows_total, bytes_sent, time.monotonic() - start))
+            for command in job.trailer:
+                await self._write(command)
+        except transport_errors() as e:
+            self.interrupted = job
+            self.logger.error(f"Print interrupted after {job.rows_sent} of {job.rows_total} rows: {e}")
+            raise
+        self.interrupted = None
+
+    async def resume_job(self, overlap: int = None, on_progress=None, thermal=None):
+        """
+        Continues the job a failed write interrupted (self.interrupted), on the current
+        connection: preamble and lattice start again, then the job's encoded commands
+        from `overlap` rows (default resume.RESUME_OVERLAP) before the last row that
+        went out. `thermal` applies if the job had no ThermalScheduler; one it had
+        carries on with its current limit. Returns the job's EncodeStats.
+        """
+        from resume import RESUME_OVERLAP
+
+        job = self.interrupted
+        if job is None:
+            self.logger.error("No interrupted print job to resume.")
+            return
+        if not self.client or not self.client.is_connected:
+            self.logger.error("Not connected to printer.")
+            return
+        restart_row = job.restart(RESUME_OVERLAP if overlap is None else overlap)
+        self.logger.info(f"--- Resuming Print Job after row {restart_row} of {job.rows_total} "
+                         f"({job.rows_sent} were sent) ---")
+        if not job.thermal:
+            job.thermal = self._thermal_scheduler(thermal, job.energy)
+        await self._send_job(job, on_progress)
+        if job.stats is not None:
+            self.logger.info(f"Encoding: {job.stats.summary()}")
+        return job.stats
+
+    def _thermal_scheduler(self, thermal, energy):
+        if thermal is True:
+            from thermal import ThermalScheduler
+            thermal = ThermalScheduler()
+        if thermal:
+            thermal.start(energy)
+        return thermal
 
-        for i, row in enumerate(img):
-            row_command = cmd_print_row(row)
-            await self._write(row_command)
-            # No delay - keep consistent timing like Cat-Printer
+    def _write_limit(self):
+        """Largest write this connection's MTU carries, or None if the client does not say."""
+        from link import ATT_OVERHEAD
+
+        mtu = getattr(self.client, 'mtu_size', None)
+        return mtu - ATT_OVERHEAD if mtu else None
+
+    def _link_writes(self, commands, write_size=None):
+        """
+        Coalesces (rows_done, command) pairs into writes of `write_size` bytes (the
+        link profile's if None), capped at what this connection's MTU carries.
+        """
+        from link import coalesce
+
+        if write_size is None:
+            write_size = self.link.write_size if self.link else 0
+        limit = self._write_limit()
+        if write_size and limit and write_size > limit:
+            self.logger.info(f"Write size {write_size} capped at {limit} by this connection's MTU")
+            write_size = limit
+        return coalesce(commands, write_size)
+
+    def _pacer(self):
+        from link import Pacer
+        return Pacer(self.link.interval if self.link else 0.0)
+
+    async def calibrate_link(self, save: bool = True, **options):
+        """
+        Runs link.calibrate() on this printer, uses the resulting LinkProfile from now
+        on and, if `save`, stores it for later connects. Prints a short test strip.
+        """
+        from link import calibrate, save_link_profile
+
+        if not self.client or not self.client.is_connected:
+            self.logger.error("Not connected to printer.")
+            return
+        self.link = await calibrate(self, **options)
+        if save:
+            save_link_profile(self.link)
+        self.logger.info(f"Link profile: {self.link.summary()}")
+        return self.link
+
+    async def play_job(self, path, on_progress=None, thermal=None):
+        """
+        Replays a prepared job file written by export_job, one record per write.
+        `thermal` works as in print_image.
+        """
+        from jobfile import JobFile
+
+        if not self.client or not self.client.is_connected:
+            self.logger.error("Not connected to printer.")
+            return
+        with JobFile(path) as job:
+            rows_total = job.settings.get('rows', 0)
+            self.logger.info(f"--- Replaying prepared job {path} ({rows_total} rows, {job.record_count} writes) ---")
+            bytes_sent = 0
+            thermal = self._thermal_scheduler(thermal, job.settings.get('energy', 0xffff))
+            pacer = self._pacer()
+            limit = self._write_limit()
+            if not job.write_size:
+                records = self._link_writes(job.records())
+            elif not limit or job.write_size <= limit:
+                # A job packed at export time keeps its own write units when they fit
+                records = job.records()
+            else:
+                # Packed for a larger MTU than this connection's: split and re-pack
+                records = self._link_writes(job.commands(), job.write_size)
+            start = time.monotonic()
+            for rows_done, record in records:
+                await pacer.wait()
+                await self._write(record)
+                if thermal and thermal.due(rows_done) and not await thermal.check(self, rows_done):
+                    self.logger.error(f"Print stopped after {rows_done} of {rows_total} rows.")
+                    break
+                if on_progress:
+                    bytes_sent += len(record)
+                    on_progress(PrintProgress(rows_done, rows_total, bytes_sent, time.monotonic() - start))
 
     async def print_image_no_chunks(self, img, energy: int = 0xffff, extra_feed: int = 0):
         """Print image with optimal chunking to eliminate streaking while respecting BLE limits."""
@@ -395,6 +955,8 @@ class Printer:
         if not self.client or not self.client.is_connected:
             self.logger.error("Not connected to printer.")
             return
+        from PIL import Image
+        import numpy as np
         self.logger.info(f"--- Starting 4bpp Grayscale Print Job (EXPERIMENTAL, max height {max_height}) ---")
         # Load and resize image
         img = Image.open(image_path).convert('L')
@@ -446,6 +1008,7 @@ class Printer:
         if not self.client or not self.client.is_connected:
             self.logger.error("Not connected to printer.")
             return
+        import numpy as np
         self.logger.info("--- Diagnostic: Sending minimal 4bpp print job (8 lines, mid-gray) ---")
         width = PRINT_WIDTH
         height = 8
@@ -489,25 +1052,28 @@ class Printer:
         await self._write(cmd)
 
     async def query_count(self):
-        """[EXPERIMENTAL] Query count command (purpose unclear)."""
+        """[EXPERIMENTAL] Query count command (purpose unclear). Returns the raw payload."""
         self.logger.info("[EXPERIMENTAL] Sending query count command...")
-        await self._write_with_response(CMD_QUERY_COUNT)
+        return response_payload(await self._write_with_response(CMD_QUERY_COUNT))
 
     async def get_battery_level(self):
-        """[EXPERIMENTAL] Query battery level."""
+        """[EXPERIMENTAL] Query battery level in percent."""
         self.logger.info("[EXPERIMENTAL] Querying battery level...")
-        await self._write_with_response(CMD_BATTERY_LEVEL)
+        return parse_battery(await self._write_with_response(CMD_BATTERY_LEVEL))
 
     async def get_print_type(self):
         """[EXPERIMENTAL] Query print type (pressure/density)."""
         self.logger.info("[EXPERIMENTAL] Querying print type...")
-        await self._write_with_response(CMD_GET_PRINT_TYPE)
+        return parse_print_type(await self._write_with_response(CMD_GET_PRINT_TYPE))
 
     async def get_version(self):
         """[EXPERIMENTAL] Query firmware version."""
         self.logger.info("[EXPERIMENTAL] Querying firmware version...")
-        await self._write_with_response(CMD_GET_VERSION)
+        return parse_version(await self._write_with_response(CMD_GET_VERSION))
 
     async def print_device_info(self):
-        """[EXPERIMENTAL] Print BLE device info (not implemented, placeholder)."""
-        self.logger.info("[EXPERIMENTAL] Device info not implemented in Python version.")
+        """[EXPERIMENTAL] Logs everything get_device_info() can find out."""
+        info = await self.get_device_info()
+        for field, value in info.as_dict().items():
+            self.logger.info(f"{field}: {value}")
+        return info
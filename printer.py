@@ -3,14 +3,11 @@
 Main command-line interface for controlling the MX11 Thermal Printer.
 """
 
-
-import asyncio
+# Keep module-level imports to the standard library: control commands like
+# --feed should not pay for bleak, PIL or NumPy until they are actually needed.
 import argparse
 import json
 import logging
-from mx11 import Printer
-from PIL import ImageFont, ImageDraw
-from image_convert import text_to_image
 import os
 
 CONFIG_FILE = "config.json"
@@ -25,7 +22,7 @@ def load_config():
                 "concentration": 65535,
                 "speed": 60,
                 "feed_lines": 20,
-                "image_binarization": "floyd-steinberg"
+                "image_binarization": "auto"
             }
         }
         with open(CONFIG_FILE, 'w') as f:
@@ -34,88 +31,327 @@ def load_config():
     with open(CONFIG_FILE, 'r') as f:
         return json.load(f)
 
+def save_config(config):
+    with open(CONFIG_FILE, 'w') as f:
+        json.dump(config, f, indent=2)
+
+async def discover_printers(config, timeout=None, log_level=logging.WARNING, tracer=None):
+    """
+    Scans for printers and lists them, then connects to the closest one that has
+    the printer's TX/RX characteristics and records it in config.json. Returns
+    that connected Printer, or None.
+    """
+    from discovery import SCAN_TIMEOUT, discover, update_config
+    from mx11 import Printer
+    found = await discover(timeout=timeout or SCAN_TIMEOUT)
+    if not found:
+        print("No printers found. Make sure the printer is on and not connected to another device.")
+        return None
+    for candidate in found:
+        print(f"{candidate.address}  {candidate.name or '?':<12} RSSI {candidate.rssi}")
+    for candidate in found:
+        printer = Printer(candidate.address, log_level=log_level, tracer=tracer)
+        try:
+            await printer.connect()
+        except Exception as e:
+            logging.info(f"Skipping {candidate.address}: {e}")
+            continue
+        if update_config(config, [candidate]):
+            save_config(config)
+            print(f"Updated {CONFIG_FILE} (printer: {config['mac_address']}).")
+        return printer
+    print("None of the printers found could be connected to.")
+    return None
+
+async def _discover_and_disconnect(config):
+    printer = await discover_printers(config)
+    if printer is not None:
+        await printer.disconnect()
+
 async def run(args, config):
     """Connects to the printer and executes the requested command."""
+    from mx11 import Printer, Text
     log_level = getattr(logging, (args.loglevel or config.get('loglevel', 'WARNING')).upper(), logging.WARNING)
     logging.basicConfig(level=log_level, format='[%(levelname)s] %(name)s: %(message)s')
     # Set font options for text_to_image
     font_name = args.font or config.get('font', 'arial.ttf')
     font_size = args.fontsize or int(config.get('fontsize', 20))
     mac_address = args.mac or config.get("mac_address")
-    if not mac_address or mac_address == "XX:XX:XX:XX:XX:XX":
-        logging.error("Printer MAC address not configured. Please set it in config.json or use the --mac argument.")
+    if args.export_job:
+        # Encoding only; the job is sent later with --play-job, possibly from another machine
+        if not args.image:
+            logging.error("--export-job needs --image.")
+            return
+        Printer(mac_address, log_level=log_level).export_job(
+            args.export_job,
+            args.image,
+            binarization=args.img_binarization_algo,
+            energy=args.concentration or config['defaults']['concentration'],
+            process=not args.raw,
+            skip_blank=args.skip_blank,
+            trim=args.trim,
+            write_size=args.write_size,
+            bands=args.bands,
+            workers=args.workers
+        )
         return
-    printer = Printer(mac_address, log_level=log_level)
+    tracer = None
+    if args.trace:
+        from tracer import TrafficTracer
+        tracer = TrafficTracer()
+    printer = None
+    if not mac_address or mac_address == "XX:XX:XX:XX:XX:XX":
+        logging.info("Printer MAC address not configured, scanning for printers...")
+        printer = await discover_printers(config, log_level=log_level, tracer=tracer)
+        if printer is None:
+            logging.error("Printer MAC address not configured. Please set it in config.json or use the --mac argument.")
+            return
+    else:
+        printer = Printer(mac_address, log_level=log_level, tracer=tracer)
     try:
-        await printer.connect()
+        if not printer.client or not printer.client.is_connected:
+            await printer.connect()
         if not await printer.get_status():
             logging.error("Printer is not ready. Check paper and battery.")
             return
+        if args.calibrate_link:
+            await printer.calibrate_link()
         if args.speed:
             await printer.set_speed(args.speed)
         if args.concentration:
             await printer.set_concentration(args.concentration)
+        if args.play_job:
+            await printer.play_job(args.play_job, thermal=args.thermal)
+        batch = []
         if args.image:
-            await printer.print_image(
-                args.image,
-                binarization=args.img_binarization_algo,
-                energy=args.concentration or config['defaults']['concentration'],
-                process=not args.raw
-            )
+            batch.append(args.image)
         if args.textfile:
             with open(args.textfile, 'r') as f:
-                text = f.read()
-            img = text_to_image(text, font_name=font_name, font_size=font_size)
-            img.save("text_as_image.png")
-            await printer.print_image("text_as_image.png", energy=args.concentration or config['defaults']['concentration'])
-        if args.feed:
+                batch.append(Text(f.read(), font_name=font_name, font_size=font_size))
+        if args.label_template:
+            from labels import load_template, read_records
+            template = load_template(args.label_template, workers=args.workers)
+            batch.extend(template.label(values) for values in read_records(args.labels))
+        if args.barcode:
+            from barcodes import Barcode
+            batch.append(Barcode(args.barcode))
+        if args.qr:
+            from barcodes import QRCode
+            batch.append(QRCode(args.qr))
+        if batch:
+            from resume import print_resumable
+            # Image, text and the final feed share one preamble and lattice
+            await print_resumable(printer, printer.print_many(
+                batch,
+                binarization=args.img_binarization_algo,
+                energy=args.concentration or config['defaults']['concentration'],
+                separator=args.gap,
+                extra_feed=args.feed or 0,
+                process=not args.raw,
+                skip_blank=args.skip_blank,
+                trim=args.trim,
+                thermal=args.thermal,
+                bands=args.bands,
+                workers=args.workers
+            ), attempts=args.resume, overlap=args.overlap, thermal=args.thermal)
+        elif args.feed:
             await printer.feed_paper(args.feed)
         if args.status:
             logging.info("Printer status check was successful.")
         if args.serial:
             await printer.get_serial_number()
+        if args.info:
+            await printer.print_device_info()
     except Exception as e:
         logging.error(f"An error occurred: {e}")
     finally:
         if printer.client and printer.client.is_connected:
             await printer.disconnect()
+        if tracer:
+            records = tracer.dump(args.trace)
+            logging.info(f"Wrote {records} traced frames to {args.trace} (summarise with: python tracer.py {args.trace})")
 
-def main():
-    config = load_config()
+def forward_to_daemon(args, config):
+    """
+    Sends the requested actions to a running printer daemon (see printer_daemon.py).
+    Returns False, having done nothing, if no daemon of this user is listening or
+    it serves a different printer than --mac.
+    """
+    from printer_daemon import DEFAULT_SOCKET, DaemonClient, DaemonError
+
+    client = DaemonClient.connect(config.get('daemon_socket', DEFAULT_SOCKET))
+    if not client:
+        return False
+    if args.mac:
+        try:
+            address = client.call('address')
+        except DaemonError:
+            address = None
+        if not address or address.lower() != args.mac.lower():
+            # The daemon is connected to another printer; talk to this one directly
+            logging.debug(f"Printer daemon serves {address}, not {args.mac}; not forwarding.")
+            client.close()
+            return False
+    log_level = getattr(logging, (args.loglevel or config.get('loglevel', 'WARNING')).upper(), logging.WARNING)
+    logging.basicConfig(level=log_level, format='[%(levelname)s] %(name)s: %(message)s')
+    energy = args.concentration or config['defaults']['concentration']
+    print_options = {'energy': energy, 'skip_blank': args.skip_blank, 'trim': args.trim, 'thermal': args.thermal,
+                     'bands': args.bands, 'resume': args.resume, 'overlap': args.overlap}
+    with client:
+        try:
+            if args.calibrate_link:
+                from link import LinkProfile
+                logging.info(f"Link profile: {LinkProfile(**client.call('calibrate_link')).summary()}")
+            if args.speed:
+                client.call('speed', speed=args.speed)
+            if args.concentration:
+                client.call('concentration', concentration=args.concentration)
+            if args.play_job:
+                client.call('play_job', path=os.path.abspath(args.play_job), thermal=args.thermal)
+            batch = []
+            if args.image:
+                batch.append({'image': os.path.abspath(args.image)})
+            if args.textfile:
+                with open(args.textfile, 'r') as f:
+                    batch.append({'text': f.read(), 'font_name': args.font or config.get('font', 'arial.ttf'),
+                                  'font_size': args.fontsize or int(config.get('fontsize', 20))})
+            if args.label_template:
+                from labels import read_records
+                template = os.path.abspath(args.label_template)
+                batch.extend({'template': template, 'values': values} for values in read_records(args.labels))
+            if args.barcode:
+                batch.append({'barcode': args.barcode})
+            if args.qr:
+                batch.append({'qr': args.qr})
+            if batch:
+                client.call('print_many', items=batch, binarization=args.img_binarization_algo,
+                            separator=args.gap, extra_feed=args.feed or 0, process=not args.raw,
+                            workers=args.workers, **print_options)
+            elif args.feed:
+                client.call('feed', lines=args.feed)
+            if args.status:
+                if client.call('status'):
+                    logging.info("Printer status check was successful.")
+                else:
+                    logging.error("Printer is not ready. Check paper and battery.")
+            if args.serial:
+                logging.info(f"Serial Number: {client.call('serial')}")
+            if args.info:
+                for field, value in client.call('device_info').items():
+                    logging.info(f"{field}: {value}")
+        except DaemonError as e:
+            logging.error(f"Printer daemon: {e}")
+    return True
+
+def run_daemon(args, config):
+    """Runs the printer daemon in the foreground until interrupted."""
+    import asyncio
+    from printer_daemon import DEFAULT_SOCKET, PrinterDaemon
+
+    log_level = getattr(logging, (args.loglevel or config.get('loglevel', 'INFO')).upper(), logging.INFO)
+    logging.basicConfig(level=log_level, format='[%(levelname)s] %(name)s: %(message)s')
+    mac_address = args.mac or config.get("mac_address")
+    if not mac_address or mac_address == "XX:XX:XX:XX:XX:XX":
+        logging.error("Printer MAC address not configured. Please set it in config.json or use the --mac argument.")
+        return
+    daemon = PrinterDaemon(mac_address, socket_path=config.get('daemon_socket', DEFAULT_SOCKET), log_level=log_level)
+    try:
+        asyncio.run(daemon.serve())
+    except KeyboardInterrupt:
+        pass
+
+def apply_config_defaults(args, config):
+    """Fills options left unset on the command line from the config file defaults."""
     defaults = config.get("defaults", {})
+    for option, key in (('feed', 'feed_lines'), ('concentration', 'concentration'), ('speed', 'speed'),
+                        ('img_binarization_algo', 'image_binarization')):
+        if getattr(args, option) is None:
+            setattr(args, option, defaults.get(key))
+
+def main():
     parser = argparse.ArgumentParser(description='MX11 Thermal Printer Control Script', formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument('-m', '--mac', type=str, default=None,
                        help=f'Printer MAC address. Overrides the value in {CONFIG_FILE}.')
     parser.add_argument('--loglevel', type=str, default=None, choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
                        help='Set log level (DEBUG, INFO, WARNING, ERROR, CRITICAL).')
+    parser.add_argument('--daemon', action='store_true',
+                       help='Run as a resident daemon that keeps the printer connected for later invocations.')
+    parser.add_argument('--no-daemon', action='store_true',
+                       help='Connect directly even if a printer daemon is running.')
+    parser.add_argument('--trace', type=str, metavar='FILE',
+                       help='Record all printer traffic to a binary capture file (read it with tracer.py). Implies --no-daemon.')
+    parser.add_argument('--discover', action='store_true',
+                       help=f'Scan for printers and record them in {CONFIG_FILE}.')
     # --- Actions ---
     actions = parser.add_argument_group('Actions')
     actions.add_argument('-i', '--image', type=str, help='Path to an image file to print.')
-    actions.add_argument('--raw', action='store_true', help='Send image as-is (no processing). Only for use with pre-converted 1-bit images.')
+    actions.add_argument('--raw', action='store_true', help='Send image as-is (no processing). Only for use with pre-converted 1-bit images; binary PBM (P4) and raw packed-row (.bin/.raw) files are memory-mapped without PIL.')
     actions.add_argument('-t', '--textfile', type=str, help='Path to a text file to print.')
-    actions.add_argument('--feed', type=int, default=defaults.get('feed_lines'),
-                        help=f'Feed paper by a specified number of lines (default: {defaults.get("feed_lines")}).')
+    actions.add_argument('--feed', type=int, default=None,
+                        help=f'Feed paper by a specified number of lines (default: defaults.feed_lines in {CONFIG_FILE}).')
     actions.add_argument('--status', action='store_true', help='Query and display the printer status.')
     actions.add_argument('--serial', action='store_true', help='Query and display the printer serial number.')
+    actions.add_argument('--info', action='store_true', help='Query status, serial, battery, firmware and print type in one round.')
     actions.add_argument('--calibrate', action='store_true', help='Send label calibration command to the printer.')
+    actions.add_argument('--calibrate-link', action='store_true',
+                         help='Measure this printer\'s BLE throughput, write size and pacing (prints a short test strip) and save them for later prints.')
+    actions.add_argument('--label-template', type=str, metavar='FILE',
+                         help='Label template (JSON, see labels.py) to print once per row of --labels.')
+    actions.add_argument('--labels', type=str, metavar='CSV',
+                         help='With --label-template: CSV file with one label per row, columns named after the fields.')
+    actions.add_argument('--barcode', type=str, metavar='DATA', help='Print DATA as a Code128 barcode at printer resolution.')
+    actions.add_argument('--qr', type=str, metavar='DATA', help='Print DATA as a QR code at printer resolution.')
+    actions.add_argument('--export-job', type=str, metavar='FILE', help='Encode --image into a prepared job file instead of printing it.')
+    actions.add_argument('--play-job', type=str, metavar='FILE', help='Print a prepared job file written by --export-job.')
+    actions.add_argument('--write-size', type=int, default=None, help='With --export-job: pack commands into writes of at most this many bytes of payload (at most the MTU minus 3).')
     # --- Print Quality ---
     quality = parser.add_argument_group('Print Quality')
-    quality.add_argument('-c', '--concentration', type=int, default=defaults.get('concentration'),
-                         help=f'Print concentration/density (0-65535, default: {defaults.get("concentration")}).')
-    quality.add_argument('-s', '--speed', type=int, default=defaults.get('speed'),
-                         help=f'Print speed (default: {defaults.get("speed")}).')
-    quality.add_argument('-b', '--img-binarization-algo', type=str, default=defaults.get('image_binarization'),
-                         choices=['floyd-steinberg', 'none', 'manual', 'bayer', 'ordered', 'atkinson', 'burkes', 'stucki', 'jarvis', 'sierra', 'random'],
-                         help=f'Image processing algorithm (default: {defaults.get("image_binarization")}).')
+    quality.add_argument('-c', '--concentration', type=int, default=None,
+                         help=f'Print concentration/density (0-65535, default: defaults.concentration in {CONFIG_FILE}).')
+    quality.add_argument('-s', '--speed', type=int, default=None,
+                         help=f'Print speed (default: defaults.speed in {CONFIG_FILE}).')
+    quality.add_argument('-b', '--img-binarization-algo', type=str, default=None,
+                         choices=['auto', 'floyd-steinberg', 'none', 'manual', 'bayer', 'ordered', 'atkinson', 'burkes', 'stucki', 'jarvis', 'sierra', 'random'],
+                         help=f'Image processing algorithm (default: defaults.image_binarization in {CONFIG_FILE}).')
+    quality.add_argument('--skip-blank', action='store_true', help='Feed paper over runs of blank rows instead of printing them.')
+    quality.add_argument('--trim', action='store_true', help='Drop blank rows at the top and bottom of the image.')
+    quality.add_argument('--gap', type=int, default=None,
+                         help='Lines of paper fed between the image and the text when both are printed.')
+    quality.add_argument('--workers', type=int, default=1,
+                         help='Processes for error-diffusion dithering of tall images (0: one per CPU, default: 1).')
+    quality.add_argument('--bands', action='store_true',
+                         help='Vary energy and speed with the black-dot density of each band of rows.')
+    quality.add_argument('--thermal', action='store_true',
+                         help='Poll printer status during long jobs and slow down or pause on overheating.')
+    quality.add_argument('--resume', type=int, default=0, metavar='N',
+                         help='If the connection drops mid-print, reconnect and continue the job up to N times instead of failing.')
+    quality.add_argument('--overlap', type=int, default=None, metavar='ROWS',
+                         help='With --resume: rows printed again before the last row sent (default: 32).')
     # --- Font Options ---
     font = parser.add_argument_group('Font Options')
     font.add_argument('--font', type=str, default=None, help='Font file name from C:\\Windows\\Fonts (e.g., arial.ttf, times.ttf). Default: arial.ttf')
     font.add_argument('--fontsize', type=int, default=None, help='Font size in points. Default: 20')
     args = parser.parse_args()
-    if not any([args.image, args.textfile, args.feed, args.status, args.serial]):
+    config = load_config()
+    if args.daemon:
+        run_daemon(args, config)
+        return
+    if args.discover:
+        import asyncio
+        logging.basicConfig(level=getattr(logging, (args.loglevel or 'WARNING').upper()),
+                            format='[%(levelname)s] %(name)s: %(message)s')
+        asyncio.run(_discover_and_disconnect(config))
+        return
+    apply_config_defaults(args, config)
+    if args.label_template and not args.labels:
+        parser.error('--label-template needs --labels.')
+    if not any([args.image, args.textfile, args.feed, args.status, args.serial, args.info, args.calibrate_link, args.label_template, args.barcode, args.qr, args.play_job]):
         parser.print_help()
         print("\nError: No action specified. Please choose an action (e.g., --image, --feed).")
         return
+    if not args.export_job and not args.no_daemon and not args.trace and forward_to_daemon(args, config):
+        return
+    import asyncio
     asyncio.run(run(args, config))
 
 if __name__ == "__main__":
@@ -0,0 +1,287 @@
+"""
+printer_daemon.py - Resident printer daemon for the MX11 CLI
+
+The daemon keeps one Printer connected and listens on a Unix domain socket, so
+back-to-back printer.py invocations skip the BLE scan/connect/status dance and
+start sending immediately. Requests and responses are one JSON object per line:
+
+    {"cmd": "feed", "args": {"lines": 5}}   ->   {"ok": true, "result": null}
+
+The client side (DaemonClient) only uses the standard library.
+"""
+
+import json
+import logging
+import os
+import socket
+import stat
+import tempfile
+import time
+
+SOCKET_NAME = 'mx11-printer.sock'
+
+
+def default_socket_path():
+    """
+    The daemon socket in a directory only this user can reach: $XDG_RUNTIME_DIR, or
+    a per-uid directory under the temp dir (created 0700 by the daemon).
+    """
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime and os.path.isdir(runtime):
+        return os.path.join(runtime, SOCKET_NAME)
+    uid = os.getuid() if hasattr(os, 'getuid') else 0
+    return os.path.join(tempfile.gettempdir(), f'mx11-{uid}', SOCKET_NAME)
+
+
+DEFAULT_SOCKET = default_socket_path()
+# How long a successful status check covers later print jobs
+STATUS_TTL = 30.0
+
+logger = logging.getLogger('PrinterDaemon')
+
+
+class DaemonError(Exception):
+    """The daemon received the request but could not carry it out."""
+
+
+def daemon_supported():
+    return hasattr(socket, 'AF_UNIX')
+
+
+class DaemonClient:
+    """Blocking client for a running daemon. connect() returns None if none is listening."""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._file = sock.makefile('rwb')
+
+    @classmethod
+    def connect(cls, path=DEFAULT_SOCKET):
+        if not daemon_supported() or not os.path.exists(path):
+            return None
+        if os.stat(path).st_uid != os.getuid():
+            # Someone else's socket: don't hand them our jobs or trust their answers
+            logger.warning(f"Ignoring daemon socket {path}, which belongs to another user.")
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            sock.close()
+            return None
+        return cls(sock)
+
+    def call(self, cmd, **args):
+        self._file.write(json.dumps({'cmd': cmd, 'args': args}).encode('utf-8') + b'\n')
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise DaemonError('Daemon closed the connection.')
+        response = json.loads(line)
+        if not response.get('ok'):
+            raise DaemonError(response.get('error', 'Unknown daemon error'))
+        return response.get('result')
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _jsonable(result):
+    if hasattr(result, 'as_dict'):
+        return result.as_dict()
+    if isinstance(result, (bytes, bytearray)):
+        return result.hex()
+    return result
+
+
+def batch_items(items):
+    """
+    Turns print_many items sent as JSON ({"image": path}, {"text": ..., "font_name":
+    ..., "font_size": ...}, {"feed": lines}, {"template": path, "values": {...}},
+    {"barcode": data, "height": ...} or {"qr": data, "level": ...}) into mx11 batch
+    items. Templates stay prepared between requests.
+    """
+    from barcodes import Barcode, QRCode
+    from labels import load_template
+    from mx11 import Feed, Text
+
+    batch = []
+    for item in items:
+        if 'image' in item:
+            batch.append(item['image'])
+        elif 'text' in item:
+            batch.append(Text(**item))
+        elif 'feed' in item:
+            batch.append(Feed(item['feed']))
+        elif 'template' in item:
+            batch.append(load_template(item['template']).label(item.get('values')))
+        elif 'barcode' in item:
+            batch.append(Barcode(item['barcode'], **{k: v for k, v in item.items() if k != 'barcode'}))
+        elif 'qr' in item:
+            batch.append(QRCode(item['qr'], **{k: v for k, v in item.items() if k != 'qr'}))
+        else:
+            raise DaemonError(f"Unknown batch item {item!r}.")
+    return batch
+
+
+class PrinterDaemon:
+    """Owns the Printer connection and runs client requests one at a time."""
+
+    def __init__(self, address, socket_path=DEFAULT_SOCKET, log_level=logging.WARNING):
+        import asyncio
+        from mx11 import Printer
+
+        self.printer = Printer(address, log_level=log_level)
+        self.socket_path = socket_path
+        self._lock = asyncio.Lock()
+        self._stop = asyncio.Event()
+        self._status_checked = 0.0
+
+    async def ensure_connected(self):
+        if self.printer.client and self.printer.client.is_connected:
+            return
+        logger.info(f"Connecting to {self.printer.address}...")
+        await self.printer.connect()
+        self._status_checked = 0.0
+
+    async def ensure_ready(self):
+        """Checks printer status before a print unless a recent check already passed."""
+        if time.monotonic() - self._status_checked < STATUS_TTL:
+            return
+        if not await self.printer.get_status():
+            raise DaemonError('Printer is not ready. Check paper and battery.')
+        self._status_checked = time.monotonic()
+
+    async def dispatch(self, cmd, args):
+        if cmd == 'ping':
+            return 'pong'
+        if cmd == 'address':
+            return self.printer.address
+        if cmd == 'shutdown':
+            self._stop.set()
+            return None
+        async with self._lock:
+            await self.ensure_connected()
+            printer = self.printer
+            if cmd == 'status':
+                ready = await printer.get_status()
+                self._status_checked = time.monotonic() if ready else 0.0
+                return ready
+            if cmd == 'serial':
+                return await printer.get_serial_number()
+            if cmd == 'device_info':
+                return await printer.get_device_info()
+            if cmd == 'calibrate':
+                return await printer.calibrate_label()
+            if cmd == 'calibrate_link':
+                return await printer.calibrate_link()
+            if cmd == 'speed':
+                return await printer.set_speed(args['speed'])
+            if cmd == 'concentration':
+                return await printer.set_concentration(args['concentration'])
+            if cmd == 'feed':
+                return await printer.feed_paper(args['lines'])
+            if cmd == 'print_image':
+                await self.ensure_ready()
+                return await self._resumable(printer.print_image, args)
+            if cmd == 'print_text':
+                await self.ensure_ready()
+                return await self._resumable(self._print_text, args)
+            if cmd == 'print_many':
+                await self.ensure_ready()
+                return await self._resumable(printer.print_many, {**args, 'items': batch_items(args['items'])})
+            if cmd == 'resume_job':
+                await self.ensure_ready()
+                return await printer.resume_job(args.get('overlap'), thermal=args.get('thermal'))
+            if cmd == 'play_job':
+                await self.ensure_ready()
+                return await printer.play_job(args['path'], thermal=args.get('thermal'))
+        raise DaemonError(f"Unknown command '{cmd}'.")
+
+    async def _resumable(self, print_call, args):
+        """
+        Runs a print call with its arguments; "resume" (attempts) and "overlap" in
+        `args` reconnect and continue the job if the link drops (see resume.py).
+        """
+        from resume import print_resumable
+
+        args = dict(args)
+        attempts = args.pop('resume', 0)
+        overlap = args.pop('overlap', None)
+        return await print_resumable(self.printer, print_call(**args), attempts, overlap,
+                                     thermal=args.get('thermal'))
+
+    async def _print_text(self, text, font_name='arial.ttf', font_size=20, **print_args):
+        from mx11 import Text
+
+        return await self.printer.print_many([Text(text, font_name, font_size)], **print_args)
+
+    async def _handle_client(self, reader, writer):
+        import asyncio
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    result = await self.dispatch(request.get('cmd'), request.get('args') or {})
+                    response = {'ok': True, 'result': _jsonable(result)}
+                except Exception as e:
+                    logger.error(f"Request failed: {e}")
+                    response = {'ok': False, 'error': str(e)}
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        except asyncio.CancelledError:
+            # The daemon is shutting down with this client still connected
+            pass
+        finally:
+            writer.close()
+
+    def _claim_socket(self):
+        directory = os.path.dirname(self.socket_path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if directory.startswith(tempfile.gettempdir()):
+            # Anyone can create it in the shared temp dir first: it must be ours and private
+            info = os.lstat(directory)
+            if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+                raise RuntimeError(f"{directory} must be a directory owned by this user with mode 0700.")
+        if not os.path.exists(self.socket_path):
+            return
+        client = DaemonClient.connect(self.socket_path)
+        if client:
+            client.close()
+            raise RuntimeError(f"A printer daemon is already listening on {self.socket_path}.")
+        # Left behind by a daemon that didn't shut down cleanly
+        os.unlink(self.socket_path)
+
+    async def serve(self):
+        import asyncio
+
+        if not daemon_supported():
+            raise RuntimeError('The printer daemon needs Unix domain sockets, which this platform lacks.')
+        self._claim_socket()
+        server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        logger.info(f"Printer daemon listening on {self.socket_path}")
+        try:
+            async with server:
+                try:
+                    await self.ensure_connected()
+                except Exception as e:
+                    # Not fatal: the next request retries the connection
+                    logger.warning(f"Initial connection failed: {e}")
+                await self._stop.wait()
+        finally:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            await self.printer.disconnect()
+            logger.info("Printer daemon stopped")
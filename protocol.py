@@ -0,0 +1,170 @@
+"""
+protocol.py - Frame building for the V5G-family (MX11) BLE protocol
+
+Every command is framed as
+
+    51 78 | op | 00 | len (little-endian u16) | payload | crc8(payload) | ff
+
+frame_into writes that layout into a caller's buffer; FrameBuilder keeps one
+such buffer per owner (each RowEncoder has its own), and the fixed or frequently
+repeated commands are built once and cached.
+"""
+
+from functools import lru_cache
+
+FRAME_PREFIX = b'\x51\x78'
+FRAME_SUFFIX = 0xff
+# prefix + op + 00 + u16 length before the payload, crc + suffix after it
+FRAME_OVERHEAD = 8
+
+OP_FEED_PAPER = 0xa1
+OP_PRINT_ROW_RAW = 0xa2
+OP_SET_ENERGY = 0xaf
+OP_APPLY_ENERGY = 0xbe
+OP_PRINT_ROW_RLE = 0xbf
+OP_SET_SPEED = 0xf1
+
+CMD_SET_SPEED_PREFIX = b'\x51\x78\xf1\x00\x01\x00'
+
+CHECKSUM_TABLE = bytes(v & 0xff for v in [
+    0, 7, 14, 9, 28, 27, 18, 21, 56, 63, 54, 49, 36, 35, 42, 45, 112, 119, 126, 121,
+    108, 107, 98, 101, 72, 79, 70, 65, 84, 83, 90, 93, -32, -25, -18, -23, -4, -5,
+    -14, -11, -40, -33, -42, -47, -60, -61, -54, -51, -112, -105, -98, -103, -116,
+    -117, -126, -123, -88, -81, -90, -95, -76, -77, -70, -67, -57, -64, -55, -50,
+    -37, -36, -43, -46, -1, -8, -15, -10, -29, -28, -19, -22, -73, -80, -71, -66,
+    -85, -84, -91, -94, -113, -120, -127, -122, -109, -108, -99, -102, 39, 32, 41,
+    46, 59, 60, 53, 50, 31, 24, 17, 22, 3, 4, 13, 10, 87, 80, 89, 94, 75, 76, 69, 66,
+    111, 104, 97, 102, 115, 116, 125, 122, -119, -114, -121, -128, -107, -110, -101,
+    -100, -79, -74, -65, -72, -83, -86, -93, -92, -7, -2, -9, -16, -27, -30, -21, -20,
+    -63, -58, -49, -56, -35, -38, -45, -44, 105, 110, 103, 96, 117, 114, 123, 124, 81,
+    86, 95, 88, 77, 74, 67, 68, 25, 30, 23, 16, 5, 2, 11, 12, 33, 38, 47, 40, 61, 58,
+    51, 52, 78, 73, 64, 71, 82, 85, 92, 91, 118, 113, 120, 127, 106, 109, 100, 99, 62,
+    57, 48, 55, 34, 37, 44, 43, 6, 1, 8, 15, 26, 29, 20, 19, -82, -87, -96, -89, -78,
+    -75, -68, -69, -106, -111, -104, -97, -118, -115, -124, -125, -34, -39, -48, -41,
+    -62, -59, -52, -53, -26, -31, -24, -17, -6, -3, -12, -13,
+])
+
+
+def crc8(data):
+    """CRC-8 of a bytes-like payload, as the printer checks it."""
+    crc = 0
+    table = CHECKSUM_TABLE
+    for b in data:
+        crc = table[crc ^ b]
+    return crc
+
+
+@lru_cache(maxsize=8)
+def _position_tables(length):
+    # The CRC starts at 0 and CHECKSUM_TABLE is linear (T[a ^ b] == T[a] ^ T[b]), so a
+    # payload's CRC is the XOR of each byte's own contribution. Table k maps a byte to
+    # its contribution when k more bytes follow it.
+    tables = []
+    table = CHECKSUM_TABLE
+    for _ in range(length):
+        tables.append(table)
+        table = table.translate(CHECKSUM_TABLE)
+    return tables[::-1]
+
+
+def crc8_many(data, length):
+    """
+    CRC-8 of every `length`-byte payload packed back to back in `data` (any
+    buffer, e.g. a packed bitmap or a C-contiguous NumPy array). Works column by
+    column with bytes.translate, so the per-byte work stays in C. Returns bytes,
+    one CRC per payload.
+    """
+    if not isinstance(data, bytes):
+        # Columns are copied out of the buffer one at a time, never the whole buffer
+        data = memoryview(data).cast('B')
+    count, rest = divmod(len(data), length)
+    if rest:
+        raise ValueError(f"Buffer length {len(data)} is not a multiple of {length}.")
+    acc = 0
+    for i, table in enumerate(_position_tables(length)):
+        column = data[i::length]
+        if not isinstance(column, bytes):
+            column = column.tobytes()
+        acc ^= int.from_bytes(column.translate(table), 'little')
+    return acc.to_bytes(count, 'little')
+
+
+def frame_into(buf, offset, op, payload, crc=None):
+    """
+    Writes one frame for `payload` into `buf` (a bytearray or writable memoryview)
+    at `offset` and returns the offset just past it. Pass `crc` if it is already
+    known (see crc8_many).
+    """
+    n = len(payload)
+    end = offset + n + FRAME_OVERHEAD
+    buf[offset] = 0x51
+    buf[offset + 1] = 0x78
+    buf[offset + 2] = op
+    buf[offset + 3] = 0
+    buf[offset + 4] = n & 0xff
+    buf[offset + 5] = n >> 8
+    buf[offset + 6:end - 2] = payload
+    buf[end - 2] = crc8(payload) if crc is None else crc
+    buf[end - 1] = FRAME_SUFFIX
+    return end
+
+
+class FrameBuilder:
+    """
+    Builds frames in one reusable buffer; only the returned bytes are allocated.
+    Not thread-safe: each encoder (or thread) needs its own.
+    """
+
+    def __init__(self, max_payload=0xff):
+        self._buf = bytearray(max_payload + FRAME_OVERHEAD)
+        self._view = memoryview(self._buf)
+
+    def build(self, op, payload, crc=None):
+        end = frame_into(self._buf, 0, op, payload, crc)
+        return bytes(self._view[:end])
+
+
+def frame(op, payload, crc=None):
+    """Returns the complete frame for `op` carrying `payload`. Safe from any thread."""
+    buf = bytearray(len(payload) + FRAME_OVERHEAD)
+    frame_into(buf, 0, op, payload, crc)
+    return bytes(buf)
+
+
+def split_frames(data):
+    """
+    Yields the single commands in `data`, a run of commands sent back to back (as a
+    coalesced write is). The speed command has no checksum byte, so it is one short.
+    """
+    i, n = 0, len(data)
+    while i < n:
+        end = i + (data[i + 4] | data[i + 5] << 8) + FRAME_OVERHEAD
+        if data[i + 2] == OP_SET_SPEED:
+            end -= 1
+        yield data[i:end]
+        i = end
+
+
+# --- Cached frames for fixed commands and common parameter values ---
+
+@lru_cache(maxsize=64)
+def energy_frame(val):
+    """Sets print energy/concentration (0-0xffff, sent big-endian)."""
+    return frame(OP_SET_ENERGY, bytes(((val >> 8) & 0xff, val & 0xff)))
+
+
+@lru_cache(maxsize=1)
+def apply_energy_frame():
+    return frame(OP_APPLY_ENERGY, b'\x01')
+
+
+@lru_cache(maxsize=256)
+def feed_frame(lines):
+    """Feeds the paper by `lines` (the printer takes one byte)."""
+    return frame(OP_FEED_PAPER, bytes((lines & 0xff, 0)))
+
+
+@lru_cache(maxsize=16)
+def speed_command(speed):
+    # The APK's speed command carries no checksum byte
+    return CMD_SET_SPEED_PREFIX + speed.to_bytes(1, 'big') + b'\xff'
@@ -0,0 +1,121 @@
+"""
+resume.py - Picking an interrupted print job up where the link dropped
+
+print_image and print_many send through a TrackedJob. It pulls (rows_done,
+command) pairs from the encoder as the writes need them, keeps every command it
+has handed out and records the rows covered by the last completed write. If a
+write fails on a transport error, the printer keeps the job as
+Printer.interrupted (a new print_image/print_many call drops it). After
+reconnecting, Printer.resume_job() sends the preamble (with CMD_LATTICE_START)
+again and continues `overlap` rows before the last completed write:
+
+- rows already encoded come from the job's record, the rest from the same
+  encoder, so nothing is dithered or encoded twice;
+- energy/speed settings sent before the restart point (bands, see bands.py) are
+  sent again first, so the resumed part prints as it would have;
+- rows handed to the BLE stack just before the drop may never have reached the
+  print head, hence the overlap.
+
+print_resumable() wraps a print call with reconnect-and-resume attempts.
+"""
+
+import asyncio
+
+from protocol import CMD_SET_SPEED_PREFIX, OP_APPLY_ENERGY, OP_SET_ENERGY
+
+# Rows sent again before the last completed write when resuming
+RESUME_OVERLAP = 32
+RECONNECT_DELAY = 2.0
+# Commands that change print settings rather than print or feed rows
+SETTING_OPS = (OP_SET_ENERGY, OP_APPLY_ENERGY, CMD_SET_SPEED_PREFIX[2])
+
+
+class TrackedJob:
+    """A print job's command stream and how far its writes got."""
+
+    def __init__(self, commands, rows_total, energy, stats=None, trailer=(), thermal=None):
+        """
+        `commands` yields (rows_done, command) pairs, rows_done counted from the job's
+        start. `stats` is the EncodeStats the job returns, `trailer` the commands
+        written after the rows (e.g. CMD_LATTICE_END), `thermal` the job's
+        ThermalScheduler, if any.
+        """
+        self._source = iter(commands)
+        self.history = []
+        self.rows_total = rows_total
+        self.energy = energy
+        self.stats = stats
+        self.trailer = tuple(trailer)
+        self.thermal = thermal
+        # rows_done of the last write that completed
+        self.rows_sent = 0
+        self._replay = []
+
+    def commands(self):
+        """(rows_done, command) pairs still to send: the replay set up by restart(), then new ones."""
+        replay, self._replay = self._replay, []
+        yield from replay
+        for pair in self._source:
+            self.history.append(pair)
+            yield pair
+
+    def restart(self, overlap=RESUME_OVERLAP):
+        """
+        Makes commands() start again from `overlap` rows before the last completed
+        write, with the latest setting commands before that point first. Returns the
+        row the job continues after.
+        """
+        history = self.history
+        start = max(0, self.rows_sent - overlap)
+        first = len(history)
+        for i, (rows_done, command) in enumerate(history):
+            if rows_done > start and command[2] not in SETTING_OPS:
+                first = i
+                break
+        settings = {}
+        restart_row = 0
+        for i, (rows_done, command) in enumerate(history[:first]):
+            if command[2] in SETTING_OPS:
+                settings[command[2]] = i
+            else:
+                restart_row = rows_done
+        self._replay = [history[i] for i in sorted(settings.values())] + history[first:]
+        return restart_row
+
+
+def transport_errors():
+    """Exception types that mean the link failed, as opposed to a bad job or input."""
+    errors = (OSError, EOFError)
+    try:
+        from bleak.exc import BleakError
+    except ImportError:
+        return errors
+    return errors + (BleakError,)
+
+
+async def print_resumable(printer, job, attempts=1, overlap=RESUME_OVERLAP, delay=RECONNECT_DELAY, **options):
+    """
+    Awaits `job` (a print_image/print_many call on `printer`). If the link drops
+    during it, reconnects and resumes the job this call started up to `attempts`
+    times; `options` go to resume_job. Other errors, and jobs left over from
+    earlier calls, are not resumed. Returns the job's result, or raises the last error.
+    """
+    errors = transport_errors()
+    printer.interrupted = None
+    try:
+        return await job
+    except errors as e:
+        error = e
+    tracked = printer.interrupted
+    for attempt in range(1, attempts + 1):
+        if tracked is None or printer.interrupted is not tracked:
+            break
+        printer.logger.warning(f"Print interrupted ({error}); reconnecting to resume (attempt {attempt} of {attempts})")
+        await asyncio.sleep(delay)
+        try:
+            await printer.disconnect()
+            await printer.connect()
+            return await printer.resume_job(overlap, **options)
+        except errors as e:
+            error = e
+    raise error
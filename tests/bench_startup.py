@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for printer.py.
+
+Times fresh interpreters importing the CLI and running control-only paths, and
+reports which heavy libraries (bleak, PIL, NumPy) each path pulled in. The
+`--feed 1` run goes through a fake BleakClient that answers the status query,
+in a scratch directory and HOME so no config or cache file is touched. Exits
+non-zero if a control command pulled in PIL or NumPy. Run from the repository
+root:
+
+    python tests/bench_startup.py [--runs 10]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ('bleak', 'PIL', 'numpy')
+# Only needed to build or process images; control commands must not load them
+IMAGE_LIBS = ('PIL', 'numpy')
+
+# printer.py --feed 1 end to end: a fake BleakClient stands in for the printer, answers
+# the status query (byte 6 = 0: ready) and must see the feed. bleak is imported to patch it.
+FEED = '''
+import json, os, sys, tempfile
+sys.path.insert(0, os.getcwd())
+scratch = tempfile.mkdtemp()
+os.environ['HOME'] = scratch
+os.chdir(scratch)
+with open('config.json', 'w') as f:
+    json.dump({'mac_address': 'AA:BB:CC:DD:EE:FF', 'daemon_socket': os.path.join(scratch, 'daemon.sock'),
+               'defaults': {'feed_lines': 20}}, f)
+
+import bleak
+
+writes = []
+
+class FakeClient:
+    def __init__(self, device, services=None):
+        service = '0000ae30-0000-1000-8000-00805f9b34fb'
+        char = lambda *props: type('Char', (), {'service_uuid': service, 'properties': list(props)})()
+        chars = {'0000ae01-0000-1000-8000-00805f9b34fb': char('write-without-response'),
+                 '0000ae02-0000-1000-8000-00805f9b34fb': char('notify')}
+        self.services = type('Services', (), {'get_characteristic': staticmethod(chars.get)})()
+        self.is_connected = False
+    async def connect(self):
+        self.is_connected = True
+    async def disconnect(self):
+        self.is_connected = False
+    async def start_notify(self, characteristic, callback):
+        self.notify = callback
+    async def write_gatt_char(self, characteristic, data, response=False):
+        writes.append(bytes(data))
+        if data[2] == 0xa3:
+            self.notify(characteristic, bytes([0x51, 0x78, 0xa3, 0, 3, 0, 0, 0, 0, 0, 0xff]))
+
+bleak.BleakClient = FakeClient
+import printer
+sys.argv = ['printer.py', '--feed', '1']
+printer.main()
+assert bytes.fromhex('5178a1000200010015ff') in writes, 'no feed command was written'
+'''
+
+# (label, code run in a fresh interpreter)
+SCENARIOS = [
+    ('bare interpreter', 'pass'),
+    ('import printer', 'import printer'),
+    ('printer.py --help', 'import sys, printer; sys.argv = ["printer.py", "--help"]\n'
+                          'try:\n    printer.main()\nexcept SystemExit:\n    pass'),
+    ('printer.py --feed 1 (fake BLE)', FEED),
+    ('import mx11', 'import mx11'),
+    ('import mx11 + jobfile (edge replay)', 'import mx11, jobfile'),
+    ('import image_convert', 'import image_convert'),
+]
+
+REPORT = '\nimport sys\nprint("LOADED:" + ",".join(m for m in %r if m in sys.modules), file=sys.stderr)' % (HEAVY,)
+
+
+def time_scenario(code, runs):
+    times = []
+    loaded = ''
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', code + REPORT], cwd=ROOT,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        times.append(time.perf_counter() - start)
+        for line in result.stderr.splitlines():
+            if line.startswith('LOADED:'):
+                loaded = line[len('LOADED:'):]
+    return times, loaded
+
+
+def image_libs_loaded(code):
+    """The image libraries a fresh interpreter running `code` ended up importing."""
+    result = subprocess.run([sys.executable, '-c', code + REPORT], cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode:
+        raise RuntimeError(f"Scenario failed:\n{result.stderr}")
+    loaded = [line[len('LOADED:'):] for line in result.stderr.splitlines() if line.startswith('LOADED:')]
+    return [module for module in loaded[-1].split(',') if module in IMAGE_LIBS]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark printer.py startup time.')
+    parser.add_argument('--runs', type=int, default=10, help='Interpreter launches per scenario (default: 10).')
+    args = parser.parse_args()
+
+    print(f"{'scenario':<38} {'median':>9} {'min':>9}  heavy imports")
+    for label, code in SCENARIOS:
+        times, loaded = time_scenario(code, args.runs)
+        print(f"{label:<38} {statistics.median(times) * 1000:7.1f}ms {min(times) * 1000:7.1f}ms  {loaded or '-'}")
+    leaked = image_libs_loaded(FEED)
+    if leaked:
+        sys.exit(f"printer.py --feed imported {', '.join(leaked)}")
+
+
+if __name__ == '__main__':
+    main()
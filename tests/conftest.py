@@ -0,0 +1,30 @@
+"""
+Shared fixtures for the tests.
+"""
+
+import pytest
+
+
+class RecordingClient:
+    """
+    Fake BLE client that records every write. With `fail_after`, the write after
+    that many successful ones raises ConnectionError and the link counts as
+    dropped, as when the printer goes out of range mid-job.
+    """
+
+    def __init__(self, fail_after=None):
+        self.writes = []
+        self.fail_after = fail_after
+        self.is_connected = True
+
+    async def write_gatt_char(self, characteristic, data, response=False):
+        if self.fail_after is not None and len(self.writes) == self.fail_after:
+            self.is_connected = False
+            raise ConnectionError('link lost')
+        self.writes.append(bytes(data))
+
+
+@pytest.fixture
+def recording_client():
+    """The RecordingClient class: call it for a fresh client (several per test if needed)."""
+    return RecordingClient
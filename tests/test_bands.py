@@ -0,0 +1,45 @@
+"""
+Checks band density planning and where band switches land in the command stream.
+"""
+
+from bands import BAND_LEVELS, apply_bands, band_densities, plan_bands
+from encoder import BLANK_ROW, ROW_BYTES, RowEncoder
+from protocol import apply_energy_frame, energy_frame, speed_command
+
+SPARSE_ROW = b'\x01' + bytes(ROW_BYTES - 1)
+DENSE_ROW = b'\xff' * ROW_BYTES
+
+
+def test_band_densities():
+    assert band_densities([BLANK_ROW] * 16 + [DENSE_ROW] * 8, band_rows=16) == [0.0, 1.0]
+
+
+def test_denser_switches_at_once_lighter_waits_for_hold():
+    rows = [SPARSE_ROW] * 32 + [DENSE_ROW] * 16 + [SPARSE_ROW] * 96
+    plan = plan_bands(rows, 0xffff, band_rows=16, hold=4)
+    assert [(setting.start, setting.speed) for setting in plan] == [
+        (0, BAND_LEVELS[0][2]), (32, BAND_LEVELS[2][2]), (96, BAND_LEVELS[0][2])]
+    assert plan[0].energy == int(0xffff * BAND_LEVELS[0][1])
+    assert plan[1].energy == 0xffff
+
+
+def test_apply_bands_inserts_switches_before_the_band():
+    rows = [SPARSE_ROW] * 16 + [DENSE_ROW] * 16
+    plan = plan_bands(rows, 0xffff, band_rows=16, hold=1)
+    plain = list(RowEncoder(cache=None).encode_rows(rows))
+    banded = list(apply_bands(RowEncoder(cache=None).encode_rows(rows), plan, 0xffff))
+    sparse_energy = int(0xffff * BAND_LEVELS[0][1])
+    assert banded[:3] == [(0, energy_frame(sparse_energy)), (0, apply_energy_frame()),
+                          (0, speed_command(BAND_LEVELS[0][2]))]
+    assert banded[3:19] == plain[:16]
+    assert banded[19:22] == [(16, energy_frame(0xffff)), (16, apply_energy_frame()),
+                             (16, speed_command(BAND_LEVELS[2][2]))]
+    assert banded[22:] == plain[16:]
+
+
+def test_settings_matching_the_preamble_are_not_resent():
+    rows = [b'\x0f' * ROW_BYTES] * 16
+    plan = plan_bands(rows, 0xffff, band_rows=16)
+    assert plan[0].speed == BAND_LEVELS[2][2]
+    commands = list(apply_bands(RowEncoder(cache=None).encode_rows(rows), plan, 0xffff, speed=plan[0].speed))
+    assert commands == list(RowEncoder(cache=None).encode_rows(rows))
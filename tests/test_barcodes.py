@@ -0,0 +1,95 @@
+"""
+Checks the Code128 and QR encoders and that codes come out at whole dots per module.
+"""
+
+import asyncio
+
+import pytest
+
+from barcodes import Barcode, QRCode, code128_modules, code128_values, qr_matrix
+from encoder import ROW_BYTES
+from labels import Field, LabelTemplate
+from mx11 import CMD_LATTICE_START, Printer
+
+
+def _runs(row):
+    """(dark, width) runs across a packed row."""
+    bits = int.from_bytes(row, 'little')
+    runs = []
+    for x in range(ROW_BYTES * 8):
+        dark = bool(bits >> x & 1)
+        if runs and runs[-1][0] == dark:
+            runs[-1][1] += 1
+        else:
+            runs.append([dark, 1])
+    return runs
+
+
+def test_code128_values_and_digit_runs():
+    # Code set B throughout, check symbol per the spec's worked example
+    assert code128_values('PJJ123C') == [104, 48, 42, 42, 17, 18, 19, 35, 55, 106]
+    # Code set C packs digit pairs; an odd run leaves its first digit in code set B
+    assert code128_values('123456') == [105, 12, 34, 56, 44, 106]
+    assert code128_values('AB1234567') == [104, 33, 34, 17, 99, 23, 45, 67, 64, 106]
+    modules = code128_modules('AB1234567')
+    assert len(modules) == 11 * 9 + 13
+    with pytest.raises(ValueError):
+        code128_values('café')
+
+
+def test_barcode_modules_are_whole_dots():
+    rows = Barcode('SKU-000451', height=40).rows()
+    assert len(rows) == 40 and all(row is rows[0] for row in rows)
+    modules = code128_modules('SKU-000451')
+    runs = _runs(rows[0])
+    bars = runs[1:-1]
+    scale = bars[0][1] // 2  # The start symbol opens with a two-module bar
+    assert scale >= 2 and all(width % scale == 0 for _, width in bars)
+    assert sum(width for _, width in bars) == len(modules) * scale
+    # Quiet zones of at least ten modules, code centred
+    assert min(runs[0][1], runs[-1][1]) >= 10 * scale and abs(runs[0][1] - runs[-1][1]) <= 1
+
+
+def test_qr_matrix_structure():
+    matrix = qr_matrix('https://example.com/p/451', 'M')
+    size = len(matrix)
+    assert size == 25  # Version 2 for 25 bytes at level M
+    finder = [row[:7] for row in matrix[:7]]
+    assert finder[0] == [True] * 7 and finder[1] == [True] + [False] * 5 + [True]
+    assert [row[size - 7:] for row in matrix[:7]] == finder
+    assert [row[6] for row in matrix[8:size - 8]] == [i % 2 == 0 for i in range(8, size - 8)]
+    assert matrix[size - 8][8]  # The dark module
+    assert len(qr_matrix('x' * 200, 'L')) > len(qr_matrix('x' * 20, 'L'))
+    with pytest.raises(ValueError):
+        qr_matrix('x' * 100, 'H', version=1)
+
+
+def test_qr_matches_reference_encoder():
+    qrcode = pytest.importorskip('qrcode')
+    from qrcode.util import MODE_8BIT_BYTE, QRData
+
+    levels = {'L': qrcode.constants.ERROR_CORRECT_L, 'M': qrcode.constants.ERROR_CORRECT_M,
+              'Q': qrcode.constants.ERROR_CORRECT_Q, 'H': qrcode.constants.ERROR_CORRECT_H}
+    for version, level, mask in ((1, 'L', 0), (5, 'Q', 3), (7, 'M', 5), (12, 'H', 7)):
+        data = bytes(range(version * 3))
+        reference = qrcode.QRCode(version=version, error_correction=levels[level], border=0, mask_pattern=mask)
+        reference.add_data(QRData(data, mode=MODE_8BIT_BYTE))
+        reference.make(fit=False)
+        assert qr_matrix(data, level, version=version, mask=mask) == reference.get_matrix()
+
+
+def test_qr_and_label_fields_print(recording_client):
+    code = QRCode('hello', module=4)
+    rows = code.rows()
+    size = len(qr_matrix('hello'))
+    assert len(rows) == (size + 8) * 4
+    template = LabelTemplate(None, [Field('sku', (0, 0, 384, 60), kind='code128'),
+                                    Field('link', (100, 60, 184, 120), kind='qr')], height=180)
+    label = template.rows({'sku': '000451', 'link': 'https://example.com/p/451'})
+    assert all(row == label[0] for row in label[:60]) and any(label[0])
+    assert any(label[120]) and not any(label[120][:100 // 8]) and not any(label[120][284 // 8 + 1:])
+    printer = Printer('AA:BB:CC:DD:EE:FF')
+    printer.client = recording_client()
+    stats = asyncio.run(printer.print_many([Barcode('000451', height=50), code, template.label(sku='1')]))
+    assert printer.client.writes.count(CMD_LATTICE_START) == 1
+    assert stats.rows == 50 + len(rows) + 180
@@ -0,0 +1,50 @@
+"""
+Checks that print_many sends a batch as one job over a fake BLE client.
+"""
+
+import asyncio
+
+import pytest
+from PIL import Image
+
+from mx11 import CMD_LATTICE_END, CMD_LATTICE_START, Feed, Printer, job_preamble
+from protocol import feed_frame
+
+
+@pytest.fixture
+def printer(recording_client):
+    printer = Printer('AA:BB:CC:DD:EE:FF')
+    printer.client = recording_client()
+    return printer
+
+
+def test_one_preamble_and_lattice_for_the_whole_batch(printer):
+    label = Image.new('1', (384, 20), 1)
+    label.paste(0, (0, 5, 384, 10))
+    stats = asyncio.run(printer.print_many([label, label, Feed(300)], process=False, separator=12, extra_feed=5))
+    writes = printer.client.writes
+    preamble = list(job_preamble(0xffff))
+    assert writes[:len(preamble)] == preamble
+    assert writes.count(CMD_LATTICE_START) == 1
+    assert writes[-1] == CMD_LATTICE_END and writes.count(CMD_LATTICE_END) == 1
+    # Separators only between items; long feeds split to fit the one-byte count
+    assert writes.count(feed_frame(12)) == 2
+    assert feed_frame(255) in writes and feed_frame(45) in writes
+    assert writes[-2] == feed_frame(5)
+    assert stats.rows == 20 + 12 + 20 + 12 + 300 + 5
+    assert stats.fed_rows == 12 + 12 + 300 + 5
+
+
+def test_progress_counts_rows_across_items(printer):
+    progress = []
+    label = Image.new('1', (384, 8), 0)
+    asyncio.run(printer.print_many([label, Feed(4), label], process=False, on_progress=progress.append))
+    assert progress[-1].rows_encoded == progress[-1].rows_total == 20
+
+
+def test_print_image_feeds_extra_lines(printer):
+    label = Image.new('1', (384, 8), 0)
+    stats = asyncio.run(printer.print_image(label, process=False, extra_feed=300))
+    writes = printer.client.writes
+    assert writes[-2:] == [feed_frame(255), feed_frame(45)]
+    assert stats.rows == 8 + 300 and stats.fed_rows == 300
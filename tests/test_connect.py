@@ -0,0 +1,95 @@
+"""
+Checks that a connection resolves the TX/RX characteristics once and writes through them.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import bleak
+import pytest
+
+from mx11 import RX_CHARACTERISTIC_UUID, TX_CHARACTERISTIC_UUID, Printer
+from protocol import feed_frame
+
+
+class FakeBleakClient:
+    """Stands in for BleakClient; counts service lookups and records writes by characteristic."""
+
+    tx_properties = ['write-without-response', 'write']
+    rx_properties = ['notify']
+
+    def __init__(self, device, services=None):
+        self.lookups = []
+        self.writes = []
+        self.notifying = []
+        self.is_connected = False
+        chars = {
+            TX_CHARACTERISTIC_UUID: SimpleNamespace(uuid=TX_CHARACTERISTIC_UUID, properties=self.tx_properties),
+            RX_CHARACTERISTIC_UUID: SimpleNamespace(uuid=RX_CHARACTERISTIC_UUID, properties=self.rx_properties),
+        }
+        self.services = SimpleNamespace(get_characteristic=lambda uuid: self.lookups.append(uuid) or chars.get(uuid))
+
+    async def connect(self):
+        self.is_connected = True
+
+    async def disconnect(self):
+        self.is_connected = False
+
+    async def start_notify(self, characteristic, callback):
+        self.notifying.append(characteristic)
+
+    async def write_gatt_char(self, characteristic, data, response=False):
+        self.writes.append((characteristic, bytes(data), response))
+
+
+def _open(monkeypatch, client_class=FakeBleakClient):
+    monkeypatch.setattr(bleak, 'BleakClient', client_class)
+    printer = Printer('AA:BB:CC:DD:EE:FF')
+
+    async def connect_and_feed():
+        await printer._open_client(printer.address, None)
+        for lines in range(5):
+            await printer.feed_paper(lines + 1)
+    asyncio.run(connect_and_feed())
+    return printer
+
+
+def test_characteristics_resolved_once_per_connection(monkeypatch):
+    printer = _open(monkeypatch)
+    client = printer.client
+    # Looked up at connect only, not per write
+    assert sorted(client.lookups) == sorted([TX_CHARACTERISTIC_UUID, RX_CHARACTERISTIC_UUID])
+    assert client.notifying == [printer._rx]
+    assert [(char, data, response) for char, data, response in client.writes] == [
+        (printer._tx, feed_frame(n), False) for n in range(1, 6)]
+    asyncio.run(printer.disconnect())
+    assert printer._tx is None and printer._rx is None
+
+
+def test_tx_without_write_without_response_falls_back_to_acknowledged_writes(monkeypatch):
+    class AckOnly(FakeBleakClient):
+        tx_properties = ['write']
+
+    printer = _open(monkeypatch, AckOnly)
+    assert printer.client.writes and all(response for _, _, response in printer.client.writes)
+
+
+@pytest.mark.parametrize('missing, properties', [(TX_CHARACTERISTIC_UUID, None), (None, ['read'])])
+def test_missing_or_unusable_characteristics_fail_the_connect(monkeypatch, missing, properties):
+    clients = []
+
+    class Broken(FakeBleakClient):
+        rx_properties = properties or ['notify']
+
+        def __init__(self, device, services=None):
+            super().__init__(device, services)
+            lookup = self.services.get_characteristic
+            self.services.get_characteristic = lambda uuid: None if uuid == missing else lookup(uuid)
+            clients.append(self)
+
+    monkeypatch.setattr(bleak, 'BleakClient', Broken)
+    printer = Printer('AA:BB:CC:DD:EE:FF')
+    with pytest.raises(RuntimeError):
+        asyncio.run(printer._open_client(printer.address, None))
+    # The half-open connection is closed again and nothing was subscribed
+    assert not clients[0].is_connected and clients[0].notifying == []
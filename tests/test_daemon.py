@@ -0,0 +1,53 @@
+"""
+Checks that the daemon socket is private to its user and that the daemon reports its printer.
+"""
+
+import asyncio
+import os
+import socket
+import tempfile
+
+import pytest
+
+from printer_daemon import DaemonClient, PrinterDaemon, daemon_supported, default_socket_path
+
+pytestmark = pytest.mark.skipif(not daemon_supported(), reason='needs Unix domain sockets')
+
+
+def test_default_socket_is_in_a_per_user_directory(monkeypatch):
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    path = default_socket_path()
+    assert os.path.dirname(path) == os.path.join(tempfile.gettempdir(), f'mx11-{os.getuid()}')
+    monkeypatch.setenv('XDG_RUNTIME_DIR', tempfile.gettempdir())
+    assert os.path.dirname(default_socket_path()) == tempfile.gettempdir()
+
+
+def test_client_ignores_another_users_socket(tmp_path):
+    path = str(tmp_path / 'd.sock')
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    try:
+        client = DaemonClient.connect(path)
+        assert client is not None
+        client.close()
+        if os.getuid() != 0:
+            pytest.skip('changing the socket owner needs root')
+        os.chown(path, 12345, -1)
+        assert DaemonClient.connect(path) is None
+    finally:
+        server.close()
+
+
+def test_daemon_refuses_a_shared_directory_and_reports_its_address(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'gettempdir', lambda: str(tmp_path))
+    shared = tmp_path / 'mx11-shared'
+    shared.mkdir(mode=0o777)
+    shared.chmod(0o777)
+    daemon = PrinterDaemon('AA:BB:CC:DD:EE:FF', socket_path=str(shared / 'd.sock'))
+    with pytest.raises(RuntimeError):
+        daemon._claim_socket()
+    daemon = PrinterDaemon('AA:BB:CC:DD:EE:FF', socket_path=str(tmp_path / 'mx11-1' / 'd.sock'))
+    daemon._claim_socket()
+    assert (os.stat(tmp_path / 'mx11-1').st_mode & 0o777) == 0o700
+    assert asyncio.run(daemon.dispatch('address', {})) == 'AA:BB:CC:DD:EE:FF'
@@ -0,0 +1,69 @@
+"""
+Checks that get_device_info pipelines its queries and demultiplexes the answers.
+"""
+
+import asyncio
+
+from mx11 import CMD_GET_STATUS, Printer
+from protocol import frame
+
+ANSWERS = {
+    0xa3: frame(0xa3, b'\x08\x00\x00'),
+    0xa8: frame(0xa8, b'MX11-0042'),
+    0xab: frame(0xab, b'\x57'),
+    0xb1: frame(0xb1, b'\x01\x02\x07'),
+    0xb0: frame(0xb0, b'\x02'),
+}
+
+
+class AnsweringClient:
+    """Answers each write through the notification callback, in reverse order once all are sent."""
+    is_connected = True
+
+    def __init__(self, printer, answers, expected):
+        self.printer = printer
+        self.answers = answers
+        self.expected = expected
+        self.writes = []
+
+    async def write_gatt_char(self, characteristic, data, response=False):
+        self.writes.append(bytes(data))
+        if len(self.writes) == self.expected:
+            loop = asyncio.get_running_loop()
+            for sent in reversed(self.writes):
+                if sent[2] in self.answers:
+                    loop.call_soon(self.printer._on_notification, None, bytearray(self.answers[sent[2]]))
+
+
+def _printer(answers=ANSWERS):
+    printer = Printer('AA:BB:CC:DD:EE:FF')
+    printer.client = AnsweringClient(printer, answers, expected=5)
+    return printer
+
+
+def test_answers_are_matched_by_opcode():
+    printer = _printer()
+    info = asyncio.run(printer.get_device_info())
+    assert printer.client.writes[0] == CMD_GET_STATUS and len(printer.client.writes) == 5
+    assert info.status.low_battery and not info.status.no_paper
+    assert info.serial == 'MX11-0042'
+    assert info.battery == 0x57
+    assert info.firmware == '1.2.7'
+    assert info.print_type == 2
+    assert printer._waiters == []
+
+
+def test_missing_answers_leave_fields_empty_and_result_is_cached():
+    answers = {op: data for op, data in ANSWERS.items() if op != 0xab}
+    printer = _printer(answers)
+    info = asyncio.run(printer.get_device_info(timeout=0.05))
+    assert info.battery is None and info.serial == 'MX11-0042'
+    assert asyncio.run(printer.get_device_info()) is info
+    assert len(printer.client.writes) == 5
+    assert asyncio.run(printer.get_device_info(max_age=0, timeout=0.05)) is not info
+
+
+def test_unmatched_answer_is_not_guessed_with_several_pending():
+    printer = _printer({0xa3: frame(0xee, b'\x00\x00\x00')})
+    info = asyncio.run(printer.get_device_info(timeout=0.05))
+    assert info.status is None
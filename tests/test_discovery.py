@@ -0,0 +1,106 @@
+"""
+Covers the discovery caches and config.json population (no BLE needed).
+"""
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+from discovery import (
+    DiscoveredPrinter, PRINTER_SERVICE_UUIDS, cached_printer, forget, is_printer, load_cache,
+    remember_connection, save_cache, update_config,
+)
+
+TX = "0000ae01-0000-1000-8000-00805f9b34fb"
+RX = "0000ae02-0000-1000-8000-00805f9b34fb"
+
+
+def test_is_printer_needs_the_service_uuid():
+    assert is_printer([PRINTER_SERVICE_UUIDS[0].upper()])
+    assert is_printer(['0000180f-0000-1000-8000-00805f9b34fb', PRINTER_SERVICE_UUIDS[1]])
+    # A name is not enough: 'MX Master 3' is a mouse
+    assert not is_printer(['00001812-0000-1000-8000-00805f9b34fb'])
+    assert not is_printer(None)
+
+
+def test_cache_round_trip_and_ttl(tmp_path):
+    path = str(tmp_path / 'devices.json')
+    fresh = DiscoveredPrinter('AA:BB:CC:DD:EE:FF', name='MX11', rssi=-60, seen=time.time())
+    stale = DiscoveredPrinter('11:22:33:44:55:66', name='MX10', seen=time.time() - 10 ** 7)
+    save_cache({fresh.address: fresh, stale.address: stale}, path)
+    assert load_cache(path) == {fresh.address: fresh}
+    assert cached_printer('aa:bb:cc:dd:ee:ff', path) == fresh
+    forget(fresh.address, path)
+    assert load_cache(path) == {}
+
+
+def test_remember_connection_records_service_once(tmp_path, monkeypatch):
+    import discovery
+
+    path = str(tmp_path / 'devices.json')
+    chars = {
+        TX: SimpleNamespace(service_uuid=PRINTER_SERVICE_UUIDS[0]),
+        RX: SimpleNamespace(service_uuid=PRINTER_SERVICE_UUIDS[0]),
+    }
+    client = SimpleNamespace(services=SimpleNamespace(get_characteristic=chars.get))
+    saves = []
+    monkeypatch.setattr(discovery, 'save_cache', lambda cache, path: saves.append(1) or save_cache(cache, path))
+    remember_connection('aa:bb:cc:dd:ee:ff', client, TX, RX, path=path)
+    printer = cached_printer('AA:BB:CC:DD:EE:FF', path)
+    assert printer.service_uuid == PRINTER_SERVICE_UUIDS[0]
+    # A second connect to the same service leaves the file alone
+    remember_connection('aa:bb:cc:dd:ee:ff', client, TX, RX, path=path)
+    assert len(saves) == 1
+
+
+def test_entries_with_old_handles_still_load(tmp_path):
+    path = tmp_path / 'devices.json'
+    path.write_text(json.dumps({'AA:BB:CC:DD:EE:FF': {
+        'address': 'AA:BB:CC:DD:EE:FF', 'seen': time.time(), 'service_uuid': PRINTER_SERVICE_UUIDS[0],
+        'handles': {TX: 16}}}))
+    assert cached_printer('AA:BB:CC:DD:EE:FF', str(path)).service_uuid == PRINTER_SERVICE_UUIDS[0]
+
+
+def test_update_config_fills_placeholder_and_pool():
+    config = {'mac_address': 'XX:XX:XX:XX:XX:XX'}
+    printers = [DiscoveredPrinter('AA:BB:CC:DD:EE:FF', name='MX11'), DiscoveredPrinter('11:22:33:44:55:66')]
+    assert update_config(config, printers)
+    assert config['mac_address'] == 'AA:BB:CC:DD:EE:FF'
+    assert [entry['mac_address'] for entry in config['printers']] == ['AA:BB:CC:DD:EE:FF', '11:22:33:44:55:66']
+    # Nothing new the second time, and a configured printer is never replaced
+    config['mac_address'] = '11:22:33:44:55:66'
+    assert not update_config(config, printers)
+    assert config['mac_address'] == '11:22:33:44:55:66'
+
+
+def test_config_written_only_for_a_printer_that_connects(monkeypatch):
+    import discovery
+    import mx11
+    import printer
+
+    found = [DiscoveredPrinter('AA:BB:CC:DD:EE:FF', name='MX11', rssi=-40),
+             DiscoveredPrinter('11:22:33:44:55:66', name='MX11', rssi=-70)]
+
+    async def discover(timeout=None):
+        return found
+
+    async def connect(self):
+        if self.address == found[0].address:
+            raise RuntimeError(f"{self.address} has no V5G TX/RX characteristics")
+
+    saved = []
+    monkeypatch.setattr(discovery, 'discover', discover)
+    monkeypatch.setattr(mx11.Printer, 'connect', connect)
+    monkeypatch.setattr(printer, 'save_config', lambda config: saved.append(dict(config)))
+    config = {'mac_address': 'XX:XX:XX:XX:XX:XX'}
+    connected = asyncio.run(printer.discover_printers(config))
+    assert connected.address == '11:22:33:44:55:66'
+    assert [entry['mac_address'] for entry in saved[0]['printers']] == ['11:22:33:44:55:66']
+    assert config['mac_address'] == '11:22:33:44:55:66'
+
+    # Nothing that connects, nothing written
+    found.pop()
+    config = {'mac_address': 'XX:XX:XX:XX:XX:XX'}
+    assert asyncio.run(printer.discover_printers(config)) is None
+    assert len(saved) == 1 and config == {'mac_address': 'XX:XX:XX:XX:XX:XX'}
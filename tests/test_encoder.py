@@ -0,0 +1,125 @@
+"""
+Checks that the packed-row encoder produces exactly the bytes of the original
+list-based cmd_print_row path.
+"""
+
+import random
+
+from PIL import Image
+
+import encoder
+from encoder import CRC_CHUNK_ROWS, ROW_BYTES, RowCache, RowEncoder, pack_image, pack_rows, split_rows
+from mx11 import PRINT_WIDTH, cmd_print_row
+
+
+def _sample_rows():
+    rng = random.Random(1234)
+    rows = [[0] * PRINT_WIDTH, [1] * PRINT_WIDTH, [x % 2 for x in range(PRINT_WIDTH)]]
+    for density in (0.01, 0.05, 0.2, 0.5):
+        for _ in range(50):
+            rows.append([1 if rng.random() < density else 0 for _ in range(PRINT_WIDTH)])
+    for _ in range(50):
+        # Long runs, including runs over 127 dots
+        row, val = [], rng.randint(0, 1)
+        while len(row) < PRINT_WIDTH:
+            row.extend([val] * rng.randint(1, 200))
+            val ^= 1
+        rows.append(row[:PRINT_WIDTH])
+    return rows
+
+
+def test_adaptive_matches_legacy_rows():
+    rows = _sample_rows()
+    encoder = RowEncoder()
+    for row, packed in zip(rows, split_rows(pack_rows(rows))):
+        assert encoder.encode(packed) == bytes(cmd_print_row(row))
+    assert encoder.stats.rows == len(rows)
+    assert encoder.stats.rle_rows + encoder.stats.raw_rows == len(rows)
+
+
+def test_rle_mode_matches_adaptive():
+    packed = split_rows(pack_rows(_sample_rows()))
+    adaptive, legacy = RowEncoder('adaptive', cache=None), RowEncoder('rle', cache=None)
+    assert [adaptive.encode(row) for row in packed] == [legacy.encode(row) for row in packed]
+    assert adaptive.stats == legacy.stats
+
+
+def test_pack_image_matches_pack_rows():
+    rows = _sample_rows()
+    img = Image.new('1', (PRINT_WIDTH, len(rows)), 1)
+    for y, row in enumerate(rows):
+        for x, val in enumerate(row):
+            if val:
+                img.putpixel((x, y), 0)
+    packed = pack_image(img)
+    assert len(packed) == len(rows) * ROW_BYTES
+    assert packed == pack_rows(rows)
+
+
+def test_blank_runs_become_feeds():
+    blank, dark = [0] * PRINT_WIDTH, [1] * PRINT_WIDTH
+    rows = split_rows(pack_rows([blank] * 3 + [dark] + [blank] + [dark] + [blank] * 300))
+    encoder = RowEncoder(blank_feed_min=2, trim=True)
+    kept = encoder.trim(rows)
+    assert len(kept) == 3
+    assert encoder.stats.trimmed_rows == 303
+
+    encoder = RowEncoder(blank_feed_min=2)
+    commands = list(encoder.encode_rows(rows))
+    ops = [command[2] for _, command in commands]
+    assert ops == [0xa1, 0xbf, 0xbf, 0xbf, 0xa1, 0xa1]
+    assert [done for done, _ in commands] == [3, 4, 5, 6, 261, 306]
+    assert encoder.stats.fed_rows == 303
+    assert encoder.stats.rows == len(rows)
+
+
+def test_repeated_rows_reuse_commands():
+    rows = _sample_rows()[:10]
+    packed = split_rows(pack_rows([row for row in rows for _ in range(3)]))
+    cache = RowCache(maxsize=4)
+    encoder = RowEncoder(cache=cache)
+    assert [encoder.encode(row) for row in packed] == [bytes(cmd_print_row(row)) for row in rows for _ in range(3)]
+    assert encoder.stats.cached_rows == 20
+    assert len(cache) == 4
+
+    # A second job sees the most recent rows from the first one
+    again = RowEncoder(cache=cache)
+    again.encode(packed[-1])
+    assert again.stats.cached_rows == 1
+
+
+def test_encode_rows_matches_legacy():
+    rows = _sample_rows()
+    commands = [command for _, command in RowEncoder(cache=None).encode_rows(split_rows(pack_rows(rows)))]
+    assert commands == [bytes(cmd_print_row(row)) for row in rows]
+
+
+def test_raw_crcs_only_for_chunks_with_raw_rows(monkeypatch):
+    rng = random.Random(7)
+    noisy = [bytes(rng.randrange(256) for _ in range(ROW_BYTES)) for _ in range(10)]
+    rows = split_rows(bytearray(ROW_BYTES * CRC_CHUNK_ROWS * 2) + b''.join(noisy))
+    chunks = []
+
+    def crc8_many(data, length):
+        chunks.append(len(data) // length)
+        return real(data, length)
+
+    real = encoder.crc8_many
+    monkeypatch.setattr(encoder, 'crc8_many', crc8_many)
+    commands = [command for _, command in RowEncoder(blank_feed_min=2, cache=None).encode_rows(rows)]
+    # The blank chunks never needed a CRC; the noisy rows sit in the third chunk
+    assert chunks == [10]
+    assert commands[-10:] == [bytes(cmd_print_row([(b >> x) & 1 for b in row for x in range(8)])) for row in noisy]
+
+
+def test_encoders_in_parallel_threads_build_their_own_frames():
+    from concurrent.futures import ThreadPoolExecutor
+
+    rows = split_rows(pack_rows(_sample_rows()))
+    expected = [command for _, command in RowEncoder(cache=None).encode_rows(rows)]
+
+    def encode(_):
+        return [command for _, command in RowEncoder(cache=None).encode_rows(rows)]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        assert all(result == expected for result in pool.map(encode, range(16)))
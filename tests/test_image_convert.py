@@ -0,0 +1,106 @@
+"""
+Checks the image preprocessing fast paths against the plain PIL pipeline and serial dithering.
+"""
+
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageEnhance
+
+from image_convert import (
+    _atkinson_dither, _load_scaled, _mean, _tone_table, classify_bands, preprocess_image,
+)
+
+
+def _gradient(width, height):
+    x = np.linspace(0, 255, width)
+    y = np.linspace(0, 255, height)
+    return Image.fromarray((np.add.outer(y, x) / 2).astype(np.uint8), mode='L')
+
+
+def test_tone_table_matches_image_enhance():
+    img = _gradient(300, 200)
+    for contrast, brightness in ((1.3, 0.9), (0.6, 1.25), (2.0, 1.0)):
+        expected = ImageEnhance.Brightness(ImageEnhance.Contrast(img).enhance(contrast)).enhance(brightness)
+        assert img.point(_tone_table(_mean(img), contrast, brightness)).tobytes() == expected.tobytes()
+
+
+def test_scaled_sizes_match_rotate_then_resize(tmp_path):
+    path = tmp_path / 'photo.png'
+    _gradient(1200, 500).save(path)
+    for rotate in (0, 90, 180, 270):
+        rotated = Image.open(path).rotate(rotate, expand=True)
+        expected = (384, int(rotated.height * 384 / rotated.width))
+        assert _load_scaled(path, 384, rotate).size == expected
+    assert _load_scaled(path, 384, 30).width == 384
+
+
+def test_caller_image_is_not_drafted(tmp_path):
+    path = tmp_path / 'photo.jpg'
+    _gradient(1600, 800).convert('RGB').save(path)
+    img = Image.open(path)
+    assert _load_scaled(img, 384).size == (384, 192)
+    assert (img.mode, img.size) == ('RGB', (1600, 800))
+    # A path is opened and drafted here, with the same result size
+    assert _load_scaled(path, 384).size == (384, 192)
+
+
+def test_manual_threshold_is_fused(tmp_path):
+    path = tmp_path / 'photo.png'
+    _gradient(384, 40).save(path)
+    img = preprocess_image(path, dither='manual', threshold=100)
+    expected = Image.open(path).point(lambda x: 255 if x > 100 else 0, '1')
+    assert img.mode == '1'
+    assert img.tobytes() == expected.tobytes()
+
+
+def test_strip_parallel_diffusion_matches_serial_up_to_the_seam():
+    img = _gradient(32, 520)
+    serial = np.asarray(_atkinson_dither(img, workers=1).convert('L'))
+    parallel = np.asarray(_atkinson_dither(img, workers=2).convert('L'))
+    # The first strip sees exactly the serial input; later strips differ only in texture
+    seam = 520 // 2
+    assert (parallel[:seam] == serial[:seam]).all()
+    assert abs(parallel.mean() - serial.mean()) < 2.0
+
+
+def _line_art(width, height):
+    # Anti-aliased strokes: mid-tones only along sharp edges
+    img = Image.new('L', (width * 4, height * 4), 255)
+    draw = ImageDraw.Draw(img)
+    for y in range(8, height * 4, 40):
+        draw.text((4, y), 'TOTAL 12.50  Thank you!', fill=0)
+        draw.line((0, y + 30, width * 4, y + 34), fill=0, width=5)
+    return img.resize((width, height), Image.LANCZOS)
+
+
+def test_auto_thresholds_line_art_and_diffuses_photos():
+    text, photo = _line_art(384, 64), _gradient(384, 64)
+    assert classify_bands(text) == [(0, 64, False)]
+    assert classify_bands(photo) == [(0, 64, True)]
+    assert preprocess_image(text, dither='auto').tobytes() == text.convert('1', dither=Image.NONE).tobytes()
+
+    receipt = Image.new('L', (384, 128), 255)
+    receipt.paste(text, (0, 0))
+    receipt.paste(photo, (0, 64))
+    assert classify_bands(receipt) == [(0, 64, False), (64, 128, True)]
+    out = preprocess_image(receipt, dither='auto')
+    # Photo rows come from one diffusion pass over the whole image, not a per-band crop
+    diffused = receipt.convert('1', dither=Image.FLOYDSTEINBERG)
+    assert out.crop((0, 64, 384, 128)).tobytes() == diffused.crop((0, 64, 384, 128)).tobytes()
+
+
+def test_auto_is_no_slower_than_floyd_steinberg_on_a_photo():
+    photo = _load_scaled(Path(__file__).parent.parent / 'buddha_small.jpg', 384)
+
+    def best(dither):
+        times = []
+        for _ in range(5):
+            start = time.perf_counter()
+            preprocess_image(photo, dither=dither)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    # Only the band classification comes on top of the same C Floyd-Steinberg pass
+    assert best('auto') < best('floyd-steinberg') * 2 + 0.005
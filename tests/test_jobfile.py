@@ -0,0 +1,61 @@
+"""
+Round-trips prepared job files through write_job and JobFile.
+"""
+
+import asyncio
+
+from PIL import Image
+
+from jobfile import JobFile, write_job
+from mx11 import Printer
+
+
+def test_round_trip_one_command_per_record(tmp_path):
+    commands = [(0, b'\x01\x02'), (1, b'\x03' * 10), (2, b'\x04' * 5)]
+    path = tmp_path / 'job.mx11'
+    assert write_job(path, commands, settings={'rows': 3}) == 3
+    with JobFile(path) as job:
+        assert job.settings == {'rows': 3}
+        assert job.write_size == 0
+        assert [(done, bytes(record)) for done, record in job.records()] == [
+            (0, b'\x01\x02'), (1, b'\x03' * 10), (3, b'\x04' * 5)]
+
+
+def test_write_size_packs_whole_commands(tmp_path):
+    commands = [(1, bytes([i]) * 8) for i in range(10)]
+    path = tmp_path / 'job.mx11'
+    assert write_job(path, commands, write_size=20) == 5
+    with JobFile(path) as job:
+        records = [(done, bytes(record)) for done, record in job.records()]
+    assert all(len(record) <= 20 for _, record in records)
+    assert b''.join(record for _, record in records) == b''.join(command for _, command in commands)
+    assert records[-1][0] == 10
+
+
+def test_abandoned_iteration_still_closes(tmp_path):
+    path = tmp_path / 'job.mx11'
+    write_job(path, [(1, b'abc'), (1, b'def')])
+    with JobFile(path) as job:
+        for _, record in job.records():
+            break
+
+
+def test_replay_repacks_writes_larger_than_the_connection_allows(tmp_path, recording_client):
+    img = Image.new('1', (384, 60), 1)
+    for y in range(60):
+        img.paste(0, (y, y, y + 2 + y % 7, y + 1))
+    path = tmp_path / 'job.mx11'
+    printer = Printer('AA:BB:CC:DD:EE:FF')
+    printer.export_job(path, img, process=False, write_size=244)
+    with JobFile(path) as job:
+        expected = b''.join(bytes(record) for _, record in job.records())
+        assert max(len(record) for _, record in job.records()) > 120
+
+    for mtu, limit in ((247, 244), (123, 120)):
+        printer.client = recording_client()
+        printer.client.mtu_size = mtu
+        asyncio.run(printer.play_job(path))
+        writes = printer.client.writes
+        assert b''.join(writes) == expected and max(map(len, writes)) <= limit
+    # Split back into whole commands, so every write still starts a frame
+    assert all(write[:2] == b'\x51\x78' for write in writes)
@@ -0,0 +1,78 @@
+"""
+Checks label templates: compositing, reuse of the background's encoded rows, and batching.
+"""
+
+import asyncio
+import json
+import os
+
+import pytest
+from PIL import Image, ImageDraw
+
+from encoder import RowEncoder
+from labels import Field, LabelTemplate, load_template
+from mx11 import CMD_LATTICE_START, Printer
+
+
+def _background():
+    img = Image.new('L', (384, 80), 255)
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, 0, 383, 79), outline=0, width=3)
+    draw.rectangle((10, 10, 150, 30), fill=0)
+    # Something inside the price box, which the field must clear
+    draw.line((200, 45, 370, 45), fill=0, width=2)
+    return img
+
+
+def _template():
+    return LabelTemplate(_background(), [Field('name', (10, 40, 180, 24)), Field('price', (200, 40, 170, 30), align='right')])
+
+
+def test_only_field_rows_change():
+    template = _template()
+    rows = template.rows({'name': 'Apples', 'price': '1.99'})
+    background = template._rows
+    changed = [i for i, row in enumerate(rows) if row is not background[i]]
+    assert changed and min(changed) >= 40 and max(changed) < 70
+    # The box is cleared before drawing: an empty value wipes the line at row 45
+    blank = template.rows({})
+    assert not any(blank[45][200 // 8 + 1:370 // 8])
+    assert blank[45] is not background[45]
+
+
+def test_label_commands_match_a_full_encode():
+    template = _template()
+    label = template.label(name='Pears', price='2.49')
+    encoder, rows = label.encode()
+    commands = [command for _, command in encoder.encode_rows(rows)]
+    assert commands == [command for _, command in RowEncoder(cache=None).encode_rows(rows)]
+    assert encoder.stats.cached_rows >= 80 - 30
+    with pytest.raises(ValueError):
+        template.label(colour='red')
+
+
+def test_labels_print_as_one_job(tmp_path, recording_client):
+    _background().save(tmp_path / 'shelf.png')
+    (tmp_path / 'shelf.json').write_text(json.dumps({
+        'background': 'shelf.png',
+        'fields': [{'name': 'price', 'box': [200, 40, 170, 30], 'align': 'right'}],
+    }))
+    template = load_template(tmp_path / 'shelf.json')
+    assert load_template(tmp_path / 'shelf.json') is template
+    printer = Printer('AA:BB:CC:DD:EE:FF')
+    printer.client = recording_client()
+    stats = asyncio.run(printer.print_many([template.label(price=p) for p in ('1.00', '2.00', '3.00')], separator=10))
+    assert printer.client.writes.count(CMD_LATTICE_START) == 1
+    assert stats.rows == 3 * 80 + 2 * 10
+
+
+def test_template_reloads_when_the_background_changes(tmp_path):
+    _background().save(tmp_path / 'shelf.png')
+    (tmp_path / 'shelf.json').write_text(json.dumps({'background': 'shelf.png', 'fields': []}))
+    template = load_template(tmp_path / 'shelf.json')
+    Image.new('L', (384, 40), 255).save(tmp_path / 'shelf.png')
+    stat = os.stat(tmp_path / 'shelf.png')
+    os.utime(tmp_path / 'shelf.png', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    reloaded = load_template(tmp_path / 'shelf.json')
+    assert reloaded is not template and reloaded.height == 40
+    assert load_template(tmp_path / 'shelf.json') is reloaded
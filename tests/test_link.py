@@ -0,0 +1,98 @@
+"""
+Checks link calibration against a simulated printer, and that print paths use the saved profile.
+"""
+
+import asyncio
+
+from PIL import Image
+
+from link import LinkProfile, LinkTrial, coalesce, calibrate, load_link_profile, save_link_profile
+from mx11 import CMD_LATTICE_START, Printer, job_preamble
+from protocol import frame
+
+
+class DrainingClient:
+    """
+    Takes every write at once but handles them one after another, each costing a
+    fixed overhead plus its bytes at `rate`; status answers come after the backlog.
+    Writes over `stall_size` bytes make the printer stop answering.
+    """
+    is_connected = True
+    mtu_size = 247
+
+    def __init__(self, printer, overhead=0.002, rate=80000, stall_size=200):
+        self.printer = printer
+        self.overhead = overhead
+        self.rate = rate
+        self.stall_size = stall_size
+        self.busy_until = 0.0
+        self.stalled = False
+        self.writes = []
+
+    async def write_gatt_char(self, characteristic, data, response=False):
+        data = bytes(data)
+        self.writes.append(data)
+        loop = asyncio.get_running_loop()
+        self.busy_until = max(self.busy_until, loop.time()) + self.overhead + len(data) / self.rate
+        if len(data) > self.stall_size:
+            self.stalled = True
+        if data[2] == 0xa3 and not self.stalled:
+            loop.call_at(self.busy_until, self.printer._on_notification, None, bytearray(frame(0xa3, b'\x00\x00\x00')))
+        elif data[2] == 0xa3:
+            self.stalled = False
+
+
+def test_coalesce_packs_whole_commands():
+    commands = [(1, b'a' * 30), (2, b'b' * 30), (3, b'c' * 30), (3, b'd' * 5)]
+    assert list(coalesce(commands, 64)) == [(2, b'a' * 30 + b'b' * 30), (3, b'c' * 30 + b'd' * 5)]
+    assert list(coalesce(commands, 0)) == commands
+
+
+def test_calibration_keeps_largest_size_the_printer_keeps_up_with():
+    printer = Printer('AA:BB:CC:DD:EE:FF')
+    printer.client = DrainingClient(printer)
+    profile = asyncio.run(calibrate(printer, rows=32, timeout=0.2))
+    assert profile.write_size == 182
+    assert profile.mtu == 247
+    assert profile.bytes_per_sec > 0
+    tried = [trial['write_size'] for trial in profile.trials]
+    # 244-byte writes stalled the printer, so nothing larger was tried
+    assert tried[:5] == [0, 64, 128, 182, 244] and not profile.trials[4]['answered']
+    assert profile.trials[-1]['answered'] and profile.trials[-1]['interval'] == profile.interval
+
+
+def test_profile_round_trip_and_print_path(tmp_path):
+    path = tmp_path / 'link.json'
+    save_link_profile(LinkProfile('aa:bb:cc:dd:ee:ff', write_size=128), path=str(path))
+    profile = load_link_profile('AA:BB:CC:DD:EE:FF', path=str(path))
+    assert profile.write_size == 128 and load_link_profile('11:22:33:44:55:66', path=str(path)) is None
+
+    printer = Printer('AA:BB:CC:DD:EE:FF')
+    printer.client = DrainingClient(printer)
+    printer.link = profile
+    image = Image.new('1', (384, 40), 1)
+    image.paste(0, (0, 0, 384, 20))
+    asyncio.run(printer.print_image(image, process=False))
+    writes = printer.client.writes
+    preamble = list(job_preamble(0xffff))
+    assert writes[:len(preamble)] == preamble and CMD_LATTICE_START in preamble
+    rows = writes[len(preamble):]
+    assert all(len(data) <= 128 for data in rows)
+    assert len(rows) < 40
+
+
+def test_write_size_capped_by_current_mtu():
+    printer = Printer('AA:BB:CC:DD:EE:FF')
+    printer.client = DrainingClient(printer)
+    printer.client.mtu_size = 100
+    printer.link = LinkProfile('AA:BB:CC:DD:EE:FF', write_size=244, mtu=247)
+    image = Image.new('1', (384, 40), 1)
+    image.paste(0, (0, 0, 384, 20))
+    asyncio.run(printer.print_image(image, process=False))
+    rows = printer.client.writes[len(list(job_preamble(0xffff))):]
+    assert all(len(data) <= 97 for data in rows) and any(len(data) > 56 for data in rows)
+
+
+def test_trial_throughput_excludes_the_status_round_trip():
+    trial = LinkTrial(0, 0.0, 10, 1000, burst=0.05, elapsed=0.3, answered=True, round_trip=0.1)
+    assert trial.bytes_per_sec == 1000 / 0.2
@@ -0,0 +1,72 @@
+"""
+Checks the memory-mapped PBM and raw packed-row input path against the PIL path.
+"""
+
+import asyncio
+import mmap
+
+import pytest
+from PIL import Image
+
+from encoder import _PBM_TO_PRINTER, ROW_BYTES, load_packed, pack_image, split_rows
+from mx11 import Printer
+
+
+def _label():
+    img = Image.new('1', (384, 30), 1)
+    img.paste(0, (10, 5, 200, 12))
+    img.paste(0, (3, 20, 4, 30))
+    return img
+
+
+def test_pbm_rows_match_pil_packing(tmp_path):
+    path = tmp_path / 'label.pbm'
+    _label().save(path)
+    assert open(path, 'rb').read(2) == b'P4'
+    rows = load_packed(path)
+    assert [bytes(row) for row in rows] == [bytes(row) for row in split_rows(pack_image(_label()))]
+
+
+def test_pbm_header_comments_and_width_check(tmp_path):
+    path = tmp_path / 'commented.pbm'
+    raster = pack_image(_label()).translate(_PBM_TO_PRINTER)
+    path.write_bytes(b'P4\n# rendered upstream\n384 30\n' + raster)
+    assert [bytes(row) for row in load_packed(path)] == [bytes(row) for row in split_rows(pack_image(_label()))]
+    narrow = tmp_path / 'narrow.pbm'
+    narrow.write_bytes(b'P4 200 2\n' + bytes(50))
+    with pytest.raises(ValueError):
+        load_packed(narrow)
+
+
+def test_raw_rows_are_views_of_the_mapping(tmp_path):
+    path = tmp_path / 'roll.bin'
+    packed = pack_image(_label())
+    path.write_bytes(packed)
+    rows = load_packed(path)
+    assert len(rows) == 30 and all(len(row) == ROW_BYTES for row in rows)
+    assert isinstance(rows[0].obj, mmap.mmap)
+    assert b''.join(rows) == packed
+
+
+def test_raw_extension_is_never_sniffed_as_pbm(tmp_path):
+    # A first row that happens to start with the PBM magic bytes
+    packed = b'P4' + bytes(ROW_BYTES - 2) + bytes(range(ROW_BYTES))
+    path = tmp_path / 'roll.raw'
+    path.write_bytes(packed)
+    assert b''.join(load_packed(path)) == packed
+    other = tmp_path / 'roll.dat'
+    other.write_bytes(bytes(ROW_BYTES))
+    with pytest.raises(ValueError):
+        load_packed(other)
+
+
+def test_print_from_pbm_sends_the_same_bytes(tmp_path, recording_client):
+    path = tmp_path / 'label.pbm'
+    _label().save(path)
+    sent = []
+    for source in (_label(), path):
+        printer = Printer('AA:BB:CC:DD:EE:FF')
+        printer.client = recording_client()
+        asyncio.run(printer.print_image(source, process=False))
+        sent.append(printer.client.writes)
+    assert sent[0] == sent[1]
@@ -0,0 +1,47 @@
+"""
+Checks PrintProgress's rate and ETA math and how often the web server publishes it.
+"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from mx11 import PrintProgress
+from web_server import EventHub, PrintQueue
+
+
+def test_rates_and_eta():
+    progress = PrintProgress(rows_encoded=100, rows_total=400, bytes_sent=5600, elapsed=2.0)
+    assert progress.rows_per_sec == 50.0
+    assert progress.bytes_per_sec == 2800.0
+    assert progress.eta == pytest.approx(6.0)
+    assert progress.as_dict() == {'rows_encoded': 100, 'rows_total': 400, 'bytes_sent': 5600, 'elapsed': 2.0,
+                                  'rows_per_sec': 50.0, 'bytes_per_sec': 2800.0, 'eta': pytest.approx(6.0)}
+    assert PrintProgress(400, 400, 22400, 8.0).eta == 0.0
+
+
+def test_no_eta_before_a_rate():
+    # Nothing sent yet, or the first row written with no measurable time gone by
+    for progress in (PrintProgress(0, 400, 0, 0.5), PrintProgress(1, 400, 56, 0.0)):
+        assert progress.rows_per_sec == 0.0
+        assert progress.eta is None
+        # None survives the trip to the browser as null
+        assert json.loads(json.dumps(progress.as_dict()))['eta'] is None
+
+
+def test_progress_events_are_throttled_but_the_last_row_goes_out(monkeypatch):
+    hub = EventHub()
+    subscriber = hub.subscribe()
+    queue = SimpleNamespace(current={'id': 7, 'kind': 'print-image'}, events=hub)
+    clock = iter([10.0, 10.05, 10.1, 10.3, 10.31])
+    monkeypatch.setattr('web_server.time.monotonic', lambda: next(clock))
+    for rows in (1, 2, 3, 4, 5):
+        PrintQueue.report_progress(queue, PrintProgress(rows, 5, rows * 56, rows * 0.1))
+    sent = []
+    while not subscriber.empty():
+        data = subscriber.get_nowait().decode('utf-8').split('\n')[1]
+        sent.append(json.loads(data[len('data: '):]))
+    # Row 1 starts the interval, row 4 is the next one past it, row 5 is the last
+    assert [event['rows_encoded'] for event in sent] == [1, 4, 5]
+    assert sent[0]['id'] == 7 and sent[-1]['eta'] == 0.0
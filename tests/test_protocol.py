@@ -0,0 +1,61 @@
+"""
+Checks the protocol frame builders byte-for-byte against the original
+list-based construction.
+"""
+
+from mx11 import bs, byte_encode, cmd_print_row, job_preamble, run_length_encode
+from protocol import (
+    CHECKSUM_TABLE, FRAME_OVERHEAD, apply_energy_frame, crc8, crc8_many, energy_frame,
+    feed_frame, frame_into, speed_command,
+)
+
+
+def _legacy_chk_sum(b_arr, i, i2):
+    b2 = 0
+    for i3 in range(i, i + i2):
+        b2 = CHECKSUM_TABLE[(b2 ^ b_arr[i3]) & 0xff]
+    return b2
+
+
+def _legacy_frame(op, payload):
+    b_arr = bs([81, 120, op, 0, len(payload), 0] + list(payload) + [0, 0xff])
+    b_arr[-2] = _legacy_chk_sum(b_arr, 6, len(payload))
+    return bytes(b_arr)
+
+
+def test_fixed_frames_match_legacy():
+    for val in (0, 1, 125, 0x1234, 0xffff):
+        assert energy_frame(val) == _legacy_frame(-81, [(val >> 8) & 0xff, val & 0xff])
+    assert apply_energy_frame() == _legacy_frame(-66, [1])
+    for lines in (1, 8, 255):
+        assert feed_frame(lines) == _legacy_frame(-95, [lines & 0xff, 0])
+    assert speed_command(8) == b'\x51\x78\xf1\x00\x01\x00\x08\xff'
+    assert job_preamble(0xffff)[3] == energy_frame(0xffff)
+
+
+def test_row_frames_match_legacy():
+    rows = [[0] * 384, [1] * 384, [x % 3 == 0 for x in range(384)], [x // 100 % 2 for x in range(384)]]
+    for row in rows:
+        row = [int(v) for v in row]
+        rle = run_length_encode(row)
+        expected = _legacy_frame(-65, rle) if len(rle) <= 48 else _legacy_frame(-94, byte_encode(row))
+        assert cmd_print_row(row) == expected
+
+
+def test_frame_into_preallocated_buffer():
+    buf = bytearray(64)
+    end = frame_into(buf, 3, 0xa2, bytes(range(48)))
+    assert end == 3 + 48 + FRAME_OVERHEAD
+    assert bytes(buf[3:end]) == _legacy_frame(-94, list(range(48)))
+    assert crc8(bytes(range(48))) == buf[end - 2]
+
+
+def test_crc8_many_matches_crc8():
+    import random
+    rng = random.Random(32)
+    for length in (1, 2, 7, 48):
+        payloads = [bytes(rng.randrange(256) for _ in range(length)) for _ in range(200)]
+        assert list(crc8_many(b''.join(payloads), length)) == [crc8(p) for p in payloads]
+        assert list(crc8_many(b''.join(payloads), length)) == [_legacy_chk_sum(p, 0, length) for p in payloads]
+        packed = bytearray(b''.join(payloads))
+        assert crc8_many(memoryview(packed), length) == crc8_many(packed, length) == crc8_many(bytes(packed), length)
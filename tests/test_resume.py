@@ -0,0 +1,99 @@
+"""
+Checks that a job cut short by a failed write resumes from its encoded stream with the requested overlap.
+"""
+
+import asyncio
+
+import pytest
+from PIL import Image
+
+from mx11 import CMD_LATTICE_END, Printer, job_preamble
+from protocol import apply_energy_frame, energy_frame, feed_frame, speed_command
+from resume import TrackedJob, print_resumable
+
+
+def _image(rows=100):
+    # Every row different, so every row is its own command
+    img = Image.new('1', (384, rows), 1)
+    for y in range(rows):
+        img.paste(0, (y, y, y + 3 + y % 5, y + 1))
+    return img
+
+
+def _preamble():
+    return list(job_preamble(0xffff))
+
+
+def test_resume_continues_from_overlap_without_reencoding(recording_client):
+    reference = Printer('AA:BB:CC:DD:EE:FF')
+    reference.client = recording_client()
+    asyncio.run(reference.print_image(_image(), process=False))
+    rows = reference.client.writes[len(_preamble()):]
+    assert len(rows) == 100
+
+    printer = Printer('AA:BB:CC:DD:EE:FF')
+    printer.client = recording_client(fail_after=len(_preamble()) + 40)
+    with pytest.raises(ConnectionError):
+        asyncio.run(printer.print_image(_image(), process=False))
+    assert printer.interrupted.rows_sent == 40
+    printer.client = recording_client()
+    stats = asyncio.run(printer.resume_job(overlap=8))
+    assert printer.client.writes == _preamble() + rows[32:]
+    # The encoder ran once over the image: replayed rows came from the job's record
+    assert stats.rows == 100
+    assert printer.interrupted is None
+    assert asyncio.run(printer.resume_job()) is None
+
+
+def test_restart_resends_settings_and_whole_feeds():
+    commands = [(1, b'row1'), (1, energy_frame(0x8000)), (1, apply_energy_frame()), (2, b'row2'),
+                (12, feed_frame(10)), (12, speed_command(20)), (13, b'row13'), (14, b'row14')]
+    job = TrackedJob(commands, 14, 0xffff)
+    sent = list(job.commands())
+    assert sent == commands
+    job.rows_sent = 14
+    # Row 4 is inside the feed: the whole feed goes again, after the settings made before it
+    assert job.restart(overlap=10) == 2
+    assert list(job.commands()) == [commands[1], commands[2], commands[4], commands[5], commands[6], commands[7]]
+    job.rows_sent = 1
+    assert job.restart(overlap=5) == 0
+    assert list(job.commands())[0] == (1, b'row1')
+
+
+def test_print_resumable_reconnects_and_finishes_the_batch(recording_client):
+    printer = Printer('AA:BB:CC:DD:EE:FF')
+    printer.client = recording_client(fail_after=len(_preamble()) + 60)
+    clients = []
+
+    async def connect():
+        printer.client = recording_client()
+        clients.append(printer.client)
+
+    printer.connect = connect
+    stats = asyncio.run(print_resumable(printer, printer.print_many([_image(50), _image(50)], process=False),
+                                        attempts=2, overlap=4, delay=0))
+    assert len(clients) == 1 and printer.interrupted is None
+    writes = clients[0].writes
+    assert writes[:len(_preamble())] == _preamble() and writes[-1] == CMD_LATTICE_END
+    assert len(writes) == len(_preamble()) + 100 - 56 + 1
+    assert stats.rows == 100
+
+
+def test_bad_input_does_not_resume_an_earlier_job(recording_client):
+    printer = Printer('AA:BB:CC:DD:EE:FF')
+    printer.client = recording_client(fail_after=len(_preamble()) + 14)
+    with pytest.raises(ConnectionError):
+        asyncio.run(printer.print_image(_image(), process=False))
+    assert printer.interrupted is not None
+    connects = []
+
+    async def connect():
+        connects.append(1)
+        printer.client = recording_client()
+
+    printer.connect = connect
+    printer.client = recording_client()
+    narrow = Image.new('1', (200, 10), 1)
+    with pytest.raises(ValueError):
+        asyncio.run(print_resumable(printer, printer.print_image(narrow, process=False), attempts=1, delay=0))
+    assert not connects and printer.interrupted is None and not printer.client.writes
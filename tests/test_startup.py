@@ -0,0 +1,13 @@
+"""
+Keeps control commands free of the image libraries (see bench_startup.py for timings).
+"""
+
+from bench_startup import FEED, image_libs_loaded
+
+
+def test_feed_does_not_import_pil_or_numpy():
+    assert image_libs_loaded(FEED) == []
+
+
+def test_check_sees_image_libraries():
+    assert image_libs_loaded('import image_convert') == ['PIL']
@@ -0,0 +1,83 @@
+"""
+Drives ThermalScheduler against a scripted printer status sequence.
+"""
+
+import asyncio
+
+from PIL import Image
+
+from bands import BAND_LEVELS
+from mx11 import Printer, PrinterStatus
+from protocol import energy_frame
+from thermal import ThermalScheduler
+
+OK = PrinterStatus(0)
+HOT = PrinterStatus(0b100)
+
+
+class ScriptedPrinter:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.writes = []
+
+    async def query_status(self, timeout=None):
+        return self.statuses.pop(0) if self.statuses else OK
+
+    async def _write(self, data):
+        self.writes.append(data)
+
+
+def run_rows(scheduler, printer, rows, energy=0xffff):
+    async def job():
+        scheduler.start(energy)
+        for rows_done in range(1, rows + 1):
+            if scheduler.due(rows_done) and not await scheduler.check(printer, rows_done):
+                return rows_done
+        return rows
+    return asyncio.run(job())
+
+
+def test_overheat_lowers_energy_pauses_and_recovers():
+    scheduler = ThermalScheduler(poll_rows=10, cooldown=0.01, recover_polls=1)
+    # Poll at row 10 finds it hot, the cool-down poll finds it cooled, later polls are OK
+    printer = ScriptedPrinter([HOT, OK])
+    assert run_rows(scheduler, printer, 60) == 60
+    actions = [decision.action for decision in scheduler.decisions]
+    assert actions[:2] == ['cool-down', 'resume']
+    assert 'raise-energy' in actions
+    assert scheduler.decisions[0].energy < 0xffff
+    assert scheduler.energy == 0xffff
+    assert scheduler.pause == 0.0
+    assert energy_frame(scheduler.decisions[0].energy) in printer.writes
+
+
+def test_no_paper_stops_and_missing_status_is_ignored():
+    scheduler = ThermalScheduler(poll_rows=10)
+    printer = ScriptedPrinter([None, PrinterStatus(0b1)])
+    assert run_rows(scheduler, printer, 100) == 20
+    assert [decision.action for decision in scheduler.decisions] == ['stop']
+    assert printer.writes == []
+
+
+def test_bands_scale_from_the_thermal_limit(recording_client):
+    # 32 sparse rows, then dense ones: the band switches to full energy at row 32
+    img = Image.new('1', (384, 96), 0)
+    img.paste(1, (0, 0, 384, 32))
+    for y in range(32):
+        img.putpixel((y, y), 0)
+    printer = Printer('AA:BB:CC:DD:EE:FF')
+    printer.client = recording_client()
+    statuses = [HOT, OK]
+
+    async def query_status(timeout=None):
+        return statuses.pop(0) if statuses else OK
+
+    printer.query_status = query_status
+    scheduler = ThermalScheduler(poll_rows=10, cooldown=0.01, recover_polls=100)
+    asyncio.run(printer.print_image(img, process=False, bands=True, thermal=scheduler))
+    limit = int(0xffff * scheduler.energy_step)
+    sparse, dense = int(limit * BAND_LEVELS[0][1]), limit
+    energies = [write for write in printer.client.writes if write[2] == energy_frame(0)[2]]
+    # The sparse band, the step-down inside it, then the dense band under the lowered limit
+    assert energies[-3:] == [energy_frame(int(0xffff * BAND_LEVELS[0][1])), energy_frame(sparse), energy_frame(dense)]
+    assert scheduler.energy == limit and scheduler.scale == 1.0
@@ -0,0 +1,43 @@
+"""
+Round-trips TrafficTracer captures and checks the per-command summary.
+"""
+
+from protocol import energy_frame, feed_frame, speed_command
+from tracer import RX, TX, TrafficTracer, iter_frames, read_capture, summarize
+
+STATUS_REQUEST = b'\x51\x78\xa3\x00\x01\x00\x00\x00\xff'
+STATUS_RESPONSE = b'\x51\x78\xa3\x00\x03\x00\x00\x00\x00\x00\xff'
+
+
+def test_ring_keeps_newest_records(tmp_path):
+    tracer = TrafficTracer(capacity=4, slot_size=8)
+    for i in range(6):
+        tracer.tx(bytes([i]) * (4 + i))
+    assert len(tracer) == 4
+    records = list(tracer.records())
+    assert [length for _, _, length, _ in records] == [6, 7, 8, 9]
+    # Longer than a slot: the length survives, the data is cut at slot_size
+    assert records[-1][3] == bytes([5]) * 8
+
+    path = tmp_path / 'capture.mx11trace'
+    assert tracer.dump(path) == 4
+    _, loaded = read_capture(path)
+    assert loaded == records
+
+
+def test_iter_frames_walks_packed_writes():
+    packed = speed_command(8) + energy_frame(0x1234) + feed_frame(3)
+    assert list(iter_frames(packed)) == [0xf1, 0xaf, 0xa1]
+    assert list(iter_frames(b'\x00\x01')) == []
+
+
+def test_summary_counts_frames_and_response_latency():
+    records = [
+        (0.000, TX, len(STATUS_REQUEST), STATUS_REQUEST),
+        (0.010, RX, len(STATUS_RESPONSE), STATUS_RESPONSE),
+        (0.020, TX, 20, feed_frame(1) + feed_frame(2)),
+    ]
+    stats = summarize(records)
+    assert stats[(TX, 0xa1)]['frames'] == 2
+    assert stats[(RX, 0xa3)]['gaps'] == [10.0]
+    assert stats[(TX, 0xa1)]['gaps'] == [20.0]
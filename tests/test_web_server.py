@@ -0,0 +1,141 @@
+"""
+Checks the web server's print queue, its job and status events and the /queue and /events endpoints.
+"""
+
+import asyncio
+import http.client
+import json
+import threading
+from http.server import ThreadingHTTPServer
+
+from PIL import Image
+
+import web_server
+from mx11 import Printer
+from protocol import feed_frame
+from web_server import EventHub, PrinterHandler, PrintQueue
+
+
+def _queue(recording_client):
+    """A PrintQueue whose printer writes to a fake client; connect/disconnect do nothing."""
+    print_queue = PrintQueue(config_file=None)
+    printer = Printer('AA:BB:CC:DD:EE:FF')
+    printer.client = recording_client()
+
+    async def nothing():
+        pass
+
+    printer.connect = printer.disconnect = nothing
+    print_queue.printer = printer
+    return print_queue
+
+
+def _events(subscriber):
+    """(event, data) for every message waiting in an EventHub subscription."""
+    events = []
+    while not subscriber.empty():
+        event, data = subscriber.get_nowait().decode('utf-8').rstrip('\n').split('\n')
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+def test_jobs_run_in_submission_order(recording_client):
+    print_queue = _queue(recording_client)
+    started, release = threading.Event(), threading.Event()
+
+    async def first(printer):
+        started.set()
+        await asyncio.get_running_loop().run_in_executor(None, release.wait)
+        return 'first'
+
+    futures = [print_queue.submit('hold', first)]
+    assert started.wait(5)
+    futures += [print_queue.submit('feed', lambda printer, n=n: printer.feed_paper(n)) for n in (3, 4)]
+    snapshot = print_queue.snapshot()
+    assert snapshot['current']['id'] == 1 and snapshot['current']['state'] == 'running'
+    assert [(job['id'], job['state']) for job in snapshot['pending']] == [(2, 'queued'), (3, 'queued')]
+    release.set()
+    assert [future.result(5) for future in futures] == ['first', None, None]
+    assert print_queue.printer.client.writes == [feed_frame(3), feed_frame(4)]
+    assert [job['id'] for job in print_queue.snapshot()['history']] == [1, 2, 3]
+
+
+def test_job_states_and_status_events(recording_client):
+    print_queue = _queue(recording_client)
+    subscriber = print_queue.events.subscribe()
+    image = Image.new('1', (384, 20), 0)
+    stats = print_queue.submit('print-image', lambda printer: printer.print_image(
+        image, process=False, on_progress=print_queue.report_progress)).result(5)
+
+    async def broken(printer):
+        raise RuntimeError('no paper')
+
+    failed = print_queue.submit('feed', broken)
+    try:
+        failed.result(5)
+    except RuntimeError:
+        pass
+    print_queue.submit('feed', lambda printer: printer.feed_paper(1)).result(5)
+    events = _events(subscriber)
+
+    jobs = [(data['id'], data['state']) for event, data in events if event == 'job']
+    assert jobs == [(1, 'queued'), (1, 'running'), (1, 'done'), (2, 'queued'), (2, 'running'), (2, 'failed'),
+                    (3, 'queued'), (3, 'running'), (3, 'done')]
+    statuses = [data for event, data in events if event == 'status']
+    assert [(status['id'], status['busy'], status['success']) for status in statuses] == [
+        (1, True, True), (1, False, True), (2, True, True), (2, False, False), (3, True, True), (3, False, True)]
+    assert statuses[3]['message'] == 'feed job #2 failed: no paper'
+    progress = [data for event, data in events if event == 'progress']
+    assert progress[-1]['id'] == 1 and progress[-1]['rows_encoded'] == progress[-1]['rows_total'] == 20
+    history = print_queue.snapshot()['history']
+    assert history[0]['result'] == stats.as_dict() and history[1]['error'] == 'no paper'
+
+
+def test_event_framing():
+    hub = EventHub()
+    subscriber = hub.subscribe()
+    hub.publish('progress', {'id': 1, 'rows_encoded': 5})
+    assert subscriber.get_nowait() == b'event: progress\ndata: {"id": 1, "rows_encoded": 5}\n\n'
+    hub.unsubscribe(subscriber)
+    hub.publish('progress', {})
+    assert subscriber.empty()
+
+
+def test_queue_and_events_endpoints(recording_client, monkeypatch):
+    monkeypatch.setattr(web_server, 'EVENTS_KEEPALIVE', 0.05)
+    print_queue = _queue(recording_client)
+    monkeypatch.setattr(PrinterHandler, 'queue', print_queue)
+    server = ThreadingHTTPServer(('localhost', 0), PrinterHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        port = server.server_address[1]
+        stream = http.client.HTTPConnection('localhost', port, timeout=5)
+        stream.request('GET', '/events')
+        response = stream.getresponse()
+        assert response.getheader('Content-type') == 'text/event-stream'
+        print_queue.submit('feed', lambda printer: printer.feed_paper(2)).result(5)
+
+        lines = []
+        while len([line for line in lines if line.startswith(b'event: ')]) < 5:
+            lines.append(response.fp.readline())
+        # Each event is an event line and a data line, closed by a blank line
+        assert lines[:3] == [b'event: job\n', lines[1], b'\n'] and lines[1].startswith(b'data: {')
+        assert json.loads(lines[1][len(b'data: '):])['state'] == 'queued'
+        assert [line for line in lines if line.startswith(b'event: ')] == [
+            b'event: job\n', b'event: job\n', b'event: status\n', b'event: job\n', b'event: status\n']
+        # Then the last event's data, and keep-alive comments while idle
+        rest = []
+        while (line := response.fp.readline()) != b': keep-alive\n':
+            rest.append(line)
+        assert json.loads(rest[0][len(b'data: '):])['message'] == 'Finished feed job #1' and rest[1:] == [b'\n']
+        stream.close()
+
+        client = http.client.HTTPConnection('localhost', port, timeout=5)
+        client.request('GET', '/queue')
+        snapshot = json.loads(client.getresponse().read())
+        client.close()
+        assert snapshot['success'] and snapshot['current'] is None and snapshot['pending'] == []
+        assert [(job['kind'], job['state']) for job in snapshot['history']] == [('feed', 'done')]
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,148 @@
+"""
+thermal.py - Thermal-aware pacing for long MX11 print jobs
+
+The printer reports overheating and low battery in its status byte, but only
+when asked. ThermalScheduler polls status every `poll_rows` rows while a job is
+being sent and reacts before thermal protection stops the print:
+
+- overheating: lower the energy one step, pause until the flag clears (up to
+  `max_pause`), and keep a short pause between later poll windows;
+- sustained OK polls: halve that pause, then step the energy back up towards
+  the job's requested value, so throughput recovers once the head has cooled;
+- low battery: cap the energy one step below the requested value;
+- no paper: stop sending.
+
+The scheduler owns the job's energy. With bands (bands.py), a band switch asks
+band_energy() for its energy instead of sending its planned value, so the
+band's scale and the thermal limit multiply rather than undoing each other.
+
+Every decision is logged and kept in `decisions`.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass
+
+from protocol import apply_energy_frame, energy_frame
+
+logger = logging.getLogger('ThermalScheduler')
+
+
+@dataclass
+class ThrottleDecision:
+    rows_done: int
+    action: str
+    energy: int
+    pause: float
+    detail: str = ''
+
+    def as_dict(self):
+        return asdict(self)
+
+
+class ThermalScheduler:
+    def __init__(self, poll_rows=200, energy_step=0.85, min_energy=0x4000, cooldown=1.0,
+                 max_pause=30.0, recover_polls=2, status_timeout=2.0):
+        self.poll_rows = poll_rows
+        self.energy_step = energy_step
+        self.min_energy = min_energy
+        self.cooldown = cooldown
+        self.max_pause = max_pause
+        self.recover_polls = recover_polls
+        self.status_timeout = status_timeout
+        self.start(0xffff)
+
+    def start(self, energy):
+        """Resets the scheduler for a job printed at `energy`."""
+        self.target_energy = energy
+        # The thermal limit; what is sent is this times the current band's scale
+        self.energy = energy
+        self.scale = 1.0
+        self.pause = 0.0
+        self.next_poll = self.poll_rows
+        self.ok_streak = 0
+        self.battery_warned = False
+        self.decisions = []
+        # Energies stepped down from, restored in reverse order on recovery
+        self._lowered_from = []
+
+    def due(self, rows_done):
+        return rows_done >= self.next_poll
+
+    def _decide(self, rows_done, action, detail=''):
+        decision = ThrottleDecision(rows_done, action, self.energy, self.pause, detail)
+        self.decisions.append(decision)
+        logger.info(f"Row {rows_done}: {action} (energy 0x{self.energy:04x}, pause {self.pause:.1f}s) {detail}".rstrip())
+
+    def band_energy(self, scale):
+        """
+        Switches to a band printed at `scale` of the job's energy. Returns the energy
+        to send for it under the current limit, or None if that is already set.
+        """
+        before = self._output()
+        self.scale = scale
+        energy = self._output()
+        return None if energy == before else energy
+
+    def _output(self):
+        return max(1, int(self.energy * self.scale))
+
+    async def _set_energy(self, printer, energy):
+        self.energy = energy
+        await printer._write(energy_frame(self._output()))
+        await printer._write(apply_energy_frame())
+
+    async def check(self, printer, rows_done):
+        """
+        Polls status and applies the policy. Returns False if the job should stop
+        (no paper), True otherwise. An unanswered poll changes nothing.
+        """
+        self.next_poll = rows_done + self.poll_rows
+        status = await printer.query_status(timeout=self.status_timeout)
+        if status is None:
+            logger.debug(f"Row {rows_done}: no status response, keeping current settings")
+            return True
+        if status.no_paper:
+            self._decide(rows_done, 'stop', 'printer reports no paper')
+            return False
+        if status.low_battery and not self.battery_warned:
+            self.battery_warned = True
+            self.target_energy = max(self.min_energy, int(self.target_energy * self.energy_step))
+            if self.energy > self.target_energy:
+                await self._set_energy(printer, self.target_energy)
+            self._decide(rows_done, 'cap-energy', 'low battery')
+        if status.overheating:
+            await self._cool_down(printer, rows_done)
+            return True
+
+        self.ok_streak += 1
+        if self.pause:
+            self.pause = self.pause / 2 if self.pause > self.cooldown / 4 else 0.0
+            self._decide(rows_done, 'shorten-pause')
+        if self.ok_streak >= self.recover_polls and self._lowered_from:
+            self.ok_streak = 0
+            await self._set_energy(printer, min(self.target_energy, self._lowered_from.pop()))
+            self._decide(rows_done, 'raise-energy')
+        if self.pause:
+            await asyncio.sleep(self.pause)
+        return True
+
+    async def _cool_down(self, printer, rows_done):
+        self.ok_streak = 0
+        self.pause = min(self.max_pause, max(self.cooldown, self.pause * 2))
+        lowered = max(self.min_energy, int(self.energy * self.energy_step))
+        if lowered < self.energy:
+            self._lowered_from.append(self.energy)
+            await self._set_energy(printer, lowered)
+        self._decide(rows_done, 'cool-down', 'printer reports overheating')
+        waited = 0.0
+        start = time.monotonic()
+        while waited < self.max_pause:
+            await asyncio.sleep(min(self.pause, self.max_pause - waited))
+            waited = time.monotonic() - start
+            status = await printer.query_status(timeout=self.status_timeout)
+            if status is None or not status.overheating:
+                self._decide(rows_done, 'resume', f'after {waited:.1f}s')
+                return
+        self._decide(rows_done, 'resume', f'still overheating after {waited:.1f}s, leaving it to the printer')
@@ -0,0 +1,197 @@
+"""
+tracer.py - Binary TX/RX traffic capture for MX11 printers
+
+TrafficTracer records every frame written to or notified by the printer, with a
+monotonic timestamp, into fixed-size slots of a ring buffer allocated up front;
+once full, the oldest records are overwritten. A Printer without a tracer pays
+nothing. dump() writes a compact capture file (little-endian):
+
+    header   8s magic 'MX11TRC\\0' | u16 version | u16 slot size | u32 records
+             | f64 wall-clock time of the first timestamp
+    records  f64 seconds since start | u8 direction (0 TX, 1 RX)
+             | u16 frame length | u16 bytes stored | data
+
+Frames longer than the slot size keep their length but only the first bytes.
+
+Run as a script to summarise a capture per command:
+
+    python tracer.py capture.mx11trace [--frames]
+"""
+
+import struct
+import time
+from array import array
+
+MAGIC = b'MX11TRC\0'
+VERSION = 1
+TX = 0
+RX = 1
+
+_HEADER = struct.Struct('<8sHHId')
+_RECORD = struct.Struct('<dBHH')
+
+COMMAND_NAMES = {
+    0xa1: 'feed',
+    0xa2: 'row (raw)',
+    0xa3: 'status',
+    0xa4: 'quality',
+    0xa6: 'lattice',
+    0xa8: 'serial',
+    0xaf: 'energy',
+    0xbe: 'apply energy',
+    0xbf: 'row (RLE)',
+    0xf0: 'calibrate',
+    0xf1: 'speed',
+}
+
+
+class TrafficTracer:
+    def __init__(self, capacity=8192, slot_size=256):
+        self.capacity = capacity
+        self.slot_size = slot_size
+        self._data = bytearray(capacity * slot_size)
+        self._view = memoryview(self._data)
+        self._times = array('d', bytes(8 * capacity))
+        self._lengths = array('H', bytes(2 * capacity))
+        self._dirs = bytearray(capacity)
+        self._count = 0
+        self._start = time.perf_counter()
+        self._wall_start = time.time()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def record(self, direction, data):
+        i = self._count % self.capacity
+        self._count += 1
+        n = len(data)
+        offset = i * self.slot_size
+        if n <= self.slot_size:
+            self._data[offset:offset + n] = data
+        else:
+            self._view[offset:offset + self.slot_size] = memoryview(data)[:self.slot_size]
+        self._times[i] = time.perf_counter() - self._start
+        self._lengths[i] = n if n < 0xffff else 0xffff
+        self._dirs[i] = direction
+
+    def tx(self, data):
+        self.record(TX, data)
+
+    def rx(self, data):
+        self.record(RX, data)
+
+    def clear(self):
+        self._count = 0
+
+    def records(self):
+        """Yields (seconds, direction, length, data) oldest first."""
+        count = len(self)
+        first = self._count - count
+        for k in range(first, self._count):
+            i = k % self.capacity
+            stored = min(self._lengths[i], self.slot_size)
+            offset = i * self.slot_size
+            yield self._times[i], self._dirs[i], self._lengths[i], bytes(self._view[offset:offset + stored])
+
+    def dump(self, path):
+        """Writes the buffered records to a capture file. Returns the record count."""
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, self.slot_size, len(self), self._wall_start))
+            for seconds, direction, length, data in self.records():
+                f.write(_RECORD.pack(seconds, direction, length, len(data)))
+                f.write(data)
+        return len(self)
+
+
+def read_capture(path):
+    """Returns (wall-clock start, [(seconds, direction, length, data), ...]) from a capture file."""
+    with open(path, 'rb') as f:
+        blob = f.read()
+    if len(blob) < _HEADER.size:
+        raise ValueError(f"{path} is not a traffic capture (truncated header).")
+    magic, version, _, count, wall_start = _HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a traffic capture.")
+    if version != VERSION:
+        raise ValueError(f"Unsupported capture version {version} in {path}.")
+    offset = _HEADER.size
+    records = []
+    for _ in range(count):
+        seconds, direction, length, stored = _RECORD.unpack_from(blob, offset)
+        offset += _RECORD.size
+        records.append((seconds, direction, length, blob[offset:offset + stored]))
+        offset += stored
+    return wall_start, records
+
+
+def iter_frames(data):
+    """Yields the opcode of each frame in a write (a job record may hold several); none if unframed."""
+    i, n = 0, len(data)
+    while i + 6 <= n and data[i] == 0x51 and data[i + 1] == 0x78:
+        op = data[i + 2]
+        yield op
+        payload = data[i + 4] | (data[i + 5] << 8)
+        # The speed command carries no checksum byte
+        i += 6 + payload + (1 if op == 0xf1 else 2)
+
+
+def summarize(records):
+    """
+    Per (direction, command): frames, bytes, and the gaps in milliseconds between
+    consecutive writes (TX) or from the matching request to the response (RX).
+    """
+    stats = {}
+    last_tx = None
+    last_request = {}
+    for seconds, direction, length, data in records:
+        ops = list(iter_frames(data)) or [None]
+        key = (direction, ops[0])
+        entry = stats.setdefault(key, {'frames': 0, 'bytes': 0, 'gaps': []})
+        entry['frames'] += len(ops)
+        entry['bytes'] += length
+        if direction == TX:
+            if last_tx is not None:
+                entry['gaps'].append((seconds - last_tx) * 1000)
+            last_tx = seconds
+            for op in ops:
+                last_request[op] = seconds
+        elif ops[0] in last_request:
+            entry['gaps'].append((seconds - last_request.pop(ops[0])) * 1000)
+    return stats
+
+
+def _format_summary(records):
+    lines = []
+    if records:
+        duration = records[-1][0] - records[0][0]
+        tx_bytes = sum(length for _, direction, length, _ in records if direction == TX)
+        rate = tx_bytes / duration if duration > 0 else 0.0
+        lines.append(f"{len(records)} records over {duration:.3f}s, {tx_bytes} bytes sent ({rate:.0f} B/s)")
+    lines.append(f"{'dir':<4}{'command':<14}{'frames':>8}{'bytes':>10}{'gap ms: mean':>14}{'min':>8}{'max':>8}")
+    for (direction, op), entry in sorted(summarize(records).items(), key=lambda item: (item[0][0], item[0][1] or 0)):
+        name = COMMAND_NAMES.get(op, f'0x{op:02x}' if op is not None else '?')
+        gaps = entry['gaps']
+        timing = (f"{sum(gaps) / len(gaps):14.2f}{min(gaps):8.2f}{max(gaps):8.2f}" if gaps else f"{'-':>14}")
+        lines.append(f"{'TX' if direction == TX else 'RX':<4}{name:<14}{entry['frames']:>8}{entry['bytes']:>10}{timing}")
+    return '\n'.join(lines)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Summarise an MX11 traffic capture.')
+    parser.add_argument('capture', help='Capture file written by TrafficTracer.dump() or printer.py --trace.')
+    parser.add_argument('--frames', action='store_true', help='List every record as well.')
+    args = parser.parse_args()
+
+    wall_start, records = read_capture(args.capture)
+    print(f"Capture started {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(wall_start))}")
+    if args.frames:
+        for seconds, direction, length, data in records:
+            more = '...' if len(data) < length else ''
+            print(f"{seconds * 1000:12.3f} ms {'TX' if direction == TX else 'RX'} {length:5d} {data.hex()}{more}")
+    print(_format_summary(records))
+
+
+if __name__ == '__main__':
+    main()
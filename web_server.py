@@ -6,8 +6,12 @@ Simple web server for MX11 printer interface
 import asyncio
 import json
 import os
+import queue
 import tempfile
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import threading
 from mx11 import Printer
@@ -17,35 +21,244 @@ import logging
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+# How many finished jobs /queue keeps around for inspection
+JOB_HISTORY = 20
+# Minimum seconds between progress events for one job (the last row always goes out)
+PROGRESS_INTERVAL = 0.2
+# Seconds of silence before an idle /events stream gets a keep-alive comment
+EVENTS_KEEPALIVE = 15
+
+
+def parse_form(post_data):
+    """Splits a multipart body into (fields, image_data) (simplified parsing)."""
+    boundary = post_data.split(b'\r\n')[0]
+    parts = post_data.split(boundary)
+
+    fields = {}
+    image_data = None
+    for part in parts:
+        data_start = part.find(b'\r\n\r\n') + 4
+        if data_start <= 3:
+            continue
+        if b'filename=' in part and b'image' in part:
+            image_data = part[data_start:]
+            # Remove trailing boundary
+            if image_data.endswith(b'\r\n'):
+                image_data = image_data[:-2]
+        elif b'name="' in part:
+            name_start = part.find(b'name="') + 6
+            name = part[name_start:part.find(b'"', name_start)].decode('utf-8')
+            fields[name] = part[data_start:].decode('utf-8').strip()
+    return fields, image_data
+
+
+def render_preview(image_data, binarization):
+    """Dithers an uploaded image and returns it as PNG bytes. Runs in a worker process."""
+    import io
+    from image_convert import preprocess_image
+
+    processed_img = preprocess_image(io.BytesIO(image_data), width=384, dither=binarization)
+    out = io.BytesIO()
+    processed_img.save(out, 'PNG')
+    return out.getvalue()
+
+
+class EventHub:
+    """Fans server events out to every connected /events (Server-Sent Events) client."""
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=256)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.remove(subscriber)
+
+    def publish(self, event, data):
+        message = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8')
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # A stalled browser tab shouldn't hold up the printer worker
+                pass
+
+
+class PrintQueue:
+    """
+    Serializes all printer access onto one worker thread that owns an asyncio loop.
+    HTTP handler threads submit jobs and wait on the returned future, so status,
+    previews and queue inspection keep being served while a print is in flight.
+    """
+
+    def __init__(self, config_file='config.json', events=None):
+        self.config_file = config_file
+        self.events = events or EventHub()
+        self.printer = None
+        self.current = None
+        self.pending = deque()
+        self.history = deque(maxlen=JOB_HISTORY)
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._queue = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='printer-worker', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._ready.set()
+        self._loop.run_until_complete(self._worker())
+
+    def get_printer(self):
+        if not self.printer:
+            # Load config
+            try:
+                with open(self.config_file, 'r') as f:
+                    config = json.load(f)
+                mac_address = config.get('mac_address', 'CA:06:26:70:8B:06')
+                self.printer = Printer(mac_address, log_level=logging.WARNING)
+            except Exception:
+                return None
+        return self.printer
+
+    def submit(self, kind, action):
+        """
+        Queues `action(printer)` (a coroutine function) to run inside a connect/disconnect
+        session. Returns a concurrent.futures.Future with the action's result.
+        """
+        future = Future()
+        with self._lock:
+            job = {'id': self._next_id, 'kind': kind, 'state': 'queued', 'submitted': time.time()}
+            self._next_id += 1
+            self.pending.append(job)
+        self.events.publish('job', job)
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (job, action, future))
+        return future
+
+    def busy(self):
+        """Returns the job currently holding the printer, or None."""
+        with self._lock:
+            return self._public(self.current) if self.current else None
+
+    def report_progress(self, progress):
+        """on_progress hook for Printer.print_image; publishes throttled progress events."""
+        job = self.current
+        if not job:
+            return
+        now = time.monotonic()
+        last = job.get('_last_progress', 0)
+        if now - last < PROGRESS_INTERVAL and progress.rows_encoded < progress.rows_total:
+            return
+        job['_last_progress'] = now
+        self.events.publish('progress', {'id': job['id'], 'kind': job['kind'], **progress.as_dict()})
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'current': self._public(self.current) if self.current else None,
+                'pending': [self._public(job) for job in self.pending],
+                'history': [self._public(job) for job in self.history],
+            }
+
+    async def _worker(self):
+        while True:
+            job, action, future = await self._queue.get()
+            with self._lock:
+                self.pending.remove(job)
+                job['state'] = 'running'
+                job['started'] = time.time()
+                self.current = job
+            self.events.publish('job', self._public(job))
+            self.events.publish('status', self._status(job))
+            try:
+                result = await self._execute(action)
+            except Exception as e:
+                job['state'] = 'failed'
+                job['error'] = str(e)
+                future.set_exception(e)
+            else:
+                job['state'] = 'done'
+                if hasattr(result, 'as_dict'):
+                    # e.g. EncodeStats from a print job
+                    job['result'] = result.as_dict()
+                future.set_result(result)
+            with self._lock:
+                job['finished'] = time.time()
+                self.current = None
+                self.history.append(job)
+            self.events.publish('job', self._public(job))
+            self.events.publish('status', self._status(job))
+
+    @staticmethod
+    def _public(job):
+        return {key: value for key, value in job.items() if not key.startswith('_')}
+
+    @staticmethod
+    def _status(job):
+        """The 'status' event for a job starting or ending, shaped like /status replies."""
+        name = f"{job['kind']} job #{job['id']}"
+        messages = {'running': f"Running {name}", 'done': f"Finished {name}",
+                    'failed': f"{name} failed: {job.get('error')}"}
+        return {'success': job['state'] != 'failed', 'busy': job['state'] == 'running',
+                'id': job['id'], 'kind': job['kind'], 'message': messages[job['state']]}
+
+    async def _execute(self, action):
+        printer = self.get_printer()
+        if not printer:
+            raise RuntimeError('Printer not configured')
+        await printer.connect()
+        try:
+            return await action(printer)
+        finally:
+            await printer.disconnect()
+
+
 class PrinterHandler(BaseHTTPRequestHandler):
-    printer = None
-    
+    queue = None
+    previews = None
+
     def do_GET(self):
         if self.path == '/':
             self.serve_file('web_interface.html', 'text/html')
+        elif self.path == '/queue':
+            self.send_json({'success': True, **self.queue.snapshot()})
+        elif self.path == '/events':
+            self.stream_events()
         else:
             self.send_error(404)
-    
+
     def do_POST(self):
-        content_length = int(self.headers['Content-Length'])
-        
         if self.path == '/status':
-            asyncio.run(self.handle_status())
+            self.handle_status()
         elif self.path == '/serial':
-            asyncio.run(self.handle_serial())
+            self.handle_serial()
+        elif self.path == '/device-info':
+            self.handle_device_info()
         elif self.path == '/preview-image':
-            asyncio.run(self.handle_preview_image())
+            self.handle_preview_image()
         elif self.path == '/print-image':
-            asyncio.run(self.handle_print_image())
+            self.handle_print_image()
         elif self.path == '/print-text':
-            asyncio.run(self.handle_print_text())
+            self.handle_print_text()
         elif self.path == '/feed':
-            asyncio.run(self.handle_feed())
+            self.handle_feed()
         elif self.path == '/calibrate':
-            asyncio.run(self.handle_calibrate())
+            self.handle_calibrate()
         else:
             self.send_error(404)
-    
+
     def serve_file(self, filename, content_type):
         try:
             with open(filename, 'r', encoding='utf-8') as f:
@@ -57,226 +270,211 @@ class PrinterHandler(BaseHTTPRequestHandler):
             self.wfile.write(content.encode('utf-8'))
         except FileNotFoundError:
             self.send_error(404)
-    
+
     def send_json(self, data):
         self.send_response(200)
         self.send_header('Content-type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
         self.wfile.write(json.dumps(data).encode('utf-8'))
-    
-    async def get_printer(self):
-        if not self.printer:
-            # Load config
-            try:
-                with open('config.json', 'r') as f:
-                    config = json.load(f)
-                mac_address = config.get('mac_address', 'CA:06:26:70:8B:06')
-                self.printer = Printer(mac_address, log_level=logging.WARNING)
-            except:
-                return None
-        return self.printer
-    
-    async def handle_status(self):
-        printer = await self.get_printer()
-        if not printer:
-            self.send_json({'success': False, 'message': 'Printer not configured'})
+
+    def stream_events(self):
+        """Holds the connection open and streams job, progress and status events."""
+        # Subscribed before the headers go out, so a client sees every event after them
+        events = self.queue.events
+        subscriber = events.subscribe()
+        try:
+            self.send_response(200)
+            self.send_header('Content-type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            current = self.queue.busy()
+            if current:
+                self.wfile.write(f"event: job\ndata: {json.dumps(current)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+            while True:
+                try:
+                    message = subscriber.get(timeout=EVENTS_KEEPALIVE)
+                except queue.Empty:
+                    message = b': keep-alive\n\n'
+                self.wfile.write(message)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            events.unsubscribe(subscriber)
+
+    def read_body(self):
+        content_length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(content_length)
+
+    def run_job(self, kind, action):
+        """Queues a printer job and blocks this handler thread until it finishes."""
+        return self.queue.submit(kind, action).result()
+
+    def handle_status(self):
+        self.read_body()
+        current = self.queue.busy()
+        if current:
+            # Don't wait behind a long print just to ask the printer how it is
+            self.send_json({'success': True, 'busy': True,
+                            'message': f"Printing ({current['kind']} job #{current['id']})"})
             return
-        
+
         try:
-            await printer.connect()
-            status = await printer.get_status()
-            await printer.disconnect()
-            
+            status = self.run_job('status', lambda printer: printer.get_status())
+
             if status:
-                self.send_json({'success': True, 'message': 'Printer is ready'})
+                result = {'success': True, 'message': 'Printer is ready'}
             else:
-                self.send_json({'success': False, 'message': 'Printer not ready or low battery'})
+                result = {'success': False, 'message': 'Printer not ready or low battery'}
         except Exception as e:
-            self.send_json({'success': False, 'message': f'Connection error: {str(e)}'})
-    
-    async def handle_serial(self):
-        printer = await self.get_printer()
-        if not printer:
-            self.send_json({'success': False, 'message': 'Printer not configured'})
-            return
-        
+            result = {'success': False, 'message': f'Connection error: {str(e)}'}
+        self.queue.events.publish('status', result)
+        self.send_json(result)
+
+    def handle_device_info(self):
+        self.read_body()
+        printer = self.queue.get_printer()
+        info = printer.cached_device_info() if printer else None
+        if info is None:
+            current = self.queue.busy()
+            if current:
+                self.send_json({'success': True, 'busy': True,
+                                'message': f"Printing ({current['kind']} job #{current['id']})"})
+                return
+            try:
+                info = self.run_job('device_info', lambda printer: printer.get_device_info())
+            except Exception as e:
+                self.send_json({'success': False, 'message': f'Connection error: {str(e)}'})
+                return
+        self.send_json({'success': True, 'info': info.as_dict()})
+
+    def handle_serial(self):
+        self.read_body()
         try:
-            await printer.connect()
-            serial = await printer.get_serial_number()
-            await printer.disconnect()
-            
+            serial = self.run_job('serial', lambda printer: printer.get_serial_number())
+
             self.send_json({'success': True, 'serial': serial})
         except Exception as e:
             self.send_json({'success': False, 'message': f'Error: {str(e)}'})
-    
-    async def handle_preview_image(self):
+
+    def handle_preview_image(self):
         # Parse multipart form data to get image and binarization method
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
-        
+        post_data = self.read_body()
+
         try:
             import base64
-            from image_convert import preprocess_image
-            
-            # Extract image file and binarization method (simplified parsing)
-            boundary = post_data.split(b'\r\n')[0]
-            parts = post_data.split(boundary)
-            
-            image_data = None
-            binarization = 'atkinson'  # default
-            
-            for part in parts:
-                if b'name="binarization"' in part:
-                    # Extract binarization method
-                    data_start = part.find(b'\r\n\r\n') + 4
-                    if data_start > 3:
-                        binarization = part[data_start:].decode('utf-8').strip()
-                elif b'filename=' in part and b'image' in part:
-                    # Extract image data
-                    data_start = part.find(b'\r\n\r\n') + 4
-                    if data_start > 3:
-                        image_data = part[data_start:]
-                        if image_data.endswith(b'\r\n'):
-                            image_data = image_data[:-2]
-            
+
+            fields, image_data = parse_form(post_data)
+            binarization = fields.get('binarization', 'auto')
+
             if not image_data:
                 self.send_json({'success': False, 'message': 'No image data found'})
                 return
-            
-            # Save uploaded image to temp file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp:
-                tmp.write(image_data)
-                tmp_path = tmp.name
-            
-            # Process image with selected binarization
-            processed_img = preprocess_image(tmp_path, width=384, dither=binarization)
-            
-            # Convert processed image to base64 for web display
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as preview_tmp:
-                processed_img.save(preview_tmp.name, 'PNG')
-                preview_path = preview_tmp.name
-            
-            with open(preview_path, 'rb') as f:
-                preview_data = base64.b64encode(f.read()).decode('utf-8')
-            
-            # Clean up temp files
-            os.unlink(tmp_path)
-            os.unlink(preview_path)
-            
+
+            # Dithering is pure-Python CPU work; keep it off the GIL the handlers share
+            png_data = self.previews.submit(render_preview, image_data, binarization).result()
+            preview_data = base64.b64encode(png_data).decode('utf-8')
+
             self.send_json({
-                'success': True, 
+                'success': True,
                 'preview': f'data:image/png;base64,{preview_data}',
                 'message': f'Preview generated with {binarization} dithering'
             })
-            
+
         except Exception as e:
             self.send_json({'success': False, 'message': f'Preview error: {str(e)}'})
 
-    async def handle_print_image(self):
+    def handle_print_image(self):
         # Parse multipart form data (simplified)
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
-        
-        # Extract image file and parameters (basic implementation)
-        # In production, use proper multipart parsing
+        post_data = self.read_body()
+
         try:
+            fields, image_data = parse_form(post_data)
+            if not image_data:
+                self.send_json({'success': False, 'message': 'No image data found'})
+                return
+            binarization = fields.get('binarization', 'auto')
+            feed = int(fields.get('feed', 15))
+
             # Save uploaded image to temp file
             with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp:
-                # Extract image data from multipart (simplified)
-                boundary = post_data.split(b'\r\n')[0]
-                parts = post_data.split(boundary)
-                
-                for part in parts:
-                    if b'filename=' in part and b'image' in part:
-                        # Find image data
-                        data_start = part.find(b'\r\n\r\n') + 4
-                        if data_start > 3:
-                            image_data = part[data_start:]
-                            # Remove trailing boundary
-                            if image_data.endswith(b'\r\n'):
-                                image_data = image_data[:-2]
-                            tmp.write(image_data)
-                            break
-                
+                tmp.write(image_data)
                 tmp_path = tmp.name
-            
+
             # Print the image
-            printer = await self.get_printer()
-            await printer.connect()
-            await printer.print_image(tmp_path, binarization='atkinson', extra_feed=15)
-            await printer.disconnect()
-            
-            # Clean up
-            os.unlink(tmp_path)
-            
+            try:
+                self.run_job('print-image', lambda printer: printer.print_image(
+                    tmp_path, binarization=binarization, extra_feed=feed,
+                    on_progress=self.queue.report_progress))
+            finally:
+                # Clean up
+                os.unlink(tmp_path)
+
             self.send_json({'success': True, 'message': 'Image printed successfully'})
-            
+
         except Exception as e:
             self.send_json({'success': False, 'message': f'Print error: {str(e)}'})
-    
-    async def handle_print_text(self):
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length).decode('utf-8')
+
+    def handle_print_text(self):
+        post_data = self.read_body().decode('utf-8')
         data = json.loads(post_data)
-        
+
         try:
             text = data.get('text', '')
             font_size = int(data.get('fontSize', 20))  # Convert to int
             feed = int(data.get('feed', 15))
-            
+
             # Convert text to image
             with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp:
                 img = text_to_image(text, font_size=font_size)  # Pass as int
                 img.save(tmp.name)
                 tmp_path = tmp.name
-            
+
             # Print the text image
-            printer = await self.get_printer()
-            await printer.connect()
-            await printer.print_image(tmp_path, binarization='atkinson', extra_feed=feed)
-            await printer.disconnect()
-            
-            # Clean up
-            os.unlink(tmp_path)
-            
+            try:
+                self.run_job('print-text', lambda printer: printer.print_image(
+                    tmp_path, binarization='auto', extra_feed=feed,
+                    on_progress=self.queue.report_progress))
+            finally:
+                # Clean up
+                os.unlink(tmp_path)
+
             self.send_json({'success': True, 'message': 'Text printed successfully'})
-            
+
         except Exception as e:
             self.send_json({'success': False, 'message': f'Print error: {str(e)}'})
-    
-    async def handle_feed(self):
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length).decode('utf-8')
+
+    def handle_feed(self):
+        post_data = self.read_body().decode('utf-8')
         data = json.loads(post_data)
-        
+
         try:
             amount = int(data.get('amount', 10))
-            
-            printer = await self.get_printer()
-            await printer.connect()
-            await printer.feed_paper(amount)
-            await printer.disconnect()
-            
+
+            self.run_job('feed', lambda printer: printer.feed_paper(amount))
+
             self.send_json({'success': True, 'message': f'Fed {amount} lines'})
-            
+
         except Exception as e:
             self.send_json({'success': False, 'message': f'Feed error: {str(e)}'})
-    
-    async def handle_calibrate(self):
+
+    def handle_calibrate(self):
+        self.read_body()
         try:
-            printer = await self.get_printer()
-            await printer.connect()
-            await printer.calibrate_label()
-            await printer.disconnect()
-            
+            self.run_job('calibrate', lambda printer: printer.calibrate_label())
+
             self.send_json({'success': True, 'message': 'Label calibration sent'})
-            
+
         except Exception as e:
             self.send_json({'success': False, 'message': f'Calibration error: {str(e)}'})
 
 def run_server():
-    server = HTTPServer(('localhost', 8080), PrinterHandler)
+    PrinterHandler.queue = PrintQueue()
+    PrinterHandler.previews = ProcessPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) - 1))
+    server = ThreadingHTTPServer(('localhost', 8080), PrinterHandler)
     print("MX11 Printer Web Interface running at http://localhost:8080")
     print("Press Ctrl+C to stop")
     try:
@@ -284,6 +482,9 @@ def run_server():
     except KeyboardInterrupt:
         print("\nShutting down server...")
         server.shutdown()
+    finally:
+        server.server_close()
+        PrinterHandler.previews.shutdown(cancel_futures=True)
 
 if __name__ == '__main__':
     run_server()